@@ -3,151 +3,21 @@
 يتضمن: معالجة اللغة الطبيعية، تحليل الأوامر، وتحويلها إلى مهام تنفيذية
 """
 
+import copy
+import hashlib
 import json
-import re
+import time
 from typing import Dict, List, Optional, Any
 from datetime import datetime
-from openai import OpenAI
 
 from config import settings
+from intent_matcher import IntentMatcher
+from llm_cache import cache_key, llm_cache
+from llm_client import LLMUnavailable, create_llm_client
+from singleflight import SingleFlight
 
-
-class AIEngine:
-    """محرك الذكاء الاصطناعي للمشروع"""
-
-    def __init__(self):
-        self.client = None
-        if settings.OPENAI_API_KEY:
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.model = settings.OPENAI_MODEL
-
-    def analyze_command(self, user_message: str, context: Optional[Dict] = None) -> Dict:
-        """
-        تحليل أمر المستخدم وتحويله إلى مهمة تنفيذية
-
-        Args:
-            user_message: نص الأمر من المستخدم
-            context: سياق المحادثة (اختياري)
-
-        Returns:
-            Dict: المهمة التنفيذية المحولة
-        """
-        # أولاً، حاول تحليل الأمر مباشرة
-        parsed_command = self._parse_command_directly(user_message)
-        if parsed_command:
-            return parsed_command
-
-        # إذا فشل التحليل المباشر، استخدم AI
-        if self.client:
-            return await self._analyze_with_ai(user_message, context)
-
-        # إذا لم يكن هناك AI، أعد خطأ
-        return {
-            "success": False,
-            "error": "تعذر تحليل الأمر. يرجى استخدام أوامر محددة."
-        }
-
-    def _parse_command_directly(self, message: str) -> Optional[Dict]:
-        """تحليل الأمر مباشرة باستخدام أنماط محددة"""
-        message = message.lower().strip()
-
-        # أنماط أوامر الملفات
-        file_patterns = {
-            r"(?:أعرض|عرض|list).*?(?:ملفات|files)": {
-                "action": "list_files",
-                "command_type": "file"
-            },
-            r"(?:أنشئ|إنشاء|create).*?(?:مجلد|folder)": {
-                "action": "create_folder",
-                "command_type": "file"
-            },
-            r"(?:حذف|delete).*?(?:ملف|file)": {
-                "action": "delete_file",
-                "command_type": "file"
-            },
-            r"(?:رفع|upload).*?(?:ملف)": {
-                "action": "upload_file",
-                "command_type": "file"
-            },
-            r"(?:تنزيل|download).*?(?:ملف)": {
-                "action": "download_file",
-                "command_type": "file"
-            },
-        }
-
-        # أنماط أوامر النظام
-        system_patterns = {
-            r"(?:حالة|status).*?(?:جهاز|phone|mobile)": {
-                "action": "device_status",
-                "command_type": "system"
-            },
-            r"(?:بطارية|battery)": {
-                "action": "battery_info",
-                "command_type": "system"
-            },
-            r"(?:تخزين|storage|memory)": {
-                "action": "storage_info",
-                "command_type": "system"
-            },
-            r"(?:شبكة|network|إنترنت)": {
-                "action": "network_info",
-                "command_type": "system"
-            },
-            r"(?:معلومات|info).*?(?:النظام|system)": {
-                "action": "system_info",
-                "command_type": "system"
-            },
-        }
-
-        # أنماط أوامر المهام
-        task_patterns = {
-            r"(?:مهام|tasks).*?(?:مجدولة|scheduled)": {
-                "action": "list_scheduled_tasks",
-                "command_type": "task"
-            },
-            r"(?:أنشئ|إنشاء).*?(?:مهمة|task)": {
-                "action": "create_task",
-                "command_type": "task"
-            },
-            r"(?:حذف|delete).*?(?:مهمة|task)": {
-                "action": "delete_task",
-                "command_type": "task"
-            },
-        }
-
-        # التحقق من الأنماط
-        all_patterns = {**file_patterns, **system_patterns, **task_patterns}
-
-        for pattern, result in all_patterns.items():
-            if re.search(pattern, message):
-                result_copy = result.copy()
-                # استخراج المعلمات من الرسالة
-                params = self._extract_parameters(message)
-                result_copy["parameters"] = params
-                result_copy["success"] = True
-                return result_copy
-
-        return None
-
-    def _extract_parameters(self, message: str) -> Dict[str, Any]:
-        """استخراج المعلمات من رسالة المستخدم"""
-        params = {}
-
-        # استخراج مسار الملف
-        path_match = re.search(r"(?:في|to|from|/)\s*([/\w\s]+)", message)
-        if path_match:
-            params["path"] = path_match.group(1).strip()
-
-        # استخراج اسم الملف أو المجلد
-        name_match = re.search(r"(?:اسم|name)\s*[:\-]?\s*(\w+)", message)
-        if name_match:
-            params["name"] = name_match.group(1)
-
-        return params
-
-    async def _analyze_with_ai(self, user_message: str, context: Optional[Dict] = None) -> Dict:
-        """تحليل الأمر باستخدام OpenAI"""
-        system_prompt = """أنت مساعد ذكي يتحكم في هاتف Android. مهمتك هي تحويل أوامر المستخدم إلى مهام تنفيذية JSON.
+# تعليمات تحليل الأوامر (بصمتها جزء من مفتاح llm_cache)
+COMMAND_PROMPT = """أنت مساعد ذكي يتحكم في هاتف Android. مهمتك هي تحويل أوامر المستخدم إلى مهام تنفيذية JSON.
 
 الأوامر المدعومة:
 
@@ -186,18 +56,120 @@ class AIEngine:
   "error": "سبب_الخطأ"
 }"""
 
+
+def _create_classifier():
+    """مصنف النوايا المحلي حسب الإعدادات (NumPy اختيارية)"""
+    if not settings.AI_CLASSIFIER_ENABLED:
+        return None
+
+    try:
+        from intent_classifier import IntentClassifier
+    except ImportError:
+        print("⚠️ NumPy غير مثبتة: مصنف النوايا المحلي معطل")
+        return None
+
+    return IntentClassifier(
+        threshold=settings.AI_CLASSIFIER_THRESHOLD,
+        margin=settings.AI_CLASSIFIER_MARGIN
+    )
+
+
+class AIEngine:
+    """محرك الذكاء الاصطناعي للمشروع"""
+
+    def __init__(self):
+        # عميل غير حاجز بحد تزامن ومهلة وقاطع دائرة (None بدون مفتاح)
+        self.client = create_llm_client()
+        self.model = settings.OPENAI_MODEL
+        self.cache = llm_cache if settings.LLM_CACHE_ENABLED else None
+        # الطلبات المتطابقة المتزامنة تنتظر استدعاءً واحداً للنموذج
+        self.flights = SingleFlight(failure_ttl=settings.AI_SINGLEFLIGHT_FAILURE_TTL)
+        # أنماط الأوامر المباشرة تُجمع مرة واحدة عند الإنشاء
+        self.intent_matcher = IntentMatcher()
+        # مصنف محلي بين التحليل المباشر والنموذج (None إذا عُطل أو لم تتوفر NumPy)
+        self.classifier = _create_classifier()
+
+    async def analyze_command(self, user_message: str, context: Optional[Dict] = None) -> Dict:
+        """
+        تحليل أمر المستخدم وتحويله إلى مهمة تنفيذية
+
+        Args:
+            user_message: نص الأمر من المستخدم
+            context: سياق المحادثة (اختياري)
+
+        Returns:
+            Dict: المهمة التنفيذية المحولة
+        """
+        # أولاً، حاول تحليل الأمر مباشرة
+        parsed_command = self._parse_command_directly(user_message)
+        if parsed_command:
+            return parsed_command
+
+        # ثانياً، المصنف المحلي إذا كان واثقاً من النية
+        classified = self._classify_locally(user_message)
+        if classified:
+            return classified
+
+        # إذا فشل التحليل المباشر، استخدم AI
+        if self.client:
+            try:
+                # المفتاح نفسه مفتاح llm_cache: الصياغات المتطابقة بعد التطبيع تُدمج
+                key = ("command", cache_key(self.model, COMMAND_PROMPT, user_message))
+                result = await self.flights.do(key, lambda: self._analyze_with_ai(user_message, context))
+                return copy.deepcopy(result)
+            except LLMUnavailable:
+                # المزود معطل: نكتفي بالتحليل المباشر بدلاً من انتظار المهلات
+                return {
+                    "success": False,
+                    "error": "خدمة AI غير متاحة مؤقتاً. يرجى استخدام أوامر محددة."
+                }
+
+        # إذا لم يكن هناك AI، أعد خطأ
+        return {
+            "success": False,
+            "error": "تعذر تحليل الأمر. يرجى استخدام أوامر محددة."
+        }
+
+    def _parse_command_directly(self, message: str) -> Optional[Dict]:
+        """تحليل الأمر مباشرة باستخدام أنماط محددة (مطابق مجمع مسبقاً)"""
+        return self.intent_matcher.match(message.lower().strip())
+
+    def _classify_locally(self, message: str) -> Optional[Dict]:
+        """تصنيف الأمر بالمصنف المحلي (None عند انخفاض الثقة فيُصعّد للنموذج)"""
+        if self.classifier is None:
+            return None
+
+        classified = self.classifier.classify(message)
+        if classified is None:
+            return None
+
+        action, command_type, confidence = classified
+        return {
+            "action": action,
+            "command_type": command_type,
+            "parameters": self.intent_matcher.parameters(message.lower().strip()),
+            "success": True,
+            "confidence": round(confidence, 3)
+        }
+
+    async def _analyze_with_ai(self, user_message: str, context: Optional[Dict] = None) -> Dict:
+        """تحليل الأمر باستخدام OpenAI (النتائج الناجحة تُحفظ في llm_cache)"""
+        if self.cache is not None:
+            cached = await self.cache.get(self.model, COMMAND_PROMPT, user_message)
+            if cached is not None:
+                return cached
+
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
+            started = time.perf_counter()
+            result_text, tokens = await self.client.complete_with_usage(
+                [
+                    {"role": "system", "content": COMMAND_PROMPT},
                     {"role": "user", "content": user_message}
                 ],
                 temperature=0.3,
                 max_tokens=500
             )
-
-            result_text = response.choices[0].message.content.strip()
+            result_text = result_text.strip()
 
             # استخراج JSON من النتيجة
             if "```json" in result_text:
@@ -206,15 +178,22 @@ class AIEngine:
                 result_text = result_text.split("```")[1].split("```")[0]
 
             result = json.loads(result_text)
+            if self.cache is not None and isinstance(result, dict) and result.get("success") is True:
+                await self.cache.put(
+                    self.model, COMMAND_PROMPT, user_message, result,
+                    time.perf_counter() - started, tokens
+                )
             return result
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             return {
                 "success": False,
                 "error": f"خطأ في تحليل الأمر: {str(e)}"
             }
 
-    def analyze_data(self, data: str, data_type: str = "text") -> Dict:
+    async def analyze_data(self, data: str, data_type: str = "text") -> Dict:
         """تحليل البيانات باستخدام AI
 
         Args:
@@ -230,6 +209,22 @@ class AIEngine:
                 "error": "خدمة AI غير متاحة"
             }
 
+        # النموذج يرى أول 2000 حرف فقط، فهي التي تحدد تطابق الطلبات
+        digest = hashlib.sha256(data[:2000].encode()).hexdigest()
+        try:
+            result = await self.flights.do(
+                ("data", self.model, data_type, digest),
+                lambda: self._analyze_data(data, data_type)
+            )
+        except LLMUnavailable as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        return copy.deepcopy(result)
+
+    async def _analyze_data(self, data: str, data_type: str) -> Dict:
+        """استدعاء النموذج لتحليل البيانات (عبر analyze_data)"""
         prompts = {
             "text": "حلل النص التالي وأعط ملخصاً وأفكاراً رئيسية:",
             "csv": "حلل بيانات CSV التالية وأعط إحصائيات وأفكار:",
@@ -237,9 +232,8 @@ class AIEngine:
         }
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            result = await self.client.complete(
+                [
                     {"role": "system", "content": "أنت محلل بيانات متخصص. أجب بالعربية."},
                     {"role": "user", "content": f"{prompts.get(data_type, prompts['text'])}\n\n{data[:2000]}"}
                 ],
@@ -249,15 +243,32 @@ class AIEngine:
 
             return {
                 "success": True,
-                "result": response.choices[0].message.content
+                "result": result
             }
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
 
+    def stats(self) -> Dict:
+        stats = self.client.stats() if self.client else {"enabled": False}
+        stats["single_flight"] = self.flights.stats()
+        if self.classifier is not None:
+            stats["classifier"] = self.classifier.stats()
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
+        if self.cache is not None:
+            await self.cache.close()
+
     def suggest_actions(self, context: Dict) -> List[str]:
         """اقتراح إجراءات للمستخدم بناءً على السياق"""
         suggestions = []
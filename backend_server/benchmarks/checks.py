@@ -0,0 +1,188 @@
+"""
+أدوات فحوص السلوك في سكربتات القياس
+المستودع بلا مشغل اختبارات، فالفحوص دوال async مسماة يشغلها السكربت نفسه.
+check لا تعتمد على assert (تُحذف مع python -O)، و run_checks تعيد عدد الفحوص
+الفاشلة ليخرج السكربت برمز غير صفري
+"""
+
+import asyncio
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Iterable
+
+
+class CheckFailed(Exception):
+    """فشل فحص سلوك"""
+
+
+def check(condition, message: str):
+    """إفشال الفحص الحالي إذا لم يتحقق الشرط"""
+    if not condition:
+        raise CheckFailed(message)
+
+
+async def run_checks(checks: Iterable[Callable[..., Awaitable[None]]], *fixtures: Any) -> int:
+    """تشغيل الفحوص بالترتيب وطباعة نتيجة كل منها، وإرجاع عدد الفاشلة
+
+    fixtures تُمرر لكل فحص (مثل خادم وهمي مشترك ومعاملات سطر الأوامر)
+    """
+    failures = 0
+    for fn in checks:
+        name = fn.__name__
+        try:
+            await fn(*fixtures)
+        except CheckFailed as e:
+            failures += 1
+            print(f"FAIL {name}: {e}")
+        except Exception:
+            failures += 1
+            print(f"FAIL {name}: unexpected error")
+            traceback.print_exc()
+        else:
+            print(f"ok   {name}")
+    return failures
+
+
+class FakeRedis:
+    """بديل Redis في الذاكرة بنفس واجهة redis.asyncio التي يستخدمها الخادم
+
+    مفاتيح بمهلة (GET و SETEX و DELETE)، وقوائم مع BLMOVE، و PUBLISH و SUBSCRIBE،
+    و pipeline. down=True يحاكي تعطل Redis فتفشل كل الأوامر
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.lists = {}
+        self.subscribers = []
+        self.down = False
+        self._pushed = asyncio.Event()
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("redis is down")
+
+    async def get(self, key):
+        self._check()
+        entry = self.data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    async def setex(self, key, ttl, value):
+        self._check()
+        self.data[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, key):
+        self._check()
+        self.data.pop(key, None)
+
+    async def lpush(self, key, *values):
+        self._check()
+        items = self.lists.setdefault(key, [])
+        for value in values:
+            items.insert(0, str(value))
+        self._pushed.set()
+        self._pushed = asyncio.Event()
+        return len(items)
+
+    async def lmove(self, source, destination, src="LEFT", dest="RIGHT"):
+        self._check()
+        items = self.lists.get(source)
+        if not items:
+            return None
+        value = items.pop() if src == "RIGHT" else items.pop(0)
+        target = self.lists.setdefault(destination, [])
+        if dest == "LEFT":
+            target.insert(0, value)
+        else:
+            target.append(value)
+        return value
+
+    async def blmove(self, first_list, second_list, timeout, src="LEFT", dest="RIGHT"):
+        deadline = time.monotonic() + timeout
+        while True:
+            value = await self.lmove(first_list, second_list, src, dest)
+            remaining = deadline - time.monotonic()
+            if value is not None or remaining <= 0:
+                return value
+            try:
+                await asyncio.wait_for(self._pushed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def lrem(self, key, count, value):
+        self._check()
+        items = self.lists.get(key, [])
+        removed = items.count(str(value))
+        items[:] = [item for item in items if item != str(value)]
+        return removed
+
+    async def expire(self, key, seconds):
+        self._check()
+        return key in self.lists or key in self.data
+
+    async def publish(self, channel, message):
+        self._check()
+        receivers = [sub for sub in self.subscribers if sub.channel == channel]
+        for sub in receivers:
+            sub.queue.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(receivers)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def drop_subscribers(self):
+        """محاكاة انقطاع اتصالات الاشتراك"""
+        for sub in list(self.subscribers):
+            sub.queue.put_nowait(ConnectionError("connection lost"))
+        self.subscribers.clear()
+
+    async def close(self):
+        pass
+
+
+class FakePipeline:
+    """تجميع الأوامر وتنفيذها بالترتيب عند execute"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.channel = None
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.redis._check()
+        self.channel = channel
+        self.redis.subscribers.append(self)
+        self.queue.put_nowait({"type": "subscribe", "channel": channel, "data": 1})
+
+    async def listen(self):
+        while True:
+            message = await self.queue.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+    async def aclose(self):
+        if self in self.redis.subscribers:
+            self.redis.subscribers.remove(self)
@@ -0,0 +1,201 @@
+"""
+فحص تسليم الأوامر عبر طابور Redis بين العمليات (البث و take و ack والتعافي) وقياس زمن التسليم
+
+الاستخدام:
+    python benchmarks/command_queue.py --commands 2000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checks import FakeRedis, check, run_checks  # noqa: E402
+from command_notifier import CommandNotifier  # noqa: E402
+from command_queue import RedisCommandQueue  # noqa: E402
+
+
+def make_workers(redis: FakeRedis, count: int):
+    """عمال بسجل إشعارات مستقل لكل منهم، فلا يستيقظ منتظر إلا عبر Redis"""
+    workers = [RedisCommandQueue(redis, notifier=CommandNotifier()) for _ in range(count)]
+    for queue in workers:
+        queue._subscriber.retry_delay = 0.01
+        queue.start()
+    return workers
+
+
+async def wait_live(workers, timeout: float = 1.0):
+    deadline = time.monotonic() + timeout
+    while not all(queue._subscriber.live for queue in workers):
+        check(time.monotonic() < deadline, "subscription did not become live")
+        await asyncio.sleep(0.005)
+
+
+async def close(workers):
+    for queue in workers:
+        await queue.close()
+
+
+async def check_every_waiter_wakes():
+    publisher, *receivers = workers = make_workers(FakeRedis(), 3)
+    await wait_live(workers)
+
+    waiting = [
+        asyncio.create_task(queue.wait("phone", 1))
+        for queue in receivers for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    await publisher.publish("phone", 1)
+    woken = await asyncio.gather(*waiting)
+    check(all(woken), f"only {sum(woken)} of {len(woken)} waiters woke up")
+    await close(workers)
+
+
+async def check_take_delivers_once():
+    redis = FakeRedis()
+    publisher, *consumers = workers = make_workers(redis, 3)
+    await wait_live(workers)
+
+    taking = [asyncio.create_task(queue.take("phone", 10, 0.2)) for queue in consumers]
+    await asyncio.sleep(0)
+    await publisher.publish("phone", 7)
+    taken = await asyncio.gather(*taking)
+    check(sorted(taken, key=str) == [None, [7]], f"command taken as {taken}")
+    check(redis.lists["commands:phone:taken"] == ["7"], f"{redis.lists}")
+    await close(workers)
+
+
+async def check_take_batches_in_order():
+    redis = FakeRedis()
+    publisher, consumer = workers = make_workers(redis, 2)
+    await wait_live(workers)
+
+    for command_id in (1, 2, 3):
+        await publisher.publish("phone", command_id)
+    check(await consumer.take("phone", 2, 0.1) == [1, 2], "first batch is not [1, 2]")
+    check(await consumer.take("phone", 2, 0.1) == [3], "second batch is not [3]")
+    check(await consumer.take("phone", 2, 0.05) is None, "empty queue returned commands")
+    await close(workers)
+
+
+async def check_ack_removes_command():
+    redis = FakeRedis()
+    publisher, consumer = workers = make_workers(redis, 2)
+    await wait_live(workers)
+
+    await publisher.publish("phone", 1)
+    await publisher.publish("phone", 2)
+    check(await consumer.take("phone", 1, 0.1) == [1], "command 1 was not taken")
+
+    # 1 مسحوب ونتيجته وصلت، و 2 حُجز من قاعدة البيانات مباشرة وهو لا يزال في القائمة
+    await consumer.ack("phone", [1, 2])
+    check(not redis.lists["commands:phone"], f"ready list not empty: {redis.lists}")
+    check(not redis.lists["commands:phone:taken"], f"taken list not empty: {redis.lists}")
+    await close(workers)
+
+
+async def check_timeout_without_commands():
+    workers = make_workers(FakeRedis(), 2)
+    await wait_live(workers)
+
+    check(not await workers[1].wait("phone", 0.05), "waiter woke up without a command")
+
+    # أمر لجهاز آخر لا يوقظ هذا المنتظر
+    waiting = asyncio.create_task(workers[1].wait("phone", 0.1))
+    await asyncio.sleep(0)
+    await workers[0].publish("tablet", 1)
+    check(not await waiting, "waiter woke up for another device's command")
+    await close(workers)
+
+
+async def check_redis_down_falls_back_in_process():
+    redis = FakeRedis()
+    workers = make_workers(redis, 2)
+    await wait_live(workers)
+
+    redis.down = True
+    waiting = asyncio.create_task(workers[0].wait("phone", 1))
+    taking = asyncio.create_task(workers[0].take("phone", 10, 1))
+    await asyncio.sleep(0)
+    await workers[0].publish("phone", 1)
+    check(await waiting, "in-process fallback was not woken")
+    # take يعود بـ None ليفحص المستدعي قاعدة البيانات
+    check(await taking is None, "take did not fall back to a database scan")
+    check(workers[0].counters["redis_errors"] == 2, f"{workers[0].stats()}")
+    redis.down = False
+    await close(workers)
+
+
+async def check_resubscribe_wakes_waiters():
+    redis = FakeRedis()
+    workers = make_workers(redis, 2)
+    await wait_live(workers)
+
+    waiting = asyncio.create_task(workers[1].wait("phone", 1))
+    await asyncio.sleep(0)
+
+    # الأمر يُنشر أثناء انقطاع الاشتراك فلا يصل رسالته للعامل 1
+    redis.drop_subscribers()
+    await asyncio.sleep(0)
+    await workers[0].publish("phone", 1)
+    check(not waiting.done(), "waiter woke up while the subscription was down")
+
+    check(await waiting, "waiter was not woken after resubscribing")
+    await close(workers)
+
+
+async def benchmark(args):
+    """زمن التسليم من النشر في عامل حتى سحب الأمر في عامل آخر"""
+    publisher, waiter = workers = make_workers(FakeRedis(), 2)
+    await wait_live(workers)
+    latencies = []
+    missed = 0
+
+    for n in range(args.commands):
+        taking = asyncio.create_task(waiter.take("phone", 1, 5))
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        await publisher.publish("phone", n)
+        taken = await taking
+        latencies.append(time.perf_counter() - started)
+        missed += taken != [n]
+        await waiter.ack("phone", [n])
+
+    latencies.sort()
+    print(f"{args.commands} commands: median delivery "
+          f"{statistics.median(latencies) * 1e6:.0f} µs, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f} µs, missed {missed}")
+    print(f"publisher: {publisher.stats()}")
+    print(f"waiter:    {waiter.stats()}")
+    await close(workers)
+    return missed
+
+
+async def run(args) -> int:
+    failures = await run_checks([
+        check_every_waiter_wakes,
+        check_take_delivers_once,
+        check_take_batches_in_order,
+        check_ack_removes_command,
+        check_timeout_without_commands,
+        check_redis_down_falls_back_in_process,
+        check_resubscribe_wakes_waiters,
+    ])
+    missed = await benchmark(args)
+    if missed:
+        print(f"FAIL benchmark: {missed} commands were not delivered")
+    return failures + bool(missed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس وفحص وصول الأوامر عبر الطابور")
+    parser.add_argument("--commands", type=int, default=2000)
+    sys.exit(1 if asyncio.run(run(parser.parse_args())) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+قياس مصنف النوايا المحلي
+
+يقيّم المصنف على عبارات غير موجودة في أمثلة التدريب (بالعربية والإنجليزية ولهجات):
+- الدقة على الرسائل التي يجيب عنها، ونسبة ما يُصعّد لنموذج اللغة
+- رفض الرسائل خارج نطاق الأوامر (يجب أن تُصعّد لا أن تُصنف خطأ)
+- زمن التصنيف لكل رسالة وزمن التدريب
+ثم يعرض الدقة ونسبة التصعيد لعدة عتبات لاختيار AI_CLASSIFIER_THRESHOLD.
+
+الاستخدام:
+    python benchmarks/intent_classifier.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_classifier import IntentClassifier  # noqa: E402
+
+# عبارات اختبار لم يرها المصنف
+HELD_OUT = {
+    "list_files": (
+        "ورني شو في مجلد التنزيلات", "ابغى اشوف ملفاتي", "ايش الملفات اللي في الصور",
+        "show me the files in documents", "what do i have in downloads", "list everything in dcim",
+    ),
+    "create_folder": (
+        "سوي لي مجلد جديد اسمه شغل", "ابي مجلد جديد للفواتير", "create folder for invoices",
+        "make a directory named music",
+    ),
+    "delete_file": (
+        "امسح ملف التقرير", "احذف الصوره هذي", "delete report.pdf please", "remove the old backup file",
+    ),
+    "upload_file": (
+        "ارسل لي ملف الفاتورة", "ابعث الصورة على التليجرام", "send me the pdf from my phone",
+        "upload the backup to the server",
+    ),
+    "download_file": (
+        "نزل هذا الملف على جوالي", "حط الملف في الهاتف", "download this to my phone",
+        "save the attachment on the device",
+    ),
+    "device_status": (
+        "كيف وضع جوالي", "عطني حالة الهاتف", "how's the phone", "give me a status of the device",
+    ),
+    "battery_info": (
+        "كم باقي بطارية", "الجوال يشحن؟", "what's the battery at", "battery?", "how much battery do i have",
+    ),
+    "storage_info": (
+        "كم باقي مساحة في الجوال", "الذاكره فاضيه؟", "how much storage do i have left", "is the disk full",
+    ),
+    "network_info": (
+        "النت شغال؟", "كم سرعة الانترنت عندي", "is wifi on", "what network am i on", "check internet connection",
+    ),
+    "list_scheduled_tasks": (
+        "وش المهام اللي مجدولة", "اعرض لي التذكيرات", "what's scheduled", "show scheduled jobs",
+    ),
+    "create_task": (
+        "ذكرني بالدواء كل يوم الساعة ٩", "جدول نسخ احتياطي كل ليلة", "remind me to call mom at 5",
+        "schedule a backup every night",
+    ),
+    "delete_task": (
+        "الغ التذكير اليومي", "وقف المهمة المجدولة", "cancel my reminder", "delete the nightly job",
+    ),
+}
+
+# رسائل خارج نطاق الأوامر: يجب ألا يدعي المصنف فهمها
+OUT_OF_DOMAIN = (
+    "مرحبا كيف حالك", "شكرا جزيلا", "من انت", "اكتب لي قصيدة عن البحر", "ما عاصمة فرنسا",
+    "hello", "thanks!", "who are you", "tell me a joke", "what is the capital of france",
+    "translate this to english", "؟", "ok", "لا", "😀",
+)
+
+
+def evaluate(classifier: IntentClassifier):
+    answered = correct = 0
+    wrong = []
+    for action, phrases in HELD_OUT.items():
+        for phrase in phrases:
+            result = classifier.classify(phrase)
+            if result is not None:
+                answered += 1
+                if result[0] == action:
+                    correct += 1
+                else:
+                    wrong.append((phrase, action, result[0], round(result[2], 3)))
+    false_positives = [(m, classifier.classify(m)) for m in OUT_OF_DOMAIN if classifier.classify(m)]
+    return answered, correct, wrong, false_positives
+
+
+def run(args):
+    started = time.perf_counter()
+    classifier = IntentClassifier(threshold=args.threshold, margin=args.margin)
+    trained = time.perf_counter() - started
+
+    total = sum(len(phrases) for phrases in HELD_OUT.values())
+    answered, correct, wrong, false_positives = evaluate(classifier)
+    print(f"trained on {len(classifier.actions)} intents in {trained * 1000:.1f} ms "
+          f"({len(classifier.vocabulary)} n-grams)")
+    print(f"held-out: answered {answered}/{total} locally ({answered / total:.0%}), "
+          f"precision {correct / max(answered, 1):.1%}, escalated {total - answered}")
+    for phrase, expected, got, score in wrong:
+        print(f"  wrong: {phrase!r} -> {got} (expected {expected}, {score})")
+    print(f"out-of-domain: {len(false_positives)}/{len(OUT_OF_DOMAIN)} wrongly classified {false_positives}")
+
+    messages = [phrase for phrases in HELD_OUT.values() for phrase in phrases] + list(OUT_OF_DOMAIN)
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for message in messages:
+            classifier.classify(message)
+    elapsed = (time.perf_counter() - started) / (args.rounds * len(messages))
+    print(f"inference: {elapsed * 1e6:.1f} µs/message")
+
+    print("threshold sweep (margin fixed):")
+    for threshold in (0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5):
+        classifier.threshold = threshold
+        answered, correct, _, false_positives = evaluate(classifier)
+        print(f"  {threshold:.2f}: answered {answered / total:.0%}, "
+              f"precision {correct / max(answered, 1):.1%}, out-of-domain accepted {len(false_positives)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس مصنف النوايا المحلي")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--margin", type=float, default=0.05)
+    parser.add_argument("--rounds", type=int, default=200)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+قياس مطابق النوايا مقابل التحليل المباشر السابق
+
+يشغّل نفس مجموعة الرسائل على:
+- legacy_parse: نسخة من AIEngine._parse_command_directly السابقة (قواميس تُبنى لكل رسالة،
+  حتى 13 استدعاء re.search ثم تعبيرين لاستخراج المعلمات)
+- IntentMatcher.match: تعبير واحد مجمع مسبقاً في مرور واحد
+ويتحقق من تطابق النتائج (الإجراء والمعلمات) لكل رسالة قبل القياس.
+
+الاستخدام:
+    python benchmarks/intent_matcher.py --messages 20000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_matcher import IntentMatcher  # noqa: E402
+
+SAMPLES = (
+    "أعرض الملفات في /sdcard/Download",
+    "list files in /storage/emulated/0",
+    "أنشئ مجلد باسم Backup في /sdcard",
+    "create folder name: photos to /sdcard/DCIM",
+    "حذف ملف اسم report في Documents",
+    "delete file from /sdcard/tmp",
+    "رفع ملف من /sdcard/Music",
+    "upload ملف to server",
+    "تنزيل ملف اسم-data",
+    "ما حالة الجهاز؟",
+    "status of my phone",
+    "كم نسبة البطارية",
+    "battery",
+    "كم مساحة التخزين المتبقية",
+    "show memory usage",
+    "هل الشبكة متصلة",
+    "network info please",
+    "أعطني معلومات النظام",
+    "system info",
+    "info about the system",
+    "أعرض المهام المجدولة",
+    "tasks scheduled for today",
+    "إنشاء مهمة يومية",
+    "أنشئ مهمة name nightly",
+    "حذف مهمة رقم 3",
+    "delete task 7",
+    "files list",
+    "مرحبا كيف حالك",
+    "hello there, how are you doing today?",
+    "ذكرني غداً بالاجتماع",
+    "/",
+    "",
+    "   ",
+    "حذف\nملف",
+    "storage to from name : x",
+)
+
+
+def legacy_parse(message: str) -> Optional[Dict]:
+    """نسخة من التحليل المباشر قبل المطابق المجمع (للمقارنة فقط)"""
+    message = message.lower().strip()
+
+    file_patterns = {
+        r"(?:أعرض|عرض|list).*?(?:ملفات|files)": {"action": "list_files", "command_type": "file"},
+        r"(?:أنشئ|إنشاء|create).*?(?:مجلد|folder)": {"action": "create_folder", "command_type": "file"},
+        r"(?:حذف|delete).*?(?:ملف|file)": {"action": "delete_file", "command_type": "file"},
+        r"(?:رفع|upload).*?(?:ملف)": {"action": "upload_file", "command_type": "file"},
+        r"(?:تنزيل|download).*?(?:ملف)": {"action": "download_file", "command_type": "file"},
+    }
+    system_patterns = {
+        r"(?:حالة|status).*?(?:جهاز|phone|mobile)": {"action": "device_status", "command_type": "system"},
+        r"(?:بطارية|battery)": {"action": "battery_info", "command_type": "system"},
+        r"(?:تخزين|storage|memory)": {"action": "storage_info", "command_type": "system"},
+        r"(?:شبكة|network|إنترنت)": {"action": "network_info", "command_type": "system"},
+        r"(?:معلومات|info).*?(?:النظام|system)": {"action": "system_info", "command_type": "system"},
+    }
+    task_patterns = {
+        r"(?:مهام|tasks).*?(?:مجدولة|scheduled)": {"action": "list_scheduled_tasks", "command_type": "task"},
+        r"(?:أنشئ|إنشاء).*?(?:مهمة|task)": {"action": "create_task", "command_type": "task"},
+        r"(?:حذف|delete).*?(?:مهمة|task)": {"action": "delete_task", "command_type": "task"},
+    }
+
+    all_patterns = {**file_patterns, **system_patterns, **task_patterns}
+    for pattern, result in all_patterns.items():
+        if re.search(pattern, message):
+            result_copy = result.copy()
+            params = {}
+            path_match = re.search(r"(?:في|to|from|/)\s*([/\w\s]+)", message)
+            if path_match:
+                params["path"] = path_match.group(1).strip()
+            name_match = re.search(r"(?:اسم|name)\s*[:\-]?\s*(\w+)", message)
+            if name_match:
+                params["name"] = name_match.group(1)
+            result_copy["parameters"] = params
+            result_copy["success"] = True
+            return result_copy
+
+    return None
+
+
+def compiled_parse(matcher: IntentMatcher, message: str) -> Optional[Dict]:
+    """نفس مسار AIEngine._parse_command_directly الحالي"""
+    return matcher.match(message.lower().strip())
+
+
+def run(args):
+    random.seed(args.seed)
+    matcher = IntentMatcher()
+
+    for message in SAMPLES:
+        expected = legacy_parse(message)
+        actual = compiled_parse(matcher, message)
+        assert actual == expected, (message, actual, expected)
+    print(f"verified {len(SAMPLES)} sample messages against the legacy parser")
+
+    # رسائل عشوائية من كلمات العينات لتغطية ترتيبات لم تُكتب يدوياً
+    words = " ".join(SAMPLES).split() + ["\n"]
+    fuzz = [" ".join(random.choices(words, k=random.randint(1, 8))) for _ in range(args.fuzz)]
+    for message in fuzz:
+        assert compiled_parse(matcher, message) == legacy_parse(message), message
+    print(f"verified {args.fuzz} random messages against the legacy parser")
+
+    messages = [random.choice(SAMPLES) for _ in range(args.messages)]
+
+    started = time.perf_counter()
+    for message in messages:
+        legacy_parse(message)
+    legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for message in messages:
+        compiled_parse(matcher, message)
+    compiled = time.perf_counter() - started
+
+    print(f"legacy:   {legacy / args.messages * 1e6:.2f} µs/message")
+    print(f"compiled: {compiled / args.messages * 1e6:.2f} µs/message ({legacy / compiled:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس مطابق النوايا مقابل التحليل المباشر السابق")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--fuzz", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+قياس ذاكرة نتائج تحليل الأوامر بنموذج اللغة
+
+يرسل رسائل بتوزيع Zipf (قلة من الصياغات تتكرر كثيراً) مع اختلافات شكلية
+(تشكيل، مسافات، أحرف كبيرة، علامات ترقيم) إلى محرك بعميل نموذج وهمي بزمن ثابت، ويقيس:
+- نسبة الإصابة والزمن والرموز الموفرة
+- كلفة البحث في الطبقة المحلية وطبقة SQLite
+- بقاء النتائج بعد "إعادة التشغيل" (ذاكرة جديدة على نفس الملف)
+- حد الحجم في SQLite وعدم حفظ التحليلات الفاشلة
+
+الاستخدام:
+    python benchmarks/llm_cache.py --messages 2000 --phrases 300
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_engine import COMMAND_PROMPT, AIEngine  # noqa: E402
+from llm_cache import LLMCache, normalize_message  # noqa: E402
+
+TOKENS_PER_CALL = 420
+
+
+class FakeLLM:
+    """عميل نموذج بزمن ثابت يعد الاستدعاءات (بدل LLMClient)"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def complete_with_usage(self, messages, temperature, max_tokens):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        message = messages[-1]["content"]
+        if "؟؟" in message:
+            return json.dumps({"success": False, "error": "غير مفهوم"}), TOKENS_PER_CALL
+        return json.dumps({
+            "success": True, "command_type": "task", "action": "create_task",
+            "parameters": {"note": normalize_message(message)}
+        }), TOKENS_PER_CALL
+
+    async def close(self):
+        pass
+
+
+def variant(phrase: str) -> str:
+    """نفس الصياغة باختلاف شكلي يزيله التطبيع"""
+    choice = random.random()
+    if choice < 0.2:
+        return phrase.upper()
+    if choice < 0.4:
+        return "  " + phrase.replace(" ", "   ") + " "
+    if choice < 0.5:
+        return phrase + "؟"
+    if choice < 0.6:
+        return phrase.replace("ر", "رَ").replace("ا", "ـا")
+    return phrase
+
+
+def make_engine(cache: LLMCache, latency: float) -> AIEngine:
+    engine = AIEngine()
+    # كل رسالة تُصعّد للنموذج حتى تُقاس الذاكرة وحدها
+    engine.classifier = None
+    engine.client = FakeLLM(latency)
+    engine.cache = cache
+    return engine
+
+
+async def run(args):
+    random.seed(args.seed)
+    phrases = [f"ذكرني بموعد رقم {i} مع report {i % 7}" for i in range(args.phrases)]
+    weights = [1 / (rank + 1) for rank in range(args.phrases)]
+    messages = [variant(p) for p in random.choices(phrases, weights, k=args.messages)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_cache.db")
+
+        # بدون ذاكرة
+        baseline = make_engine(None, args.latency)
+        started = time.perf_counter()
+        for message in messages[:200]:
+            await baseline.analyze_command(message)
+        uncached = (time.perf_counter() - started) / 200
+
+        # مع الذاكرة
+        cache = LLMCache(max_size=args.local_size, ttl=3600, path=path, db_ttl=86400, db_max_rows=args.db_rows)
+        engine = make_engine(cache, args.latency)
+        started = time.perf_counter()
+        for message in messages:
+            result = await engine.analyze_command(message)
+            assert result["success"], result
+        cached = (time.perf_counter() - started) / len(messages)
+        stats = cache.stats()
+
+        print(f"{len(messages)} messages over {args.phrases} phrasings (Zipf), LLM latency {args.latency * 1000:.0f} ms")
+        print(f"hit rate: {stats['hit_rate']:.1%} (local {stats['local_hits']}, sqlite {stats['db_hits']}, "
+              f"misses {stats['misses']}), LLM calls {engine.client.calls}")
+        print(f"mean latency: {uncached * 1000:.1f} ms uncached -> {cached * 1000:.1f} ms cached")
+        print(f"saved: {stats['saved_seconds']:.1f} s of LLM time, {stats['saved_tokens']} tokens")
+
+        # كلفة البحث: محلية ثم SQLite فقط
+        hot = messages[0]
+        started = time.perf_counter()
+        for _ in range(10000):
+            await cache.get(engine.model, COMMAND_PROMPT, hot)
+        local = (time.perf_counter() - started) / 10000
+        cache._local.clear()
+        started = time.perf_counter()
+        for phrase in phrases[:200]:
+            await cache.get(engine.model, COMMAND_PROMPT, phrase)
+            cache._local.clear()
+        disk = (time.perf_counter() - started) / 200
+        print(f"lookup: {local * 1e6:.1f} µs local, {disk * 1e6:.0f} µs sqlite")
+        await cache.close()
+
+        # إعادة التشغيل: ذاكرة محلية فارغة على نفس الملف
+        restarted = LLMCache(max_size=args.local_size, ttl=3600, path=path, db_ttl=86400, db_max_rows=args.db_rows)
+        engine = make_engine(restarted, args.latency)
+        for message in messages[:200]:
+            await engine.analyze_command(message)
+        print(f"after restart: {restarted.stats()['db_hits']} sqlite hits, "
+              f"{engine.client.calls} LLM calls for 200 messages")
+
+        # التحليل الفاشل لا يُحفظ
+        for _ in range(3):
+            await engine.analyze_command("شيء غريب ؟؟")
+        assert engine.client.calls >= 3 and restarted.stats()["misses"] >= 3
+
+        # حد الحجم في SQLite
+        for i in range(args.db_rows * 2):
+            await restarted.put(engine.model, COMMAND_PROMPT, f"رسالة {i}", {"success": True}, 0.1, 1)
+        await restarted.close()
+        rows = sqlite3.connect(path).execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        assert rows <= args.db_rows + 100, rows
+        print(f"size bound: {rows} rows kept (limit {args.db_rows}, pruned every 100 writes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس ذاكرة نتائج تحليل الأوامر")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--phrases", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--local-size", type=int, default=100)
+    parser.add_argument("--db-rows", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
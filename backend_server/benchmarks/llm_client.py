@@ -0,0 +1,278 @@
+"""
+فحص حد التزامن والمهلة وإعادة المحاولة وقاطع الدائرة في عميل نموذج اللغة مقابل خادم OpenAI وهمي
+
+الاستخدام:
+    python benchmarks/llm_client.py --requests 40 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_engine import AIEngine  # noqa: E402
+from checks import check, run_checks  # noqa: E402
+from llm_client import CircuitBreaker, LLMClient  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+
+# رسالة لا يفهمها التحليل المباشر فتذهب للنموذج
+AI_MESSAGE = "ذكرني بالاجتماع غداً"
+AI_REPLY = {"success": True, "command_type": "task", "action": "create_task", "parameters": {}}
+
+
+class FakeLLMServer:
+    """خادم HTTP صغير يرد بصيغة chat.completions"""
+
+    def __init__(self):
+        self.reset()
+        self.active = 0
+        self._server = None
+        self.port = 0
+
+    def reset(self):
+        """إعادة السلوك والعدادات لحالة سليمة قبل كل فحص"""
+        self.latency = 0.0
+        self.fail_next = 0
+        self.fail_status = 0
+        self.max_active = 0
+        self.hits = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+
+                self.hits += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                try:
+                    await asyncio.sleep(self.latency)
+                finally:
+                    self.active -= 1
+
+                if self.fail_next or self.fail_status:
+                    self.fail_next = max(0, self.fail_next - 1)
+                    status, body = "503 Service Unavailable", {"error": {"message": "overloaded"}}
+                else:
+                    status, body = "200 OK", {
+                        "id": "fake", "object": "chat.completion", "created": 0, "model": "fake",
+                        "choices": [{
+                            "index": 0, "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": json.dumps(AI_REPLY)}
+                        }]
+                    }
+
+                payload = json.dumps(body).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def heartbeat_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """أقصى تأخر لنبضة دورية (يكشف أي استدعاء حاجز لحلقة الأحداث)"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+def make_engine(server: FakeLLMServer, args, timeout: float, breaker: CircuitBreaker) -> AIEngine:
+    engine = AIEngine()
+    # كل طلب متتابع يجب أن يصل للخادم الوهمي (بلا ذاكرة ولا مصنف محلي ولا مشاركة للفشل)
+    engine.cache = None
+    engine.classifier = None
+    engine.flights = SingleFlight()
+    engine.client = LLMClient(
+        api_key="test",
+        model="fake",
+        base_url=f"http://127.0.0.1:{server.port}/v1",
+        max_concurrency=args.concurrency,
+        timeout=timeout,
+        max_retries=2,
+        retry_base_delay=0.05,
+        breaker=breaker
+    )
+    return engine
+
+
+async def check_concurrency_and_non_blocking(server: FakeLLMServer, args):
+    engine = make_engine(server, args, timeout=5, breaker=CircuitBreaker(3, args.reset))
+    try:
+        # الطلب الأول يهيئ اتصال httpx (مرة واحدة) فلا يدخل في القياس
+        await engine.analyze_command(AI_MESSAGE)
+
+        server.latency, server.max_active = args.latency, 0
+        stop = asyncio.Event()
+        lag = asyncio.create_task(heartbeat_lag(stop))
+        started = time.perf_counter()
+        # رسائل مختلفة حتى لا تُدمج الطلبات المتطابقة
+        results = await asyncio.gather(
+            *(engine.analyze_command(f"{AI_MESSAGE} {i}") for i in range(args.requests))
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        worst_lag = await lag
+    finally:
+        await engine.close()
+
+    check(all(result == AI_REPLY for result in results), f"unexpected reply: {results[0]}")
+    check(server.max_active <= args.concurrency,
+          f"server saw {server.max_active} concurrent requests, limit is {args.concurrency}")
+    check(server.max_active == min(args.concurrency, args.requests),
+          f"requests were not sent concurrently (max {server.max_active})")
+    # استدعاء حاجز كان سيؤخر النبضة بقدر زمن رد النموذج كاملاً
+    check(worst_lag < args.latency / 2, f"event loop blocked for {worst_lag * 1000:.0f} ms")
+
+    expected = args.requests / args.concurrency * args.latency
+    print(f"     {args.requests} requests, limit {args.concurrency}: {elapsed:.2f}s "
+          f"(ideal {expected:.2f}s), server saw at most {server.max_active} concurrent, "
+          f"worst heartbeat lag {worst_lag * 1000:.1f} ms")
+
+
+async def check_timeout_per_attempt(server: FakeLLMServer, args):
+    # خادم بطيء يُقطع بعد timeout لكل محاولة
+    engine = make_engine(server, args, timeout=0.2, breaker=CircuitBreaker(100, args.reset))
+    server.latency = 1.0
+    try:
+        started = time.perf_counter()
+        result = await engine.analyze_command(AI_MESSAGE)
+        elapsed = time.perf_counter() - started
+    finally:
+        await engine.close()
+
+    check(not result["success"], f"slow provider should fail: {result}")
+    check(server.hits == 3, f"expected 3 attempts, server saw {server.hits}")
+    check(engine.client.counters["timeouts"] == 3, f"counters: {engine.client.counters}")
+    check(elapsed < server.latency, f"gave up after {elapsed:.2f}s, longer than one slow reply")
+    print(f"     3 attempts of 0.2s gave up after {elapsed:.2f}s")
+
+
+async def check_retries_after_transient_errors(server: FakeLLMServer, args):
+    # خطآن 503 ثم نجاح
+    engine = make_engine(server, args, timeout=5, breaker=CircuitBreaker(3, args.reset))
+    server.fail_next = 2
+    try:
+        result = await engine.analyze_command(AI_MESSAGE)
+    finally:
+        await engine.close()
+
+    check(result == AI_REPLY, f"expected success after retries: {result}")
+    check(server.hits == 3, f"expected 3 attempts, server saw {server.hits}")
+    check(engine.client.counters["retries"] == 2, f"counters: {engine.client.counters}")
+
+
+async def open_breaker(engine: AIEngine, server: FakeLLMServer):
+    """تعطيل المزود حتى يفتح القاطع (3 استدعاءات فاشلة)"""
+    server.fail_status = 503
+    for _ in range(3):
+        result = await engine.analyze_command(AI_MESSAGE)
+        check(not result["success"], f"failing provider returned success: {result}")
+    check(engine.client.breaker.state == "open",
+          f"breaker is {engine.client.breaker.state} after 3 failed calls")
+
+
+async def check_breaker_opens_and_degrades(server: FakeLLMServer, args):
+    engine = make_engine(server, args, timeout=5, breaker=CircuitBreaker(3, args.reset))
+    try:
+        await open_breaker(engine, server)
+        hits = server.hits
+
+        started = time.perf_counter()
+        for _ in range(100):
+            result = await engine.analyze_command(AI_MESSAGE)
+            check(not result["success"], f"open breaker returned success: {result}")
+        degraded = (time.perf_counter() - started) / 100
+        direct = await engine.analyze_command("أعرض الملفات في /sdcard")
+    finally:
+        await engine.close()
+
+    check(server.hits == hits, f"open breaker sent {server.hits - hits} requests upstream")
+    check(direct.get("action") == "list_files", f"direct parser did not answer: {direct}")
+    print(f"     open after {hits} upstream attempts, degraded reply in {degraded * 1e6:.0f} µs")
+
+
+async def check_breaker_recovers(server: FakeLLMServer, args):
+    # بعد reset_timeout يمر طلب تجريبي واحد ويغلق القاطع
+    engine = make_engine(server, args, timeout=5, breaker=CircuitBreaker(3, args.reset))
+    try:
+        await open_breaker(engine, server)
+        server.fail_status = 0
+        await asyncio.sleep(args.reset)
+        check(engine.client.breaker.state == "half_open",
+              f"breaker is {engine.client.breaker.state} after the reset timeout")
+
+        result = await engine.analyze_command(AI_MESSAGE)
+        stats = engine.stats()["breaker"]
+    finally:
+        await engine.close()
+
+    check(result == AI_REPLY, f"probe request failed: {result}")
+    check(engine.client.breaker.state == "closed",
+          f"breaker is {engine.client.breaker.state} after a successful probe")
+    print(f"     closed again after a successful probe {stats}")
+
+
+CHECKS = [
+    check_concurrency_and_non_blocking,
+    check_timeout_per_attempt,
+    check_retries_after_transient_errors,
+    check_breaker_opens_and_degrades,
+    check_breaker_recovers,
+]
+
+
+async def run(args) -> int:
+    server = FakeLLMServer()
+    await server.start()
+    try:
+        failures = 0
+        for fn in CHECKS:
+            server.reset()
+            failures += await run_checks([fn], server, args)
+        return failures
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="فحص عميل نموذج اللغة مقابل خادم وهمي محلي")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--reset", type=float, default=0.5)
+    sys.exit(1 if asyncio.run(run(parser.parse_args())) else 0)
+
+
+if __name__ == "__main__":
+    main()
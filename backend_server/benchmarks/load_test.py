@@ -0,0 +1,129 @@
+"""
+اختبار حمل لزمن استجابة القراءة أثناء ضغط الكتابة
+
+يقيس p50/p95/p99 لطلبات القراءة مرتين: بدون كتابة، ثم مع عمال يكتبون
+أوامر ونتائج باستمرار. إذا كانت قاعدة البيانات لا تحجب حلقة الأحداث
+فيجب أن يبقى p99 للقراءة ثابتاً تقريباً في المرحلتين.
+
+الاستخدام (والخادم يعمل بنفس ملف .env):
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --duration 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import SessionLocal, User, Device, init_db  # noqa: E402
+
+TELEGRAM_ID = 900000001
+DEVICE_ID = "load-test-device"
+
+
+def seed():
+    """إنشاء مستخدم وجهاز الاختبار إن لم يكونا موجودين"""
+    init_db()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.telegram_id == TELEGRAM_ID).first()
+        if not user:
+            user = User(telegram_id=TELEGRAM_ID, username="load-test")
+            db.add(user)
+            db.commit()
+
+        if not db.query(Device).filter(Device.device_id == DEVICE_ID).first():
+            db.add(Device(user_id=user.id, device_id=DEVICE_ID, device_name="load-test"))
+            db.commit()
+    finally:
+        db.close()
+
+
+async def reader(client: httpx.AsyncClient, stop_at: float, latencies: list):
+    """طلبات قراءة متتالية مع تسجيل زمن كل طلب"""
+    paths = [
+        ("/api/v1/devices", {"telegram_id": TELEGRAM_ID}),
+        (f"/api/v1/stats/{DEVICE_ID}", None),
+        ("/api/v1/commands/pending", {"device_id": DEVICE_ID}),
+    ]
+    i = 0
+    while time.perf_counter() < stop_at:
+        path, params = paths[i % len(paths)]
+        started = time.perf_counter()
+        await client.get(path, params=params)
+        latencies.append(time.perf_counter() - started)
+        i += 1
+
+
+async def writer(client: httpx.AsyncClient, stop_at: float, counter: list):
+    """إنشاء أوامر وتقديم نتائجها باستمرار"""
+    while time.perf_counter() < stop_at:
+        response = await client.post(
+            "/api/v1/commands/execute",
+            params={"telegram_id": TELEGRAM_ID, "device_id": DEVICE_ID},
+            json={"command_type": "system", "action": "battery_info"}
+        )
+        command_id = response.json().get("command_id")
+        if command_id:
+            await client.post(
+                "/api/v1/commands/results",
+                json=[{"command_id": command_id, "status": "completed", "result": {}}]
+            )
+        await client.post("/api/v1/devices/heartbeat", params={"device_id": DEVICE_ID})
+        counter[0] += 1
+
+
+async def run_phase(url: str, duration: float, readers: int, writers: int) -> dict:
+    """تشغيل مرحلة واحدة وإرجاع إحصائيات زمن القراءة"""
+    latencies: list = []
+    writes = [0]
+    limits = httpx.Limits(max_connections=readers + writers)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        stop_at = time.perf_counter() + duration
+        await asyncio.gather(
+            *(reader(client, stop_at, latencies) for _ in range(readers)),
+            *(writer(client, stop_at, writes) for _ in range(writers)),
+        )
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "reads": len(latencies),
+        "writes": writes[0],
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "mean": statistics.fmean(latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="اختبار حمل القراءة أثناء الكتابة")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--readers", type=int, default=20)
+    parser.add_argument("--writers", type=int, default=20)
+    args = parser.parse_args()
+
+    seed()
+
+    print(f"{'phase':<14}{'reads':>8}{'writes':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, writers in (("reads only", 0), ("reads+writes", args.writers)):
+        result = asyncio.run(run_phase(args.url, args.duration, args.readers, writers))
+        print(
+            f"{name:<14}{result['reads']:>8}{result['writes']:>8}"
+            f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
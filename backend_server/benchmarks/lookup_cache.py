@@ -0,0 +1,179 @@
+"""
+فحص وصول الإبطال بين عمليتين تتشاركان Redis وقياس نسبة إصابة الذاكرة المؤقتة دون قراءات قديمة
+
+الاستخدام:
+    python benchmarks/lookup_cache.py --lookups 100000 --users 2000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checks import FakeRedis, check, run_checks  # noqa: E402
+from lookup_cache import LookupCache  # noqa: E402
+
+
+class Database:
+    """مصدر الحقيقة مع عداد قراءات لكل عملية"""
+
+    def __init__(self, users: int):
+        self.rows = {i: {"id": i, "telegram_id": i, "username": f"user{i}"} for i in range(users)}
+        self.reads = [0, 0]
+
+    def loader(self, worker: int, telegram_id: int):
+        async def load():
+            self.reads[worker] += 1
+            row = self.rows.get(telegram_id)
+            return dict(row) if row else None
+        return load
+
+
+def make_workers(redis: FakeRedis, cache_size: int = 1000):
+    workers = [
+        LookupCache(max_size=cache_size, ttl=30, redis_ttl=300, redis_client=redis)
+        for _ in range(2)
+    ]
+    for cache in workers:
+        cache._subscriber.retry_delay = 0.01
+    return workers
+
+
+async def settle():
+    """إتاحة الفرصة لمهام الاشتراك لاستلام الرسائل المنشورة"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def wait_live(workers, timeout: float = 1.0):
+    deadline = time.monotonic() + timeout
+    while not all(cache.local_enabled for cache in workers):
+        check(time.monotonic() < deadline, "subscription did not become live")
+        await asyncio.sleep(0.005)
+
+
+async def close(workers):
+    for cache in workers:
+        await cache.close()
+
+
+async def check_invalidation_reaches_other_worker():
+    db = Database(10)
+    workers = make_workers(FakeRedis())
+    for cache in workers:
+        cache.start()
+    await wait_live(workers)
+
+    await workers[1].get("user", 0, db.loader(1, 0))
+    await workers[1].get("user", 0, db.loader(1, 0))
+    check(workers[1].counters["local_hits"] == 1, "second read should be a local hit")
+
+    # مسار الربط ينفذ في العملية 0 فقط
+    db.rows[0]["username"] = "fresh"
+    await workers[0].invalidate("user", 0)
+    await settle()
+
+    value = await workers[1].get("user", 0, db.loader(1, 0))
+    check(value["username"] == "fresh", f"worker 1 read a stale value: {value}")
+    check(db.reads[1] == 2, f"worker 1 should reload from the database, reads={db.reads[1]}")
+    await close(workers)
+
+
+async def check_local_tier_bypassed_until_subscribed():
+    db = Database(10)
+    cache = make_workers(FakeRedis())[0]
+
+    for _ in range(3):
+        await cache.get("user", 1, db.loader(0, 1))
+    check(cache.counters["local_hits"] == 0, "local tier used without a live subscription")
+    check(cache.counters["redis_hits"] == 2, f"expected redis hits, got {cache.counters}")
+
+    cache.start()
+    await wait_live([cache])
+    await cache.get("user", 1, db.loader(0, 1))
+    await cache.get("user", 1, db.loader(0, 1))
+    check(cache.counters["local_hits"] == 1, "local tier unused after subscribing")
+    await cache.close()
+
+
+async def check_resubscribe_clears_local():
+    db = Database(10)
+    redis = FakeRedis()
+    workers = make_workers(redis)
+    for cache in workers:
+        cache.start()
+    await wait_live(workers)
+
+    await workers[1].get("user", 2, db.loader(1, 2))
+
+    # الإبطال يُنشر أثناء انقطاع اشتراك العملية 1 فلا يصلها
+    redis.drop_subscribers()
+    await settle()
+    db.rows[2]["username"] = "missed"
+    await workers[0].invalidate("user", 2)
+    check(not workers[1].local_enabled, "subscription should be down")
+
+    await wait_live(workers)
+    value = await workers[1].get("user", 2, db.loader(1, 2))
+    check(value["username"] == "missed", f"stale value after resubscribe: {value}")
+    await close(workers)
+
+
+async def benchmark(args):
+    """قراءات بتوزيع منحاز مع تعديلات من العملية التي تعالج الطلب فقط"""
+    db = Database(args.users)
+    workers = make_workers(FakeRedis(), args.cache_size)
+    for cache in workers:
+        cache.start()
+    await wait_live(workers)
+
+    stale = 0
+    started = time.perf_counter()
+    for n in range(args.lookups):
+        worker = n % 2
+        # قلة من المستخدمين النشطين يولدون معظم الطلبات
+        telegram_id = min(int(random.paretovariate(1.2)) - 1, args.users - 1)
+        value = await workers[worker].get("user", telegram_id, db.loader(worker, telegram_id))
+        stale += value["username"] != db.rows[telegram_id]["username"]
+
+        if n % args.invalidate_every == 0:
+            db.rows[telegram_id]["username"] = f"renamed{n}"
+            await workers[worker].invalidate("user", telegram_id)
+            await settle()
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.lookups} lookups in {elapsed * 1000:.0f} ms "
+          f"({elapsed / args.lookups * 1e6:.1f} µs/lookup), stale reads: {stale}")
+    for worker, cache in enumerate(workers):
+        print(f"worker {worker}: db reads={db.reads[worker]:>6}  {cache.stats()}")
+    await close(workers)
+    return stale
+
+
+async def run(args) -> int:
+    failures = await run_checks([
+        check_invalidation_reaches_other_worker,
+        check_local_tier_bypassed_until_subscribed,
+        check_resubscribe_clears_local,
+    ])
+    stale = await benchmark(args)
+    if stale:
+        print(f"FAIL benchmark: {stale} stale reads")
+    return failures + bool(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس وفحص الذاكرة المؤقتة للقراءات")
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--invalidate-every", type=int, default=1000)
+    sys.exit(1 if asyncio.run(run(parser.parse_args())) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+فحص خطط تنفيذ الاستعلامات الساخنة (EXPLAIN QUERY PLAN)
+
+يطبع خطة SQLite لكل استعلام ساخن ويفشل (رمز خروج 1) إذا كانت الخطة
+تمسح الجدول كاملاً أو تحتاج فرزاً مؤقتاً، لاكتشاف تراجع الفهارس.
+
+الاستخدام:
+    python benchmarks/query_plans.py
+"""
+
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import select, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import (  # noqa: E402
+    engine, init_db, Command, DeviceStats, DeviceStatsRollup, OperationLog, AuthToken
+)
+
+# أنماط تدل على عدم استخدام فهرس مناسب
+BAD_PLAN_MARKERS = ("USE TEMP B-TREE",)
+
+
+def hot_queries():
+    """الاستعلامات الساخنة كما تُنفذ في الخادم"""
+    return {
+        "commands pending (device_id, status)": (
+            select(Command)
+            .where(Command.device_id == 1, Command.status == "pending")
+            .order_by(Command.id)
+        ),
+        "commands lease reclaim (device_id, status)": (
+            select(Command.id)
+            .where(
+                Command.device_id == 1,
+                Command.status == "processing",
+                Command.lease_expires_at < datetime(2024, 1, 1)
+            )
+        ),
+        "device_stats latest (device_id, created_at)": (
+            select(DeviceStats)
+            .where(DeviceStats.device_id == "device")
+            .order_by(DeviceStats.created_at.desc())
+            .limit(1)
+        ),
+        "device_stats_rollups range (device_id, resolution, metric, bucket_start)": (
+            select(DeviceStatsRollup)
+            .where(
+                DeviceStatsRollup.device_id == "device",
+                DeviceStatsRollup.resolution == 3600,
+                DeviceStatsRollup.metric.in_(["battery_level", "cpu_usage"]),
+                DeviceStatsRollup.bucket_start >= datetime(2024, 1, 1),
+                DeviceStatsRollup.bucket_start < datetime(2024, 1, 31)
+            )
+            .order_by(DeviceStatsRollup.metric, DeviceStatsRollup.bucket_start)
+        ),
+        "operation_logs by user (user_id, created_at)": (
+            select(OperationLog)
+            .where(OperationLog.user_id == 1)
+            .order_by(OperationLog.created_at.desc())
+            .limit(50)
+        ),
+        "operation_logs keyset page (user_id, created_at, id)": (
+            select(OperationLog)
+            .where(
+                OperationLog.user_id == 1,
+                OperationLog.created_at <= datetime(2024, 1, 1)
+            )
+            .order_by(OperationLog.created_at.desc(), OperationLog.id.desc())
+            .limit(50)
+        ),
+        "operation_logs by type (user_id, operation_type, created_at)": (
+            select(OperationLog)
+            .where(OperationLog.user_id == 1, OperationLog.operation_type == "command")
+            .order_by(OperationLog.created_at.desc(), OperationLog.id.desc())
+            .limit(50)
+        ),
+        "auth_tokens unused (user_id, device_id, is_used)": (
+            select(AuthToken)
+            .where(
+                AuthToken.user_id == 1,
+                AuthToken.device_id == "device",
+                AuthToken.is_used == False  # noqa: E712
+            )
+        ),
+    }
+
+
+def is_bad_plan(detail: str) -> bool:
+    """هل سطر الخطة يشير إلى مسح كامل أو فرز مؤقت"""
+    if any(marker in detail for marker in BAD_PLAN_MARKERS):
+        return True
+    # SCAN بدون فهرس يعني مسح الجدول كاملاً
+    return detail.startswith("SCAN") and "USING" not in detail
+
+
+def main() -> int:
+    if engine.dialect.name != "sqlite":
+        print(f"EXPLAIN QUERY PLAN مدعوم لـ SQLite فقط (المشغل الحالي: {engine.dialect.name})")
+        return 0
+
+    init_db()
+    failures = 0
+
+    with engine.connect() as conn:
+        for name, query in hot_queries().items():
+            sql = str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+
+            bad = [row[-1] for row in plan if is_bad_plan(row[-1])]
+            failures += bool(bad)
+
+            print(f"{'FAIL' if bad else 'ok  '}  {name}")
+            for row in plan:
+                print(f"        {row[-1]}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+قياس حساب المواعيد التالية لتعابير الجدولة
+
+يولد عدداً كبيراً من المهام من مجموعة تعابير cron وفترات بمناطق زمنية مختلفة، ويقيس:
+- زمن الترجمة الأولى للتعابير (بدون ذاكرة مؤقتة)
+- زمن حساب next_run لكل المهام (مع الذاكرة المؤقتة كما في المنفذ)
+ثم يتحقق من صحة النتائج لعينة بمقارنتها بفحص الدقائق واحدة تلو الأخرى
+(في مناطق زمنية بلا توقيت صيفي حيث الدلالة واحدة).
+
+الاستخدام:
+    python benchmarks/schedule_expr.py --schedules 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_expr import compile_schedule, next_run_after  # noqa: E402
+
+ZONES = ("UTC", "Asia/Riyadh", "Europe/Berlin", "America/New_York", "Asia/Tokyo")
+FIXED_ZONES = ("UTC", "Asia/Riyadh", "Asia/Tokyo")
+
+
+def random_field(low: int, high: int) -> str:
+    kind = random.random()
+    if kind < 0.35:
+        return "*"
+    if kind < 0.55:
+        return f"*/{random.randint(2, max(2, (high - low) // 2))}"
+    if kind < 0.75:
+        start = random.randint(low, high)
+        return f"{start}-{random.randint(start, high)}"
+    if kind < 0.9:
+        return ",".join(str(v) for v in sorted(random.sample(range(low, high + 1), 3)))
+    return str(random.randint(low, high))
+
+
+def random_schedule(zones) -> tuple:
+    zone = random.choice(zones)
+    kind = random.random()
+    if kind < 0.7:
+        expression = " ".join((
+            random_field(0, 59), random_field(0, 23), random_field(1, 28),
+            random_field(1, 12), random_field(0, 6)
+        ))
+        return "cron", f"TZ={zone} {expression}"
+    if kind < 0.8:
+        return "daily", f"TZ={zone} {random.randint(0, 23):02d}:{random.randint(0, 59):02d}"
+    if kind < 0.85:
+        return "weekly", f"TZ={zone} {random.choice(('mon', 'wed', 'fri'))} 09:30"
+    if kind < 0.9:
+        return "hourly", f"TZ={zone} {random.randint(0, 59)}"
+    return "interval", str(random.choice((60, 300, 900, 3600, 86400)))
+
+
+def naive_next(schedule_type: str, schedule_value: str, after: datetime):
+    """المرجع البطيء: فحص كل دقيقة حتى يطابق التعبير (للتحقق فقط)"""
+    schedule = compile_schedule(schedule_type, schedule_value)
+    if not hasattr(schedule, "minutes"):
+        return schedule.next_after(after)
+
+    candidate = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    for _ in range(60 * 24 * 366 * 2):
+        local = candidate.replace(tzinfo=timezone.utc).astimezone(schedule.tz)
+        day_ok = schedule._day_mask(local.year, local.month) >> local.day & 1
+        if (day_ok and schedule.months >> local.month & 1
+                and schedule.hours >> local.hour & 1 and schedule.minutes >> local.minute & 1):
+            return candidate
+        candidate += timedelta(minutes=1)
+    return None
+
+
+def run(args):
+    random.seed(args.seed)
+    # المستخدمون يكررون نفس التعابير غالباً: المهام تُسحب من مجموعة تعابير محدودة
+    pool = [random_schedule(ZONES) for _ in range(args.distinct)]
+    schedules = [random.choice(pool) for _ in range(args.schedules)]
+    distinct = len(set(schedules))
+    after = datetime(2026, 10, 17, 12, 34, 56)
+
+    started = time.perf_counter()
+    for schedule in set(schedules):
+        compile_schedule(*schedule)
+    compile_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = [next_run_after(kind, value, after) for kind, value in schedules]
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.schedules} schedules ({distinct} distinct expressions)")
+    print(f"compile:  {compile_time * 1000:.0f} ms ({compile_time / distinct * 1e6:.1f} µs/expression)")
+    print(f"next_run: {elapsed * 1000:.0f} ms ({elapsed / args.schedules * 1e6:.2f} µs/schedule)")
+    print(f"cache:    {compile_schedule.cache_info()}")
+    assert all(result is None or result > after for result in results)
+
+    # التحقق مقابل فحص الدقائق لعينة من المناطق بلا توقيت صيفي
+    sample = [random_schedule(FIXED_ZONES) for _ in range(args.verify)]
+    naive_time = 0.0
+    for kind, value in sample:
+        start = after + timedelta(minutes=random.randint(0, 500000))
+        expected_started = time.perf_counter()
+        expected = naive_next(kind, value, start)
+        naive_time += time.perf_counter() - expected_started
+        actual = next_run_after(kind, value, start)
+        assert actual == expected, (kind, value, start, actual, expected)
+    print(f"verified {args.verify} schedules against minute scanning "
+          f"({naive_time / args.verify * 1e6:.0f} µs/schedule for the scan)")
+
+    # التوقيت الصيفي: وقت مكرر يُنفذ مرة، ووقت غير موجود يُنفذ بعد القفزة
+    berlin = "TZ=Europe/Berlin 30 2 * * *"
+    fall_back = next_run_after("cron", berlin, datetime(2026, 10, 24, 12))
+    assert fall_back == datetime(2026, 10, 25, 0, 30), fall_back
+    assert next_run_after("cron", berlin, fall_back) == datetime(2026, 10, 26, 1, 30)
+    assert next_run_after("cron", berlin, datetime(2026, 3, 28, 12)) == datetime(2026, 3, 29, 1, 30)
+    assert datetime(2026, 3, 29, 1, 30).replace(tzinfo=timezone.utc).astimezone(
+        ZoneInfo("Europe/Berlin")).hour == 3
+    # التعابير التي تعمل كل ساعة تستمر خلال الساعة المكررة
+    half_hourly, runs = "TZ=Europe/Berlin */30 * * * *", []
+    run_at = datetime(2026, 10, 24, 23, 50)
+    for _ in range(5):
+        run_at = next_run_after("cron", half_hourly, run_at)
+        runs.append(run_at)
+    assert all(b - a == timedelta(minutes=30) for a, b in zip(runs, runs[1:])), runs
+    print("DST transitions: ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس حساب مواعيد تعابير الجدولة")
+    parser.add_argument("--schedules", type=int, default=100000)
+    parser.add_argument("--distinct", type=int, default=2000)
+    parser.add_argument("--verify", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
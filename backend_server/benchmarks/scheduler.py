@@ -0,0 +1,88 @@
+"""
+قياس كلفة منفذ المهام المجدولة
+
+يجدول عدداً كبيراً من المهام في الكومة (بدون قاعدة بيانات) ويقيس:
+- زمن الجدولة وإعادة الجدولة والإلغاء لكل مهمة
+- زمن المعالج المستهلك أثناء الانتظار حتى أقرب موعد (يجب أن يكون قريباً من الصفر)
+- دقة الاستيقاظ عند حلول مواعيد متتالية
+
+الاستخدام:
+    python benchmarks/scheduler.py --tasks 10000 --idle 3
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import TaskScheduler  # noqa: E402
+
+
+class MeasuredScheduler(TaskScheduler):
+    """منفذ لا يكتب في قاعدة البيانات: يسجل تأخر الاستيقاظ فقط"""
+
+    def __init__(self):
+        super().__init__()
+        self.lateness = []
+
+    def _fire(self, due):
+        # يُستدعى في خيط قاعدة البيانات كما في الخادم، بدون كتابة أوامر
+        now = datetime.utcnow()
+        self.lateness.extend((now - run_at).total_seconds() for run_at in due.values())
+        return [(task_id, None, None, None) for task_id in due], 0
+
+
+async def run(args):
+    scheduler = MeasuredScheduler()
+    now = datetime.utcnow()
+
+    started = time.perf_counter()
+    for task_id in range(args.tasks):
+        scheduler.schedule(task_id, now + timedelta(hours=1, seconds=random.randint(0, 86400)))
+    elapsed = time.perf_counter() - started
+    print(f"schedule:   {elapsed / args.tasks * 1e6:.2f} µs/task ({args.tasks} tasks)")
+
+    started = time.perf_counter()
+    for task_id in range(0, args.tasks, 2):
+        scheduler.schedule(task_id, now + timedelta(hours=2, seconds=random.randint(0, 86400)))
+    for task_id in range(1, args.tasks, 4):
+        scheduler.cancel(task_id)
+    elapsed = time.perf_counter() - started
+    print(f"reschedule/cancel: {elapsed / (args.tasks * 3 // 4) * 1e6:.2f} µs/op")
+
+    scheduler.start()
+    await asyncio.sleep(0.1)
+
+    cpu = time.process_time()
+    await asyncio.sleep(args.idle)
+    cpu = time.process_time() - cpu
+    print(f"idle CPU:   {cpu * 1000:.1f} ms over {args.idle}s with {len(scheduler._scheduled)} schedules")
+
+    # مواعيد قريبة تُضاف أثناء الانتظار (يجب أن توقظ الحلقة مبكراً)
+    soon = datetime.utcnow()
+    for i in range(args.due):
+        scheduler.schedule(args.tasks + i, soon + timedelta(milliseconds=20 * i))
+    await asyncio.sleep(0.02 * args.due + 0.2)
+    await scheduler.stop()
+
+    lateness = sorted(scheduler.lateness)
+    assert len(lateness) == args.due, len(lateness)
+    print(f"wake-up lateness: median {lateness[len(lateness) // 2] * 1000:.1f} ms, "
+          f"max {lateness[-1] * 1000:.1f} ms ({args.due} due tasks)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس كلفة منفذ المهام المجدولة")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--idle", type=float, default=3)
+    parser.add_argument("--due", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
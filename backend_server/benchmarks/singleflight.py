@@ -0,0 +1,129 @@
+"""
+قياس دمج طلبات الذكاء الاصطناعي المتطابقة (single-flight)
+
+يحاكي زراً مشتركاً يرسل نفس النص من مئات المستخدمين في نفس اللحظة إلى محرك
+بعميل نموذج وهمي، ويتحقق من:
+- استدعاء واحد للنموذج لكل نص متطابق (بعد التطبيع) وزمن الانتظار للجميع
+- إلغاء أول طلب (أو أي منتظر) لا يلغي العمل على الباقين
+- الفشل يصل لكل المنتظرين، والموجة التالية خلال failure_ttl لا تعيد الاستدعاء
+- analyze_data يُدمج بنفس الطريقة
+
+الاستخدام:
+    python benchmarks/singleflight.py --users 500 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_engine import AIEngine  # noqa: E402
+from llm_client import LLMUnavailable  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+
+MESSAGE = "ذكرني بالاجتماع غداً"
+
+
+class FakeLLM:
+    """عميل نموذج بزمن ثابت يعد الاستدعاءات، ويمكن جعله يفشل"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.failing = False
+
+    async def complete_with_usage(self, messages, temperature, max_tokens):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.failing:
+            raise LLMUnavailable("تعذر الوصول لخدمة AI: 503")
+        return json.dumps({"success": True, "command_type": "task", "action": "create_task", "parameters": {}}), 300
+
+    async def complete(self, messages, temperature, max_tokens):
+        text, _ = await self.complete_with_usage(messages, temperature, max_tokens)
+        return text
+
+    async def close(self):
+        pass
+
+
+async def run(args):
+    engine = AIEngine()
+    engine.cache = None
+    engine.classifier = None
+    engine.client = FakeLLM(args.latency)
+    engine.flights = SingleFlight(failure_ttl=args.failure_ttl)
+
+    # موجة متطابقة (مع اختلافات شكلية يزيلها التطبيع)
+    variants = [MESSAGE, f"  {MESSAGE} ", MESSAGE + "؟"]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        engine.analyze_command(variants[i % len(variants)]) for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+    assert all(result["success"] for result in results)
+    assert engine.client.calls == 1, engine.client.calls
+    results[0]["action"] = "changed"
+    assert results[1]["action"] == "create_task", "كل منتظر يأخذ نسخته"
+    print(f"{args.users} identical requests: {engine.client.calls} LLM call, "
+          f"all answered in {elapsed * 1000:.0f} ms (LLM latency {args.latency * 1000:.0f} ms)")
+
+    # الإلغاء: أول طلب يُلغى أثناء الانتظار، والبقية تكمل
+    engine.client.calls = 0
+    first = asyncio.create_task(engine.analyze_command(MESSAGE))
+    await asyncio.sleep(0)
+    others = [asyncio.create_task(engine.analyze_command(MESSAGE)) for _ in range(50)]
+    await asyncio.sleep(args.latency / 2)
+    first.cancel()
+    others[0].cancel()
+    done = await asyncio.gather(*others[1:])
+    assert first.cancelled() and all(result["success"] for result in done)
+    assert engine.client.calls == 1
+    print("cancellation: leader and one waiter cancelled, 49 waiters still answered by the single call")
+
+    # الإلغاء الكامل: العمل يكتمل (ونتيجته تُحفظ في الذاكرة المؤقتة عادة)
+    engine.client.calls = 0
+    lone = asyncio.create_task(engine.analyze_command("رسالة أخرى تماماً"))
+    await asyncio.sleep(0)
+    lone.cancel()
+    await asyncio.sleep(args.latency * 1.5)
+    assert engine.flights.stats()["in_flight"] == 0 and engine.client.calls == 1
+    print("cancellation: work finishes even when every caller is gone, no task left behind")
+
+    # الفشل المشترك
+    engine.client.calls, engine.client.failing = 0, True
+    results = await asyncio.gather(*(engine.analyze_command(MESSAGE) for _ in range(args.users)))
+    assert all(not result["success"] for result in results) and engine.client.calls == 1
+    results = await asyncio.gather(*(engine.analyze_command(MESSAGE) for _ in range(args.users)))
+    assert engine.client.calls == 1, "الموجة التالية خلال failure_ttl تأخذ نفس الفشل"
+    print(f"failure: {args.users} waiters + a second wave of {args.users} within "
+          f"{args.failure_ttl}s shared 1 failing call")
+
+    engine.client.failing = False
+    await asyncio.sleep(args.failure_ttl)
+    result = await engine.analyze_command(MESSAGE)
+    assert result["success"] and engine.client.calls == 2
+    print("failure: retried once after failure_ttl and succeeded")
+
+    # analyze_data
+    engine.client.calls = 0
+    results = await asyncio.gather(*(engine.analyze_data("1,2,3\n4,5,6", "csv") for _ in range(args.users)))
+    assert all(result["success"] for result in results) and engine.client.calls == 1
+    print(f"analyze_data: {args.users} identical requests, {engine.client.calls} LLM call")
+    print(f"stats: {engine.flights.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس دمج طلبات الذكاء الاصطناعي المتطابقة")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--failure-ttl", type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
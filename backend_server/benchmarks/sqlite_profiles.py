@@ -0,0 +1,145 @@
+"""
+مقارنة ملفي التخزين (default و production) على حمل الاستطلاع وإشارات الحياة
+
+لكل ملف تُنشأ قاعدة بيانات مؤقتة، ثم تعمل خيوط تستطلع الأوامر المعلقة
+بالتوازي مع خيوط تنفذ مسار إشارة الحياة القديم (SELECT ثم UPDATE ثم commit)
+وتضيف أوامر جديدة. يُطبع معدل العمليات وزمن الاستطلاع وعدد أخطاء القفل.
+
+الاستخدام:
+    python benchmarks/sqlite_profiles.py --duration 10 --pollers 16 --writers 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, Command, Device, User, create_db_engine  # noqa: E402
+
+
+def seed(Session, devices: int):
+    """إنشاء مستخدم وعدد من الأجهزة مع بعض الأوامر المعلقة"""
+    db = Session()
+    try:
+        user = User(telegram_id=1, username="bench")
+        db.add(user)
+        db.flush()
+        for i in range(devices):
+            device = Device(user_id=user.id, device_id=f"bench-{i}")
+            db.add(device)
+            db.flush()
+            db.add(Command(user_id=user.id, device_id=device.id,
+                           command_type="system", action="battery_info"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def poller(Session, devices: int, stop_at: float, latencies: list, errors: list):
+    """استطلاع الأوامر المعلقة لأجهزة عشوائية"""
+    while time.perf_counter() < stop_at:
+        db = Session()
+        started = time.perf_counter()
+        try:
+            db.query(Command).filter(
+                Command.device_id == random.randint(1, devices),
+                Command.status == "pending"
+            ).all()
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors.append(1)
+        finally:
+            db.close()
+
+
+def writer(Session, devices: int, stop_at: float, counter: list, errors: list):
+    """مسار إشارة الحياة القديم مع إدراج أمر كل عشر عمليات"""
+    i = 0
+    while time.perf_counter() < stop_at:
+        db = Session()
+        try:
+            device_id = f"bench-{random.randrange(devices)}"
+            device = db.query(Device).filter(Device.device_id == device_id).first()
+            device.is_online = True
+            device.last_seen = datetime.utcnow()
+            if i % 10 == 0:
+                db.add(Command(user_id=1, device_id=device.id,
+                               command_type="system", action="battery_info"))
+            db.commit()
+            counter.append(1)
+        except OperationalError:
+            db.rollback()
+            errors.append(1)
+        finally:
+            db.close()
+        i += 1
+
+
+def run_profile(profile: str, args) -> dict:
+    """تشغيل الحمل على ملف تخزين واحد"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile)
+        Base.metadata.create_all(bind=db_engine)
+        Session = sessionmaker(bind=db_engine, autoflush=False)
+        seed(Session, args.devices)
+
+        latencies, writes, errors = [], [], []
+        stop_at = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=poller, args=(Session, args.devices, stop_at, latencies, errors))
+            for _ in range(args.pollers)
+        ] + [
+            threading.Thread(target=writer, args=(Session, args.devices, stop_at, writes, errors))
+            for _ in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        db_engine.dispose()
+
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return float("nan")
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "polls/s": len(latencies) / args.duration,
+        "heartbeats/s": len(writes) / args.duration,
+        "poll p50": pct(0.50),
+        "poll p99": pct(0.99),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة ملفات تخزين SQLite")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--pollers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12}{'polls/s':>10}{'hb/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for profile in ("default", "production"):
+        r = run_profile(profile, args)
+        print(
+            f"{profile:<12}{r['polls/s']:>10.0f}{r['heartbeats/s']:>10.0f}"
+            f"{r['poll p50']:>10.2f}{r['poll p99']:>10.2f}{r['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,11 @@
 
 import asyncio
 import io
-from typing import Dict, List, Optional
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+import httpx
 from telegram import (
     Update,
     InlineKeyboardButton,
@@ -15,6 +18,7 @@ from telegram import (
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove
 )
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -25,9 +29,13 @@ from telegram.ext import (
 )
 
 from config import settings, AVAILABLE_COMMANDS
-from models import User, Device, Command, SessionLocal
+from models import User, Device, Command, DeviceStats, StoredFile, SessionLocal, run_in_db_thread
+from file_storage import blob_store
 from security import AuthManager, verify_whitelist, log_operation
 from ai_engine import ai_engine
+from presence import presence
+from metrics_store import metrics_store, FIELDS, TEXT_FIELDS
+from lookup_cache import lookup_cache
 
 
 class TelegramBotHandler:
@@ -37,10 +45,26 @@ class TelegramBotHandler:
         self.token = token
         self.application = None
         self.auth_manager = None
+        # عميل رفع الملفات بالبث عند عدم وجود خادم Bot API محلي
+        self.upload_client: Optional[httpx.AsyncClient] = None
 
     async def start(self):
         """بدء البوت"""
-        self.application = Application.builder().token(self.token).build()
+        builder = Application.builder().token(self.token)
+
+        # مع خادم Bot API محلي تُرسل الملفات كمسارات يقرأها الخادم من القرص مباشرة
+        if settings.TELEGRAM_LOCAL_API_URL:
+            base_url = settings.TELEGRAM_LOCAL_API_URL.rstrip("/")
+            builder = builder.base_url(f"{base_url}/bot").base_file_url(
+                f"{base_url}/file/bot"
+            ).local_mode(True)
+        else:
+            # الرفع قد يستغرق طويلاً لملف كبير فلا مهلة للكتابة وانتظار الرد
+            self.upload_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, read=None, write=None)
+            )
+
+        self.application = builder.build()
         self.auth_manager = AuthManager(SessionLocal())
 
         # تسجيل المعالجات
@@ -69,6 +93,21 @@ class TelegramBotHandler:
         await self.application.start()
         await self.application.updater.start_polling()
 
+    async def stop(self):
+        """إيقاف البوت (يتحمل التشغيل الجزئي إذا فشل start)"""
+        if self.upload_client:
+            await self.upload_client.aclose()
+            self.upload_client = None
+
+        if not self.application:
+            return
+
+        if self.application.updater and self.application.updater.running:
+            await self.application.updater.stop()
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
+
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالجة أمر /start"""
         user = update.effective_user
@@ -81,11 +120,36 @@ class TelegramBotHandler:
             )
             return
 
-        # إنشاء أو تحديث المستخدم
+        # إنشاء أو تحديث المستخدم (في مجمع خيوط قاعدة البيانات)
+        await run_in_db_thread(self._register_user, user)
+        await lookup_cache.invalidate("user", user.id)
+
+        # إنشاء لوحة المفاتيح الرئيسية
+        keyboard = [
+            [KeyboardButton("📊 حالة الجهاز")],
+            [KeyboardButton("📁 إدارة الملفات"), KeyboardButton("📋 المهام المجدولة")],
+            [KeyboardButton("🔗 ربط جهاز"), KeyboardButton("❓ مساعدة")]
+        ]
+        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+        await update.message.reply_text(
+            f"🎉 مرحباً {user.first_name}!\n\n"
+            "أنا بوت التحكم بهاتفك الذكي.\n"
+            "يمكنني مساعدتك في:\n"
+            "• عرض حالة الجهاز\n"
+            "• إدارة الملفات\n"
+            "• جدولة المهام\n"
+            "• والمزيد...\n\n"
+            "اضغط على زر 'ربط جهاز' للبدء!",
+            reply_markup=reply_markup
+        )
+
+    @staticmethod
+    def _register_user(user):
+        """إنشاء المستخدم إن لم يكن موجوداً وتسجيل العملية"""
         db = SessionLocal()
         try:
-            self.auth_manager = AuthManager(db)
-            db_user = self.auth_manager.get_or_create_user(
+            db_user = AuthManager(db).get_or_create_user(
                 telegram_id=user.id,
                 username=user.username,
                 first_name=user.first_name,
@@ -94,26 +158,6 @@ class TelegramBotHandler:
 
             # إنشاء سجل
             log_operation(db, db_user.id, "bot_start", f"المستخدم {user.id} بدأ استخدام البوت")
-
-            # إنشاء لوحة المفاتيح الرئيسية
-            keyboard = [
-                [KeyboardButton("📊 حالة الجهاز")],
-                [KeyboardButton("📁 إدارة الملفات"), KeyboardButton("📋 المهام المجدولة")],
-                [KeyboardButton("🔗 ربط جهاز"), KeyboardButton("❓ مساعدة")]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-            await update.message.reply_text(
-                f"🎉 مرحباً {user.first_name}!\n\n"
-                "أنا بوت التحكم بهاتفك الذكي.\n"
-                "يمكنني مساعدتك في:\n"
-                "• عرض حالة الجهاز\n"
-                "• إدارة الملفات\n"
-                "• جدولة المهام\n"
-                "• والمزيد...\n\n"
-                "اضغط على زر 'ربط جهاز' للبدء!",
-                reply_markup=reply_markup
-            )
         finally:
             db.close()
 
@@ -159,82 +203,146 @@ class TelegramBotHandler:
             await update.message.reply_text("❌ ليس لديك إذن.")
             return
 
-        db = SessionLocal()
-        try:
-            # التحقق من ربط جهاز
-            device = db.query(Device).join(User).filter(
-                User.telegram_id == user_id,
-                Device.is_online == True
-            ).first()
-
-            if not device:
-                await update.message.reply_text(
-                    "❌ لم تقم بربط جهاز بعد.\n"
-                    "اضغط 'ربط جهاز' للبدء."
-                )
-                return
-
-            # إرسال طلب للحصول على حالة الجهاز
-            await update.message.reply_text("⏳ جاري جلب حالة الجهاز...")
-
-            # هنا يتم إرسال الأمر للجهاز
-            # في الإنتاج، سيتم إرسال الطلب للتطبيق
-            status_info = {
-                "online": True,
-                "battery": {"level": 85, "status": "Charging"},
-                "storage": {"total": 128, "used": 64},
-                "network": {"type": "WiFi", "speed": 50}
-            }
-
-            response = f"""
+        # التحقق من ربط جهاز متصل (حالة الاتصال من متتبع الحضور)
+        device_ids = await self._user_device_ids(user_id)
+        device = next(
+            (device_id for device_id in device_ids if presence.is_online(device_id)),
+            None
+        )
+
+        if not device:
+            await update.message.reply_text(
+                "❌ لم تقم بربط جهاز بعد.\n"
+                "اضغط 'ربط جهاز' للبدء."
+            )
+            return
+
+        # آخر إحصائيات أرسلها الجهاز
+        stats = await self._latest_stats(device)
+
+        if not stats:
+            await update.message.reply_text("✅ الجهاز متصل، لكن لم تصل إحصائيات منه بعد.")
+            return
+
+        response = f"""
 📊 *حالة الجهاز*
 
 ✅ الجهاز متصل
 
-🔋 البطارية: {status_info['battery']['level']}%
-   الحالة: {status_info['battery']['status']}
+🔋 البطارية: {_fmt(stats['battery_level'])}%
+   الحالة: {stats['battery_status'] or 'غير معروفة'}
 
-💾 التخزين: {status_info['storage']['used']}/{status_info['storage']['total']} GB
+💾 التخزين: {_fmt(stats['storage_used'])}/{_fmt(stats['storage_total'])} GB
 
-🌐 الشبكة: {status_info['network']['type']}
-   السرعة: {status_info['network']['speed']} Mbps
+🌐 الشبكة: {stats['network_type'] or 'غير معروفة'}
+   السرعة: {_fmt(stats['network_speed'])} Mbps
 """
 
-            await update.message.reply_text(response, parse_mode="Markdown")
+        await update.message.reply_text(response, parse_mode="Markdown")
+
+    async def _user_stats(self, update: Update) -> Optional[Tuple[str, Dict]]:
+        """(معرف الجهاز، آخر إحصائياته) لأول جهاز مرتبط لديه إحصائيات، مع الرد عند عدمها"""
+        device_ids = list(await self._user_device_ids(update.effective_user.id))
+
+        if not device_ids:
+            await update.message.reply_text("❌ لم تقم بربط جهاز بعد.")
+            return None
+
+        # الأجهزة المتصلة أولاً
+        device_ids.sort(key=lambda device_id: not presence.is_online(device_id))
+        for device_id in device_ids:
+            stats = await self._latest_stats(device_id)
+            if stats:
+                return device_id, stats
+
+        await update.message.reply_text("ℹ️ لم تصل إحصائيات من أجهزتك بعد.")
+        return None
+
+    async def _latest_stats(self, device_id: str) -> Optional[Dict]:
+        """آخر إحصائيات الجهاز من مخزن المقاييس إذا كانت حديثة، وإلا الأحدث بينه
+        وبين آخر صف في قاعدة البيانات (قد تكون العينة وصلت لعامل آخر)"""
+        stats = metrics_store.latest_if_fresh(device_id, settings.METRICS_FRESH_SECONDS)
+        if stats is not None:
+            return stats
+
+        stored = await run_in_db_thread(self._get_latest_stats, device_id)
+        stats = metrics_store.latest_unless_newer(
+            device_id, stored["created_at"] if stored else None
+        )
+        return stats if stats is not None else stored
+
+    @staticmethod
+    def _get_latest_stats(device_id: str) -> Optional[Dict]:
+        """آخر صف إحصائيات للجهاز في قاعدة البيانات"""
+        db = SessionLocal()
+        try:
+            row = db.query(DeviceStats).filter(
+                DeviceStats.device_id == device_id
+            ).order_by(DeviceStats.created_at.desc()).first()
+            if not row:
+                return None
+            return {field: getattr(row, field) for field in FIELDS + TEXT_FIELDS + ("created_at",)}
+        finally:
+            db.close()
+
+    async def _user_device_ids(self, telegram_id: int) -> List[str]:
+        """معرفات أجهزة المستخدم من الذاكرة المؤقتة، ومن قاعدة البيانات عند الإخفاق"""
+        return await lookup_cache.get(
+            "user_devices", telegram_id,
+            lambda: run_in_db_thread(self._get_user_device_ids, telegram_id)
+        )
+
+    @staticmethod
+    def _get_user_device_ids(telegram_id: int) -> List[str]:
+        """معرفات أجهزة المستخدم"""
+        db = SessionLocal()
+        try:
+            rows = db.query(Device.device_id).join(User).filter(
+                User.telegram_id == telegram_id
+            ).all()
+            return [row.device_id for row in rows]
         finally:
             db.close()
 
     async def battery_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالجة أمر /battery"""
-        await update.message.reply_text("🔋 جاري جلب معلومات البطارية...")
+        found = await self._user_stats(update)
+        if not found:
+            return
+        device_id, stats = found
 
-        # محاكاة استجابة
-        response = """
+        # التغير خلال آخر ساعة من العينات الحديثة في الذاكرة
+        recent = metrics_store.window(device_id, "battery_level", 3600)
+        change = f"{recent[-1][1] - recent[0][1]:+.0f}%" if len(recent) > 1 else "غير متاح"
+
+        response = f"""
 🔋 *معلومات البطارية*
 
-• المستوى: 85%
-• الحالة: قيد الشحن
-• درجة الحرارة: 32°C
-• السعة: 4500 mAh
+• المستوى: {_fmt(stats['battery_level'])}%
+• الحالة: {stats['battery_status'] or 'غير معروفة'}
+• التغير خلال آخر ساعة: {change}
 """
         await update.message.reply_text(response, parse_mode="Markdown")
 
     async def storage_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالجة أمر /storage"""
-        await update.message.reply_text("💾 جاري جلب معلومات التخزين...")
+        found = await self._user_stats(update)
+        if not found:
+            return
+        _, stats = found
 
-        response = """
-💾 *معلومات التخزين*
+        total, used = stats["storage_total"], stats["storage_used"]
+        if total and used is not None:
+            free = f"{_fmt(total - used)} GB ({(total - used) / total:.0%})"
+        else:
+            free = "غير متاح"
 
-• الإجمالي: 128 GB
-• المستخدم: 64 GB
-• المتبقي: 64 GB (50%)
+        response = f"""
+💾 *معلومات التخزين*
 
-*التقسيمات:*
-• التطبيقات: 25 GB
-• الصور: 20 GB
-• الفيديو: 10 GB
-• أخرى: 9 GB
+• الإجمالي: {_fmt(total)} GB
+• المستخدم: {_fmt(used)} GB
+• المتبقي: {free}
 """
         await update.message.reply_text(response, parse_mode="Markdown")
 
@@ -310,21 +418,39 @@ class TelegramBotHandler:
         """معالجة أمر /unlink لإلغاء ربط جهاز"""
         user_id = update.effective_user.id
 
+        device_ids = await run_in_db_thread(self._unlink_user_devices, user_id)
+
+        if device_ids is not None:
+            await lookup_cache.invalidate("user_devices", user_id)
+            for device_id in device_ids:
+                await lookup_cache.invalidate("device", device_id)
+                presence.forget(device_id)
+                metrics_store.forget(device_id)
+
+            await update.message.reply_text(
+                "✅ تم إلغاء ربط جميع الأجهزة بنجاح."
+            )
+        else:
+            await update.message.reply_text(
+                "ℹ️ لم تقم بربط أي جهاز."
+            )
+
+    @staticmethod
+    def _unlink_user_devices(telegram_id: int) -> Optional[List[str]]:
+        """حذف أجهزة المستخدم وإرجاع معرفاتها، أو None إذا لم يوجد المستخدم"""
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.telegram_id == user_id).first()
-            if user:
-                # حذف الأجهزة المرتبطة
-                db.query(Device).filter(Device.user_id == user.id).delete()
-                db.commit()
-
-                await update.message.reply_text(
-                    "✅ تم إلغاء ربط جميع الأجهزة بنجاح."
-                )
-            else:
-                await update.message.reply_text(
-                    "ℹ️ لم تقم بربط أي جهاز."
-                )
+            user = db.query(User).filter(User.telegram_id == telegram_id).first()
+            if not user:
+                return None
+
+            # حذف الأجهزة المرتبطة
+            devices = db.query(Device).filter(Device.user_id == user.id)
+            device_ids = [d.device_id for d in devices]
+            devices.delete()
+            db.commit()
+
+            return device_ids
         finally:
             db.close()
 
@@ -357,7 +483,7 @@ class TelegramBotHandler:
         await update.message.reply_text("🤔 جاري تحليل الأمر...")
 
         # تحليل الأمر
-        result = ai_engine.analyze_command(message_text)
+        result = await ai_engine.analyze_command(message_text)
 
         if result.get("success"):
             # تنفيذ الأمر
@@ -383,37 +509,127 @@ class TelegramBotHandler:
         elif data == "tasks_list":
             await query.message.edit_text("📋 جاري عرض المهام...")
 
+    async def send_message(self, chat_id: int, text: str):
+        """إرسال رسالة نصية للمستخدم"""
+        if not self.application:
+            return
+
+        await self.application.bot.send_message(chat_id=chat_id, text=text)
+
     async def send_file(self, chat_id: int, file_path: str, caption: str = None):
         """إرسال ملف للمستخدم"""
         if not self.application:
             return
 
-        async with self.application.bot:
-            await self.application.bot.send_document(
-                chat_id=chat_id,
-                document=open(file_path, 'rb'),
-                caption=caption
-            )
+        await self._send_from_disk(
+            self.application.bot.send_document, "document",
+            chat_id, file_path, caption=caption
+        )
 
     async def send_photo(self, chat_id: int, photo_path: str, caption: str = None):
         """إرسال صورة للمستخدم"""
         if not self.application:
             return
 
-        async with self.application.bot:
-            await self.application.bot.send_photo(
-                chat_id=chat_id,
-                photo=open(photo_path, 'rb'),
-                caption=caption
+        await self._send_from_disk(
+            self.application.bot.send_photo, "photo",
+            chat_id, photo_path, caption=caption
+        )
+
+    async def send_stored_file(self, chat_id: int, file_id: int, caption: str = None):
+        """إرسال ملف من مخزن الكتل للمستخدم"""
+        if not self.application:
+            return
+
+        stored = await run_in_db_thread(self._get_stored_file, file_id)
+        if not stored:
+            return
+
+        blob_path = blob_store.resolve(stored.sha256)
+        if blob_path is None:
+            return
+
+        await self._send_from_disk(
+            self.application.bot.send_document, "document",
+            chat_id, blob_path,
+            caption=caption, filename=stored.filename
+        )
+
+    async def _send_from_disk(
+        self,
+        send,
+        field: str,
+        chat_id: int,
+        file_path: str,
+        caption: str = None,
+        filename: str = None
+    ):
+        """إرسال ملف من القرص دون تحميله في الذاكرة
+
+        مع خادم Bot API محلي يُمرر المسار فقط فلا تمر البايتات عبر البوت.
+        وإلا يُرفع عبر httpx كـ multipart يُقرأ من الملف على دفعات، لأن InputFile
+        في python-telegram-bot يقرأ الملف كاملاً في الذاكرة قبل الإرسال
+        """
+        if settings.TELEGRAM_LOCAL_API_URL:
+            return await send(
+                chat_id=chat_id, **{field: Path(file_path).resolve()},
+                caption=caption, filename=filename
             )
 
+        data = {"chat_id": str(chat_id)}
+        if caption:
+            data["caption"] = caption
+
+        # sendDocument / sendPhoto
+        url = f"{self.application.bot.base_url}/send{field.capitalize()}"
+
+        with open(file_path, 'rb') as f:
+            response = await self.upload_client.post(
+                url, data=data,
+                files={field: (filename or os.path.basename(file_path), f)}
+            )
+
+        try:
+            payload = response.json()
+        except ValueError:
+            raise TelegramError(f"رد غير صالح من Telegram (HTTP {response.status_code})")
+
+        if not payload.get("ok"):
+            raise TelegramError(payload.get("description") or f"HTTP {response.status_code}")
+
+        return payload["result"]
+
+    @staticmethod
+    def _get_stored_file(file_id: int) -> Optional[StoredFile]:
+        """جلب سجل ملف مخزن"""
+        db = SessionLocal()
+        try:
+            return db.query(StoredFile).filter(StoredFile.id == file_id).first()
+        finally:
+            db.close()
+
+
+def _fmt(value: Optional[float]) -> str:
+    """تنسيق قيمة رقمية للعرض (بدون أصفار عشرية زائدة)"""
+    if value is None:
+        return "غير متاح"
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
 
 # دالة لتشغيل البوت
 def run_bot():
-    """تشغيل بوت Telegram"""
+    """تشغيل بوت Telegram كعملية مستقلة (مع BOT_MODE=external في عمال API)"""
     if not settings.TELEGRAM_BOT_TOKEN:
         print("❌ لم يتم تعيين TELEGRAM_BOT_TOKEN")
         return
 
-    bot = TelegramBotHandler(settings.TELEGRAM_BOT_TOKEN)
-    asyncio.run(bot.start())
+    from bot_service import bot_service
+
+    try:
+        asyncio.run(bot_service.run_standalone())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run_bot()
@@ -0,0 +1,238 @@
+"""
+تشغيل بوت Telegram كقائد واحد
+مع عدة عمال uvicorn يتولى عامل واحد فقط تشغيل البوت (قفل ملف flock)، أو يعمل البوت
+كعملية مستقلة (python bot_handler.py)، فلا يتنافس أكثر من مستطلع على getUpdates.
+عمال API يرسلون مهام البوت (إرسال رسالة أو ملف) عبر مقبس Unix محلي إلى طابور
+داخل العملية القائدة، ينفذها البوت بالترتيب
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+from typing import Dict, Optional, Set
+
+from config import settings
+
+# الإجراءات التي يقبلها البوت من عمال API (أسماء دوال TelegramBotHandler)
+ACTIONS = ("send_message", "send_file", "send_photo", "send_stored_file")
+
+# مهلة انتظار تأكيد الاستلام من العملية القائدة (ثانية)
+REPLY_TIMEOUT = 5
+
+
+class LeaderLock:
+    """قفل ملف غير حاجز: تحمله عملية واحدة فقط ويتحرر تلقائياً عند انتهائها"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """محاولة أخذ القفل دون انتظار"""
+        if self._fd is not None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        # رقم العملية القائدة للتشخيص
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class BotService:
+    """تشغيل البوت في العملية القائدة وطابور المهام المحلي بينها وبين عمال API"""
+
+    def __init__(self, mode: str, lock_path: str, socket_path: str, retry: float, queue_size: int):
+        self.mode = mode
+        self.lock = LeaderLock(lock_path)
+        self.socket_path = socket_path
+        self.retry = retry
+        self.queue_size = queue_size
+        self._task: Optional[asyncio.Task] = None
+        # جانب القائد
+        self._queue: Optional[asyncio.Queue] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        # جانب العميل (اتصال دائم بالمقبس)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._client_lock = asyncio.Lock()
+        self.counters = {"queued": 0, "sent": 0, "failed": 0, "dropped": 0}
+
+    def start(self):
+        """بدء محاولة تولي القيادة في الخلفية (وضع leader فقط)"""
+        if self.mode != "leader" or self._task is not None:
+            return
+        if not settings.TELEGRAM_BOT_TOKEN:
+            print("❌ لم يتم تعيين TELEGRAM_BOT_TOKEN")
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف البوت إن كانت هذه العملية القائدة وإغلاق اتصال العميل"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _run(self):
+        """إعادة محاولة أخذ القفل دورياً، فيتولى عامل آخر القيادة إذا توقف القائد"""
+        while True:
+            if self.lock.acquire():
+                try:
+                    await self.serve()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ توقف بوت التليجرام: {e}")
+            await asyncio.sleep(self.retry)
+
+    async def run_standalone(self):
+        """تشغيل البوت كعملية مستقلة حتى الإيقاف"""
+        if not self.lock.acquire():
+            print(f"❌ بوت آخر قيد التشغيل (القفل {self.lock.path})")
+            return
+        await self.serve()
+
+    async def serve(self):
+        """تشغيل البوت والمقبس المحلي وتنفيذ المهام الواردة (يتطلب حمل القفل)"""
+        from bot_handler import TelegramBotHandler
+
+        bot = TelegramBotHandler(settings.TELEGRAM_BOT_TOKEN)
+        self._queue = asyncio.Queue(self.queue_size)
+        server = None
+        try:
+            await bot.start()
+
+            # مقبس متبقٍ من قائد سابق توقف فجأة (القفل يضمن عدم وجود قائد حي)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+            print(f"🤖 بوت التليجرام قيد التشغيل (العملية {os.getpid()})")
+
+            while True:
+                job = await self._queue.get()
+                await self._execute(bot, job)
+        finally:
+            if server is not None:
+                server.close()
+                # إغلاق اتصالات العمال فيعيدون الاتصال بالقائد التالي
+                for writer in list(self._clients):
+                    writer.close()
+                if os.path.exists(self.socket_path):
+                    os.unlink(self.socket_path)
+            self._queue = None
+            await bot.stop()
+            self.lock.release()
+
+    async def _execute(self, bot, job: Dict):
+        try:
+            await getattr(bot, job["action"])(**job["params"])
+            self.counters["sent"] += 1
+        except Exception as e:
+            self.counters["failed"] += 1
+            print(f"⚠️ فشل تنفيذ مهمة البوت {job['action']}: {e}")
+
+    def _enqueue(self, job: Dict) -> bool:
+        if job.get("action") not in ACTIONS or not isinstance(job.get("params"), dict):
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            return False
+        self.counters["queued"] += 1
+        return True
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """استقبال مهام NDJSON من عامل API والرد بـ ok أو error لكل سطر"""
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    accepted = self._enqueue(json.loads(line))
+                except ValueError:
+                    accepted = False
+                writer.write(b"ok\n" if accepted else b"error\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def send(self, action: str, **params) -> bool:
+        """إرسال مهمة للبوت القائد
+
+        Returns:
+            bool: True إذا استلمها طابور البوت، False إذا لم يكن هناك بوت يستمع أو امتلأ الطابور
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"إجراء بوت غير معروف: {action}")
+
+        job = {"action": action, "params": params}
+
+        # هذه العملية هي القائدة: لا حاجة للمقبس
+        if self._queue is not None:
+            return self._enqueue(job)
+
+        line = (json.dumps(job, ensure_ascii=False) + "\n").encode()
+        async with self._client_lock:
+            # محاولة ثانية باتصال جديد إذا انقطع الاتصال القديم (تغير القائد)
+            for _ in range(2):
+                try:
+                    if self._writer is None or self._writer.is_closing():
+                        self._reader, self._writer = await asyncio.open_unix_connection(
+                            self.socket_path
+                        )
+                    self._writer.write(line)
+                    await self._writer.drain()
+                    reply = await asyncio.wait_for(self._reader.readline(), REPLY_TIMEOUT)
+                    if reply:
+                        return reply == b"ok\n"
+                except (OSError, asyncio.TimeoutError):
+                    pass
+
+                if self._writer is not None:
+                    self._writer.close()
+                self._reader = self._writer = None
+
+        self.counters["dropped"] += 1
+        return False
+
+    def stats(self) -> Dict:
+        return {"mode": self.mode, "leader": self._queue is not None, **self.counters}
+
+
+# إنشاء كائن الخدمة
+bot_service = BotService(
+    settings.BOT_MODE,
+    lock_path=settings.BOT_LOCK_FILE,
+    socket_path=settings.BOT_SOCKET_PATH,
+    retry=settings.BOT_LEADER_RETRY,
+    queue_size=settings.BOT_QUEUE_SIZE
+)
@@ -0,0 +1,88 @@
+"""
+سجل إشعارات الأوامر
+يتيح للطلبات المعلقة (long-poll) انتظار وصول أمر جديد لجهاز محدد دون استطلاع قاعدة البيانات.
+لكل جهاز رقم تسلسلي يزداد مع كل إشعار: المنتظر يقرؤه قبل فحص قاعدة البيانات ثم يمرره
+لـ wait، فلا يضيع إشعار وصل بين الفحص وبدء الانتظار
+"""
+
+import asyncio
+from typing import Dict, Optional, Set
+
+
+class CommandNotifier:
+    """سجل انتظار لكل جهاز يعتمد على asyncio داخل نفس العملية"""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        # عدد الإشعارات لكل جهاز (عدد صحيح لكل جهاز أُشعر، محدود بعدد الأجهزة)
+        self._versions: Dict[str, int] = {}
+        # يزداد مع notify_all فيتغير رقم كل الأجهزة
+        self._epoch = 0
+
+    def version(self, device_id: str) -> int:
+        """الرقم التسلسلي الحالي لإشعارات الجهاز"""
+        return self._epoch + self._versions.get(device_id, 0)
+
+    async def wait(self, device_id: str, timeout: float, since: Optional[int] = None) -> bool:
+        """
+        انتظار إشعار بوصول أمر جديد للجهاز
+
+        Args:
+            device_id: معرف الجهاز (device_id النصي)
+            timeout: أقصى مدة انتظار بالثواني
+            since: رقم version() المقروء قبل فحص قاعدة البيانات؛ إذا تغير منذ
+                ذلك الحين يعود الانتظار فوراً
+
+        Returns:
+            bool: True إذا وصل إشعار، False عند انتهاء المهلة
+        """
+        if since is not None and self.version(device_id) != since:
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(device_id, set()).add(future)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(device_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[device_id]
+
+    def notify(self, device_id: str) -> int:
+        """إيقاظ جميع الطلبات المنتظرة لهذا الجهاز وإرجاع عددها"""
+        self._versions[device_id] = self._versions.get(device_id, 0) + 1
+        waiters = self._waiters.pop(device_id, None)
+        if not waiters:
+            return 0
+
+        for future in waiters:
+            if not future.done():
+                future.set_result(True)
+
+        return len(waiters)
+
+    def notify_all(self) -> int:
+        """إيقاظ الطلبات المنتظرة لكل الأجهزة وإرجاع عددها
+
+        يُستدعى بعد إعادة الاشتراك في قناة الأوامر، فقد تكون فاتت إشعارات أثناء
+        الانقطاع؛ كل منتظر يعيد فحص قاعدة البيانات
+        """
+        self._epoch += 1
+        woken = 0
+        for device_id in list(self._waiters):
+            woken += self.notify(device_id)
+        return woken
+
+    def waiting_count(self, device_id: str) -> int:
+        """عدد الطلبات المنتظرة حالياً لهذا الجهاز"""
+        return len(self._waiters.get(device_id, ()))
+
+
+# إنشاء كائن السجل
+command_notifier = CommandNotifier()
@@ -0,0 +1,214 @@
+"""
+طابور تسليم الأوامر
+يحدد كيف تصل الأوامر الجديدة لطلبات الحجز (claim) وقنوات WebSocket:
+- sql: الأوامر في قاعدة البيانات والإشعار داخل العملية (عملية واحدة)، والمنتظر
+  يعيد فحص قاعدة البيانات عند الإشعار
+- redis: معرف الأمر يُدفع (LPUSH) إلى قائمة الجهاز، والمنتظر يسحبه بانتظار حاجب
+  (BLMOVE) إلى قائمة قيد التنفيذ حتى تصل نتيجته (ack)، فيأخذ كل أمر مستهلك واحد
+  في أي عملية. ويُبث معرف الجهاز أيضاً على قناة pub/sub لإيقاظ طلبات القراءة
+  (/commands/pending) التي لا تحجز
+
+قاعدة البيانات تبقى سجل الحقيقة: المعرف المسحوب يُحجز بعبارة UPDATE ذرية، وما لم
+يعد معلقاً يُحذف من القائمة، ومن يحجز يفحص قاعدة البيانات أيضاً عند انتهاء المهلة
+فلا يضيع أمر عند تعطل Redis أو انتهاء مهلة حجزه
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from config import settings
+from command_notifier import CommandNotifier, command_notifier
+from redis_channel import RedisSubscriber
+
+# قناة بث وصول الأوامر (الرسالة هي device_id)
+COMMAND_CHANNEL = "commands"
+
+# قائمة الأوامر الجاهزة للجهاز، وقائمة المسحوبة منها حتى وصول نتيجتها
+READY_KEY = "commands:{}"
+TAKEN_KEY = "commands:{}:taken"
+
+# عمر قوائم جهاز خامل بالثواني (الأوامر نفسها تبقى في قاعدة البيانات)
+QUEUE_TTL = 24 * 3600
+
+
+class SqlCommandQueue:
+    """الطابور الافتراضي: إشعارات داخل العملية عبر command_notifier"""
+
+    name = "sql"
+
+    def __init__(self, notifier: CommandNotifier = command_notifier):
+        self.notifier = notifier
+        self.counters = {"published": 0, "wakeups": 0, "timeouts": 0}
+
+    async def publish(self, device_id: str, command_id: int):
+        """الإعلان عن أمر جديد بعد حفظه في قاعدة البيانات"""
+        self.counters["published"] += 1
+        self.notifier.notify(device_id)
+
+    async def take(
+        self,
+        device_id: str,
+        limit: int,
+        timeout: float,
+        since: Optional[int] = None
+    ) -> Optional[List[int]]:
+        """انتظار أوامر جديدة للجهاز لحجزها
+
+        Returns:
+            Optional[List[int]]: معرفات أوامر سُحبت من الطابور ليحجزها المستدعي،
+            أو None ليفحص المستدعي قاعدة البيانات (إشعار أو انتهاء المهلة)
+        """
+        await self.wait(device_id, timeout, since)
+        return None
+
+    async def ack(self, device_id: str, command_ids: Iterable[int]):
+        """إزالة أوامر انتهت (وصلت نتيجتها أو لم تعد معلقة) من الطابور"""
+
+    def version(self, device_id: str) -> int:
+        """رقم إشعارات الجهاز، يُقرأ قبل فحص قاعدة البيانات ويُمرر لـ wait"""
+        return self.notifier.version(device_id)
+
+    async def wait(self, device_id: str, timeout: float, since: Optional[int] = None) -> bool:
+        """انتظار أمر جديد للجهاز؛ True عند الإشعار و False عند انتهاء المهلة
+
+        since من version(): إشعار وصل بعد قراءته يعيد الانتظار فوراً
+        """
+        woken = await self.notifier.wait(device_id, timeout, since)
+        self.counters["wakeups" if woken else "timeouts"] += 1
+        return woken
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, **self.counters}
+
+    def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class RedisCommandQueue(SqlCommandQueue):
+    """طابور مشترك: قائمة Redis لكل جهاز يسحب منها من يحجز الأوامر (BLMOVE)،
+    وبث pub/sub لمعرف الجهاز يوقظ منتظري القراءة في كل العمليات
+
+    عند تعذر الوصول إلى Redis يعمل الإشعار داخل العملية، ومن يحجز يعود لفحص
+    قاعدة البيانات حتى لا تتوقف الأوامر
+    """
+
+    name = "redis"
+
+    def __init__(self, client, notifier: CommandNotifier = command_notifier):
+        super().__init__(notifier)
+        self.redis = client
+        self.counters.update({"taken": 0, "acked": 0, "redis_errors": 0})
+        self._subscriber = RedisSubscriber(
+            client, COMMAND_CHANNEL, notifier.notify, on_subscribe=notifier.notify_all
+        )
+
+    async def publish(self, device_id: str, command_id: int):
+        self.counters["published"] += 1
+
+        # المنتظرون في نفس العملية أولاً: لا ينتظرون عودة الرسالة ولا تعطل Redis
+        self.notifier.notify(device_id)
+
+        ready = READY_KEY.format(device_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.lpush(ready, command_id)
+                pipe.expire(ready, QUEUE_TTL)
+                pipe.publish(COMMAND_CHANNEL, device_id)
+                await pipe.execute()
+        except Exception:
+            self.counters["redis_errors"] += 1
+
+    async def take(
+        self,
+        device_id: str,
+        limit: int,
+        timeout: float,
+        since: Optional[int] = None
+    ) -> Optional[List[int]]:
+        """سحب حتى limit معرفات من قائمة الجهاز، بانتظار حاجب للأول منها
+
+        إشعار محلي منذ since (مثل إعادة الاشتراك بعد انقطاع) يعيد None فوراً
+        ليفحص المستدعي قاعدة البيانات
+        """
+        if since is not None and self.version(device_id) != since:
+            self.counters["wakeups"] += 1
+            return None
+
+        ready, taken = READY_KEY.format(device_id), TAKEN_KEY.format(device_id)
+        try:
+            first = await self.redis.blmove(ready, taken, timeout, "RIGHT", "LEFT")
+            if first is None:
+                self.counters["timeouts"] += 1
+                return None
+
+            ids = [int(first)]
+            while len(ids) < limit:
+                command_id = await self.redis.lmove(ready, taken, "RIGHT", "LEFT")
+                if command_id is None:
+                    break
+                ids.append(int(command_id))
+            await self.redis.expire(taken, QUEUE_TTL)
+        except Exception:
+            self.counters["redis_errors"] += 1
+            await self.wait(device_id, timeout, since)
+            return None
+
+        self.counters["wakeups"] += 1
+        self.counters["taken"] += len(ids)
+        return ids
+
+    async def ack(self, device_id: str, command_ids: Iterable[int]):
+        """حذف الأوامر من قائمتي الجهاز
+
+        الأمر قد يبقى في القائمة الجاهزة إذا حُجز من قاعدة البيانات مباشرة
+        (دفع WebSocket فوري أو فحص بعد انتهاء المهلة)، فيُحذف منها أيضاً
+        """
+        command_ids = list(command_ids)
+        if not command_ids:
+            return
+
+        ready, taken = READY_KEY.format(device_id), TAKEN_KEY.format(device_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for command_id in command_ids:
+                    pipe.lrem(taken, 0, command_id)
+                    pipe.lrem(ready, 0, command_id)
+                await pipe.execute()
+            self.counters["acked"] += len(command_ids)
+        except Exception:
+            self.counters["redis_errors"] += 1
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "subscribed": self._subscriber.live}
+
+    def start(self):
+        """بدء الاشتراك في قناة الأوامر"""
+        self._subscriber.start()
+
+    async def close(self):
+        await self._subscriber.stop()
+        await self.redis.close()
+
+
+def create_command_queue(backend: str):
+    """إنشاء الطابور حسب الإعداد COMMAND_QUEUE_BACKEND"""
+    if backend == "sql":
+        return SqlCommandQueue()
+
+    if backend == "redis":
+        import redis.asyncio as redis
+
+        return RedisCommandQueue(redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            decode_responses=True
+        ))
+
+    raise ValueError(f"طابور أوامر غير معروف: {backend}")
+
+
+# إنشاء كائن الطابور
+command_queue = create_command_queue(settings.COMMAND_QUEUE_BACKEND)
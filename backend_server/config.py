@@ -25,12 +25,30 @@ class Settings(BaseSettings):
         default="sqlite:///./teledroid.db",
         env="DATABASE_URL"
     )
+    # عنوان المشغل غير المتزامن (يُشتق من DATABASE_URL إذا تُرك فارغاً)
+    ASYNC_DATABASE_URL: str = Field(default="", env="ASYNC_DATABASE_URL")
+    # عدد خيوط العمليات المتزامنة على قاعدة البيانات
+    DB_THREAD_POOL_SIZE: int = Field(default=4, env="DB_THREAD_POOL_SIZE")
+
+    # ملف التخزين: default أو production (WAL وإعدادات PRAGMA لـ SQLite)
+    DATABASE_PROFILE: str = Field(default="default", env="DATABASE_PROFILE")
+    DB_POOL_SIZE: int = Field(default=10, env="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(default=10, env="DB_MAX_OVERFLOW")
+    SQLITE_MMAP_SIZE: int = Field(default=256 * 1024 * 1024, env="SQLITE_MMAP_SIZE")  # 256MB
+    SQLITE_CACHE_SIZE: int = Field(default=-64000, env="SQLITE_CACHE_SIZE")  # سالب = كيلوبايت (~64MB)
+    SQLITE_BUSY_TIMEOUT: int = Field(default=5000, env="SQLITE_BUSY_TIMEOUT")  # ميلي ثانية
 
     # إعدادات Redis
     REDIS_HOST: str = Field(default="localhost", env="REDIS_HOST")
     REDIS_PORT: int = Field(default=6379, env="REDIS_PORT")
     REDIS_DB: int = Field(default=0, env="REDIS_DB")
 
+    # ذاكرة مؤقتة لقراءات المستخدمين والأجهزة (طبقة محلية، وطبقة Redis اختيارية)
+    LOOKUP_CACHE_SIZE: int = Field(default=10000, env="LOOKUP_CACHE_SIZE")
+    LOOKUP_CACHE_TTL: float = Field(default=30.0, env="LOOKUP_CACHE_TTL")  # ثانية
+    LOOKUP_CACHE_REDIS: bool = Field(default=False, env="LOOKUP_CACHE_REDIS")
+    LOOKUP_CACHE_REDIS_TTL: int = Field(default=300, env="LOOKUP_CACHE_REDIS_TTL")  # ثانية
+
     # إعدادات Telegram Bot
     TELEGRAM_BOT_TOKEN: str = Field(
         default="",
@@ -38,10 +56,43 @@ class Settings(BaseSettings):
     )
     TELEGRAM_API_ID: int = Field(default=0, env="TELEGRAM_API_ID")
     TELEGRAM_API_HASH: str = Field(default="", env="TELEGRAM_API_HASH")
+    # عنوان خادم Bot API محلي (مثل http://127.0.0.1:8081) لإرسال الملفات من القرص مباشرة
+    TELEGRAM_LOCAL_API_URL: str = Field(default="", env="TELEGRAM_LOCAL_API_URL")
+
+    # تشغيل البوت: leader (عامل API واحد بقفل ملف)، external (python bot_handler.py)، off
+    BOT_MODE: str = Field(default="leader", env="BOT_MODE")
+    BOT_LOCK_FILE: str = Field(default="./teledroid-bot.lock", env="BOT_LOCK_FILE")
+    # مقبس Unix الذي يرسل عبره عمال API مهام البوت للعملية القائدة
+    BOT_SOCKET_PATH: str = Field(default="./teledroid-bot.sock", env="BOT_SOCKET_PATH")
+    BOT_LEADER_RETRY: float = Field(default=10.0, env="BOT_LEADER_RETRY")  # ثانية
+    BOT_QUEUE_SIZE: int = Field(default=1000, env="BOT_QUEUE_SIZE")
 
     # إعدادات OpenAI للذكاء الاصطناعي
     OPENAI_API_KEY: str = Field(default="", env="OPENAI_API_KEY")
     OPENAI_MODEL: str = Field(default="gpt-3.5-turbo", env="OPENAI_MODEL")
+    # عنوان خادم متوافق مع OpenAI (فارغ = الخادم الرسمي)
+    OPENAI_BASE_URL: str = Field(default="", env="OPENAI_BASE_URL")
+    # أقصى عدد طلبات متزامنة لنموذج اللغة، ومهلة كل محاولة وعدد إعادة المحاولة
+    AI_MAX_CONCURRENCY: int = Field(default=4, env="AI_MAX_CONCURRENCY")
+    AI_TIMEOUT: float = Field(default=20.0, env="AI_TIMEOUT")  # ثانية
+    AI_MAX_RETRIES: int = Field(default=2, env="AI_MAX_RETRIES")
+    AI_RETRY_BASE_DELAY: float = Field(default=0.5, env="AI_RETRY_BASE_DELAY")  # ثانية
+    # قاطع الدائرة: يُفتح بعد عدد إخفاقات متتالية ويعيد التجربة بعد المدة
+    AI_BREAKER_THRESHOLD: int = Field(default=5, env="AI_BREAKER_THRESHOLD")
+    AI_BREAKER_RESET: float = Field(default=30.0, env="AI_BREAKER_RESET")  # ثانية
+    # مدة مشاركة فشل طلب مدمج مع الطلبات المتطابقة التالية (تمنع موجة إعادة المحاولة)
+    AI_SINGLEFLIGHT_FAILURE_TTL: float = Field(default=2.0, env="AI_SINGLEFLIGHT_FAILURE_TTL")  # ثانية
+    # مصنف النوايا المحلي: أقل تشابه مع النية الأولى وأقل فارق عن الثانية قبل التصعيد للنموذج
+    AI_CLASSIFIER_ENABLED: bool = Field(default=True, env="AI_CLASSIFIER_ENABLED")
+    AI_CLASSIFIER_THRESHOLD: float = Field(default=0.25, env="AI_CLASSIFIER_THRESHOLD")
+    AI_CLASSIFIER_MARGIN: float = Field(default=0.05, env="AI_CLASSIFIER_MARGIN")
+    # ذاكرة نتائج تحليل الأوامر بالنموذج: طبقة محلية وملف SQLite دائم (فارغ = محلية فقط)
+    LLM_CACHE_ENABLED: bool = Field(default=True, env="LLM_CACHE_ENABLED")
+    LLM_CACHE_SIZE: int = Field(default=2000, env="LLM_CACHE_SIZE")
+    LLM_CACHE_TTL: float = Field(default=3600.0, env="LLM_CACHE_TTL")  # ثانية
+    LLM_CACHE_PATH: str = Field(default="./llm_cache.db", env="LLM_CACHE_PATH")
+    LLM_CACHE_DB_TTL: float = Field(default=604800.0, env="LLM_CACHE_DB_TTL")  # ثانية (أسبوع)
+    LLM_CACHE_DB_MAX_ROWS: int = Field(default=50000, env="LLM_CACHE_DB_MAX_ROWS")
 
     # إعدادات الأمان
     SECRET_KEY: str = Field(
@@ -63,6 +114,69 @@ class Settings(BaseSettings):
     # إعدادات الملفات
     MAX_FILE_SIZE: int = Field(default=50 * 1024 * 1024, env="MAX_FILE_SIZE")  # 50MB
     UPLOAD_DIR: str = Field(default="./uploads", env="UPLOAD_DIR")
+    # مخزن الكتل حسب SHA-256 (افتراضياً UPLOAD_DIR/blobs)
+    BLOB_DIR: str = Field(default="", env="BLOB_DIR")
+    # حجم الدفعة المقترح للرفع المجزأ القابل للاستئناف
+    UPLOAD_CHUNK_SIZE: int = Field(default=4 * 1024 * 1024, env="UPLOAD_CHUNK_SIZE")  # 4MB
+    # مدة بقاء جلسة رفع مجزأ دون استلام أي دفعة، وفاصل حذف الجلسات المنتهية
+    UPLOAD_SESSION_TTL: float = Field(default=86400.0, env="UPLOAD_SESSION_TTL")  # ثانية
+    UPLOAD_SWEEP_INTERVAL: float = Field(default=3600.0, env="UPLOAD_SWEEP_INTERVAL")  # ثانية
+
+    # إعدادات الاستطلاع الطويل (long-poll) للأوامر
+    LONG_POLL_MAX_WAIT: int = Field(default=30, env="LONG_POLL_MAX_WAIT")  # ثانية
+
+    # إعدادات حجز الأوامر (claim)
+    COMMAND_LEASE_SECONDS: int = Field(default=120, env="COMMAND_LEASE_SECONDS")
+    COMMAND_CLAIM_MAX: int = Field(default=50, env="COMMAND_CLAIM_MAX")
+
+    # طابور تسليم الأوامر: sql (داخل العملية) أو redis (قائمة لكل جهاز مشتركة بين العمليات والخوادم)
+    COMMAND_QUEUE_BACKEND: str = Field(default="sql", env="COMMAND_QUEUE_BACKEND")
+
+    # منفذ المهام المجدولة (يحوّل المهام المستحقة إلى أوامر)
+    SCHEDULER_ENABLED: bool = Field(default=True, env="SCHEDULER_ENABLED")
+    SCHEDULER_RETRY_DELAY: int = Field(default=30, env="SCHEDULER_RETRY_DELAY")  # ثانية
+    # المنطقة الزمنية لمواعيد المهام التي لا تحدد TZ= في schedule_value
+    SCHEDULER_TIMEZONE: str = Field(default="UTC", env="SCHEDULER_TIMEZONE")
+
+    # إعدادات قناة WebSocket للأجهزة (حجم طابور الإرسال لكل اتصال)
+    WS_SEND_QUEUE_SIZE: int = Field(default=100, env="WS_SEND_QUEUE_SIZE")
+
+    # إعدادات تخزين إحصائيات الأجهزة مؤقتاً قبل كتابتها
+    STATS_BUFFER_MAX_SIZE: int = Field(default=500, env="STATS_BUFFER_MAX_SIZE")
+    STATS_FLUSH_INTERVAL: float = Field(default=5.0, env="STATS_FLUSH_INTERVAL")  # ثانية
+    # أقصى عدد عينات في المخزن أثناء تعطل الكتابة (الأقدم يُحذف)
+    STATS_BUFFER_HARD_LIMIT: int = Field(default=50000, env="STATS_BUFFER_HARD_LIMIT")
+    # أقصى عدد نقاط لكل مقياس في استعلام النطاق (يحدد دقة التجميع المختارة)
+    STATS_RANGE_MAX_POINTS: int = Field(default=1000, env="STATS_RANGE_MAX_POINTS")
+    # عدد العينات الحديثة المحفوظة في الذاكرة لكل جهاز
+    METRICS_RING_SIZE: int = Field(default=720, env="METRICS_RING_SIZE")
+    # عمر آخر عينة في الذاكرة الذي تُقدم فيه دون سؤال قاعدة البيانات (ثانية)
+    METRICS_FRESH_SECONDS: float = Field(default=30.0, env="METRICS_FRESH_SECONDS")
+
+    # إعدادات تتبع حضور الأجهزة (بالثواني)
+    PRESENCE_FLUSH_INTERVAL: float = Field(default=5.0, env="PRESENCE_FLUSH_INTERVAL")
+    PRESENCE_OFFLINE_AFTER: float = Field(default=90.0, env="PRESENCE_OFFLINE_AFTER")
+    # مشاركة الحضور بين العمليات عبر Redis (عند تشغيل عدة عمال)
+    PRESENCE_REDIS: bool = Field(default=False, env="PRESENCE_REDIS")
+
+    # إعدادات الاحتفاظ بالبيانات (القيمة 0 تعطل الحد)؛ الحذف يتطلب تفعيلاً صريحاً
+    RETENTION_ENABLED: bool = Field(default=False, env="RETENTION_ENABLED")
+    # قفل الملف الذي يضمن تنفيذ الحذف في عامل واحد فقط
+    RETENTION_LOCK_FILE: str = Field(default="./teledroid-retention.lock", env="RETENTION_LOCK_FILE")
+    RETENTION_INTERVAL: float = Field(default=3600.0, env="RETENTION_INTERVAL")  # ثانية
+    RETENTION_BATCH_SIZE: int = Field(default=500, env="RETENTION_BATCH_SIZE")
+    RETENTION_COMMANDS_DAYS: int = Field(default=30, env="RETENTION_COMMANDS_DAYS")
+    RETENTION_COMMANDS_MAX_PER_DEVICE: int = Field(default=1000, env="RETENTION_COMMANDS_MAX_PER_DEVICE")
+    RETENTION_LOGS_DAYS: int = Field(default=90, env="RETENTION_LOGS_DAYS")
+    RETENTION_STATS_DAYS: int = Field(default=7, env="RETENTION_STATS_DAYS")
+    RETENTION_STATS_MAX_PER_DEVICE: int = Field(default=20000, env="RETENTION_STATS_MAX_PER_DEVICE")
+    RETENTION_ROLLUP_MINUTE_DAYS: int = Field(default=7, env="RETENTION_ROLLUP_MINUTE_DAYS")
+    RETENTION_ROLLUP_HOUR_DAYS: int = Field(default=180, env="RETENTION_ROLLUP_HOUR_DAYS")
+    RETENTION_AUTH_TOKENS_HOURS: int = Field(default=24, env="RETENTION_AUTH_TOKENS_HOURS")
+    # مجلد أرشفة الصفوف المحذوفة (فارغ = بدون أرشفة)
+    RETENTION_ARCHIVE_DIR: str = Field(default="", env="RETENTION_ARCHIVE_DIR")
+    # عدد الصفحات المعادة لنظام الملفات في كل تشغيل (SQLite)
+    RETENTION_VACUUM_PAGES: int = Field(default=1000, env="RETENTION_VACUUM_PAGES")
 
     # إعدادات Webhook
     WEBHOOK_URL: str = Field(default="", env="WEBHOOK_URL")
@@ -0,0 +1,120 @@
+"""
+مدير اتصالات WebSocket للأجهزة
+يحتفظ بقناة واحدة لكل جهاز يدفع عبرها الخادم الأوامر الجديدة،
+مع طابور إرسال محدود الحجم (backpressure) لكل اتصال
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket
+
+# أقصى عدد معرفات أوامر مُرسلة يُتذكر لكل اتصال (الأقدم يُنسى أولاً)
+SENT_IDS_LIMIT = 1000
+
+
+class DeviceConnection:
+    """اتصال WebSocket واحد لجهاز مع طابور الإرسال الخاص به"""
+
+    def __init__(self, device_id: str, websocket: WebSocket, queue_size: int):
+        self.device_id = device_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # الأوامر المدفوعة ولم تصل نتيجتها بعد: المعرف -> مهلة الحجز التي دُفع بها
+        # (dict مرتب لإسقاط الأقدم عند الامتلاء)
+        self.sent_command_ids: Dict[int, Optional[datetime]] = {}
+        self.dropped = 0
+
+    def offer(self, message: Dict[str, Any]) -> bool:
+        """وضع رسالة في طابور الإرسال دون انتظار، وإرجاع False إذا كان ممتلئاً"""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    def mark_sent(self, command_id: int, lease_expires_at: Optional[datetime] = None):
+        """تذكر أمر مدفوع وحجزه مع إبقاء السجل ضمن SENT_IDS_LIMIT"""
+        self.sent_command_ids.pop(command_id, None)
+        self.sent_command_ids[command_id] = lease_expires_at
+        if len(self.sent_command_ids) > SENT_IDS_LIMIT:
+            del self.sent_command_ids[next(iter(self.sent_command_ids))]
+
+    async def writer(self):
+        """إرسال الرسائل من الطابور إلى الجهاز بالترتيب"""
+        while True:
+            message = await self.queue.get()
+            await self.websocket.send_json(message)
+
+
+class ConnectionManager:
+    """سجل اتصالات الأجهزة النشطة"""
+
+    def __init__(self):
+        self._connections: Dict[str, DeviceConnection] = {}
+
+    def register(self, device_id: str, websocket: WebSocket, queue_size: int) -> DeviceConnection:
+        """تسجيل اتصال جديد للجهاز (يحل محل أي اتصال سابق)"""
+        connection = DeviceConnection(device_id, websocket, queue_size)
+        self._connections[device_id] = connection
+        return connection
+
+    def unregister(self, connection: DeviceConnection):
+        """إزالة الاتصال إذا كان لا يزال الاتصال الحالي للجهاز"""
+        if self._connections.get(connection.device_id) is connection:
+            del self._connections[connection.device_id]
+
+    def get(self, device_id: str) -> Optional[DeviceConnection]:
+        """الحصول على اتصال الجهاز إن وجد"""
+        return self._connections.get(device_id)
+
+    def is_connected(self, device_id: str) -> bool:
+        """هل الجهاز متصل عبر WebSocket"""
+        return device_id in self._connections
+
+    def push_command(
+        self,
+        device_id: str,
+        command: Dict[str, Any],
+        lease_expires_at: Optional[datetime] = None
+    ) -> bool:
+        """
+        دفع أمر للجهاز عبر WebSocket
+
+        التكرار يُتجاهل ضمن نفس الحجز فقط: الأمر الذي انتهت مهلة حجزه وأعيد حجزه
+        (مثلاً لأن الجهاز أسقط الرسالة) يحمل مهلة جديدة فيُرسل مرة أخرى
+
+        Returns:
+            bool: False إذا لم يكن الجهاز متصلاً أو كان طابوره ممتلئاً،
+            وفي هذه الحالة يبقى الأمر معلقاً ويستلمه الجهاز عبر REST
+        """
+        connection = self._connections.get(device_id)
+        if connection is None:
+            return False
+
+        sent = connection.sent_command_ids
+        if command["id"] in sent and sent[command["id"]] == lease_expires_at:
+            return True
+
+        if not connection.offer({"type": "command", "command": command}):
+            return False
+
+        connection.mark_sent(command["id"], lease_expires_at)
+        return True
+
+    def acknowledge(self, device_id: str, command_id: int):
+        """نسيان أمر وصلت نتيجته من الجهاز"""
+        connection = self._connections.get(device_id)
+        if connection is not None:
+            connection.sent_command_ids.pop(command_id, None)
+
+    @property
+    def connected_count(self) -> int:
+        """عدد الأجهزة المتصلة حالياً"""
+        return len(self._connections)
+
+
+# إنشاء كائن المدير
+connection_manager = ConnectionManager()
@@ -0,0 +1,305 @@
+"""
+تخزين الملفات المرفوعة
+يكتب الملفات على دفعات إلى ملف مؤقت مع حساب SHA-256 في نفس المرور،
+ثم ينقلها بشكل ذري إلى مخزن كتل يُعنون المحتوى ببصمته (كل محتوى يُخزن مرة واحدة)،
+ويتحقق من ETag لطلبات التنزيل (Range يتولاه FileResponse في Starlette)
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import re
+import uuid
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from config import settings
+
+# حجم الدفعة عند القراءة من الطلب والكتابة على القرص
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# صيغة بصمة SHA-256 كما تُخزن (أحرف صغيرة)؛ أي قيمة أخرى قد تخرج عن مجلد المخزن
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+# هامش لترويسات multipart عند مقارنة حجم جسم الطلب بالحد الأقصى لحجم الملف
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class FileTooLargeError(Exception):
+    """حجم الملف تجاوز الحد المسموح"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"حجم الملف يتجاوز الحد المسموح ({max_size} بايت)")
+        self.max_size = max_size
+
+
+class UploadBusyError(Exception):
+    """جلسة الرفع تستقبل دفعة أخرى حالياً (في هذه العملية أو غيرها)"""
+
+
+class RequestBodyTooLarge(Exception):
+    """جسم الطلب تجاوز الحد أثناء استلامه"""
+
+
+class UploadSizeLimitMiddleware:
+    """فرض حد أقصى لحجم جسم طلبات الرفع أثناء استلامه (413)
+
+    Content-Length يُرفض مبكراً إن وُجد، لكن الطلبات المجزأة (chunked) لا تحمله،
+    لذا تُعد البايتات في receive ويُقطع الطلب فور تجاوز الحد، قبل أن يكمل
+    Starlette حفظ جسم multipart في ملف مؤقت. رد التطبيق (400 من تحليل الجسم) يُستبدل بـ 413
+    """
+
+    def __init__(self, app, path_prefix: str, max_body: int):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body:
+            return await self._reject(scope, receive, send)
+
+        received = 0
+        exceeded = started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    exceeded = True
+                    raise RequestBodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestBodyTooLarge:
+            pass
+
+        if exceeded and not started:
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": "حجم الملف يتجاوز الحد المسموح"})
+        await response(scope, receive, send)
+
+
+def safe_filename(filename: str) -> str:
+    """إزالة أي مسار من اسم الملف لمنع الكتابة خارج مجلد الرفع"""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name if name not in ("", ".", "..") else "file"
+
+
+def temp_path_for(path: str) -> str:
+    """مسار مؤقت فريد في نفس المجلد (لضمان أن النقل النهائي ذري)"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex}.part")
+
+
+async def save_upload(upload: UploadFile, path: str, max_size: int) -> Tuple[int, str]:
+    """
+    حفظ ملف مرفوع على دفعات مع فرض الحد الأقصى للحجم
+
+    Args:
+        upload: الملف المرفوع
+        path: المسار النهائي للملف
+        max_size: الحد الأقصى للحجم بالبايت
+
+    Returns:
+        Tuple[int, str]: حجم الملف وبصمة SHA-256 الخاصة به
+
+    Raises:
+        FileTooLargeError: إذا تجاوز الملف الحد الأقصى (لا يُترك أي ملف جزئي)
+    """
+    temp_path = temp_path_for(path)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+
+                digest.update(chunk)
+                await out.write(chunk)
+
+        await aiofiles.os.replace(temp_path, path)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return size, digest.hexdigest()
+
+
+async def append_stream(path: str, chunks: AsyncIterator[bytes], max_size: int) -> int:
+    """
+    إلحاق دفعات بنهاية ملف جزئي دون تجاوز max_size
+
+    Returns:
+        int: حجم الملف بعد الإلحاق
+
+    Raises:
+        FileTooLargeError: إذا كانت البيانات ستتجاوز max_size (لا تُكتب الدفعة المتجاوزة)
+    """
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    async with aiofiles.open(path, "ab") as out:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+
+            if size + len(chunk) > max_size:
+                raise FileTooLargeError(max_size)
+
+            await out.write(chunk)
+            size += len(chunk)
+
+    return size
+
+
+def _hash_file(path: str) -> Tuple[int, str]:
+    """حساب الحجم وبصمة SHA-256 لملف على القرص"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+async def hash_file(path: str) -> Tuple[int, str]:
+    """حساب الحجم والبصمة خارج حلقة الأحداث"""
+    return await asyncio.to_thread(_hash_file, path)
+
+
+class BlobStore:
+    """مخزن كتل يُعنون المحتوى بـ SHA-256: root/ab/cd/<sha256>"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.incoming_dir = os.path.join(root, "incoming")
+
+    def setup(self):
+        """إنشاء مجلدات المخزن"""
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        """مسار الكتلة على القرص
+
+        Raises:
+            ValueError: إذا لم تكن القيمة بصمة SHA-256 صالحة
+        """
+        if not isinstance(sha256, str) or not SHA256_PATTERN.fullmatch(sha256):
+            raise ValueError(f"بصمة SHA-256 غير صالحة: {sha256!r}")
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def resolve(self, sha256: str) -> Optional[str]:
+        """المسار الحقيقي لكتلة موجودة، أو None إذا لم تكن بصمة صالحة أو خرج المسار
+        (بعد حل الروابط الرمزية) عن مجلد المخزن أو لم يكن ملفاً"""
+        try:
+            path = os.path.realpath(self.path_for(sha256))
+        except ValueError:
+            return None
+
+        root = os.path.realpath(self.root)
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return None
+        return path
+
+    def incoming_path(self, name: str) -> str:
+        """مسار ملف جزئي قيد الاستلام"""
+        return os.path.join(self.incoming_dir, f"{name}.part")
+
+    async def create_incoming(self, name: str):
+        """إنشاء ملف جزئي فارغ لجلسة رفع جديدة"""
+        async with aiofiles.open(self.incoming_path(name), "ab"):
+            pass
+
+    def lock_incoming(self, name: str) -> int:
+        """أخذ قفل ملف (flock) حصري غير حاجز على الملف الجزئي وإرجاع واصفه
+
+        القفل على الملف نفسه فيمنع دفعتين متزامنتين لنفس الجلسة من أي عملية أو عامل
+        على نفس القرص، ويتحرر بـ unlock_incoming أو تلقائياً عند انتهاء العملية
+
+        Raises:
+            FileNotFoundError: الملف الجزئي غير موجود (الجلسة اكتملت أو حُذفت)
+            UploadBusyError: طلب آخر يحمل القفل
+        """
+        fd = os.open(self.incoming_path(name), os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise UploadBusyError(name)
+        return fd
+
+    @staticmethod
+    def unlock_incoming(fd: int):
+        """تحرير قفل الملف الجزئي"""
+        os.close(fd)
+
+    def exists(self, sha256: str) -> bool:
+        """هل المحتوى مخزن مسبقاً"""
+        return os.path.exists(self.path_for(sha256))
+
+    async def put(self, temp_path: str, sha256: str) -> bool:
+        """
+        نقل ملف مؤقت إلى المخزن تحت بصمته
+
+        Returns:
+            bool: True إذا خُزن محتوى جديد، False إذا كان موجوداً مسبقاً (يُحذف المؤقت)
+        """
+        target = self.path_for(sha256)
+
+        if os.path.exists(target):
+            await aiofiles.os.remove(temp_path)
+            return False
+
+        await aiofiles.os.makedirs(os.path.dirname(target), exist_ok=True)
+        await aiofiles.os.replace(temp_path, target)
+        return True
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """هل يطابق ترويس If-None-Match قيمة ETag (مقارنة ضعيفة كما في RFC 9110)"""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+# إنشاء كائن مخزن الكتل
+blob_store = BlobStore(settings.BLOB_DIR or os.path.join(settings.UPLOAD_DIR, "blobs"))
@@ -0,0 +1,193 @@
+"""
+مصنف النوايا المحلي
+يقع بين التحليل المباشر ونموذج اللغة: TF-IDF على مقاطع الأحرف (char n-grams) وأقرب مركز
+(nearest centroid) بعمليات NumPy، مدرب على أمثلة لكل أمر من أوامر COMMAND_PROMPT.
+الرسائل التي يثق بها (تشابه فوق العتبة وفارق كافٍ عن النية التالية) لا تغادر الخادم،
+والباقي يُصعّد لنموذج اللغة
+"""
+
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from llm_cache import normalize_message
+
+# أطوال مقاطع الأحرف
+NGRAM_RANGE = (2, 4)
+
+# توحيد أشكال الحروف العربية التي يكتبها المستخدمون بطرق مختلفة
+_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"})
+_NON_WORD = re.compile(r"[^\w/]+")
+
+# أمثلة التدريب: الإجراء ← (نوع الأمر، عبارات)
+EXAMPLES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "list_files": ("file", (
+        "اعرض الملفات", "عرض الملفات الموجودة", "ما هي الملفات في المجلد", "شو الملفات عندي",
+        "اظهر محتويات المجلد", "ماذا يوجد في مجلد التنزيلات", "قائمة الملفات", "افتح مجلد الصور",
+        "وريني الملفات", "محتوى الذاكرة الداخلية", "list files", "show my files",
+        "what files are in download", "show folder contents", "browse the sdcard", "ls /sdcard",
+        "what's inside documents", "open the pictures folder",
+    )),
+    "create_folder": ("file", (
+        "انشئ مجلد جديد", "اعمل مجلد باسم", "سوي مجلد", "مجلد جديد اسمه", "اضف مجلد في التنزيلات",
+        "انشاء مجلد للصور", "create a folder", "make a new folder", "new directory called backup",
+        "mkdir projects", "add a folder named work",
+    )),
+    "delete_file": ("file", (
+        "احذف الملف", "امسح هذا الملف", "ازل الملف من التنزيلات", "شيل الملف", "حذف صورة",
+        "امسح الصور القديمة", "delete the file", "remove this file", "erase report.pdf",
+        "rm old log", "get rid of the photo", "trash that document",
+    )),
+    "upload_file": ("file", (
+        "ارفع الملف", "ارسل الملف الى السيرفر", "رفع ملف من الهاتف", "ابعث لي الملف", "ارسل لي صورة",
+        "حمل الملف على الخادم", "upload the file", "send me the file", "upload photo to server",
+        "share this file with me", "send the document from my phone",
+    )),
+    "download_file": ("file", (
+        "نزل الملف", "تنزيل ملف على الهاتف", "حمل الملف الى الجوال", "انقل هذا الملف لهاتفي",
+        "ضع الملف في التنزيلات", "download the file", "save this file to my phone",
+        "download attachment to the device", "put the file on my mobile", "fetch this file to the phone",
+    )),
+    "device_status": ("system", (
+        "حالة الجهاز", "كيف حال الهاتف", "وضع الجوال", "اعطني تقرير عن الجهاز", "هل الجهاز يعمل",
+        "معلومات الجهاز كاملة", "ملخص حالة الموبايل", "device status", "how is my phone doing",
+        "phone status report", "is the device online", "full device overview", "check my mobile",
+    )),
+    "battery_info": ("system", (
+        "البطاريه", "كم نسبة البطارية", "كم الشحن", "هل الهاتف يشحن", "مستوى البطارية",
+        "باقي كم شحن", "حرارة البطارية", "battery level", "how much charge is left",
+        "is it charging", "battery percentage", "power status", "how much juice left",
+    )),
+    "storage_info": ("system", (
+        "مساحة التخزين", "كم المساحة المتبقية", "الذاكرة ممتلئة", "كم باقي مساحة", "سعة الذاكرة",
+        "المساحة الفارغة في الهاتف", "storage space", "how much space is left", "free space",
+        "is my storage full", "disk usage", "memory usage of the phone",
+    )),
+    "network_info": ("system", (
+        "حالة الشبكة", "هل الانترنت شغال", "سرعة النت", "الواي فاي متصل", "نوع الاتصال",
+        "بيانات الجوال", "قوة الاشارة", "network status", "am i connected to wifi",
+        "internet speed", "signal strength", "is the connection working", "mobile data status",
+    )),
+    "list_scheduled_tasks": ("task", (
+        "اعرض المهام المجدولة", "ما هي مهامي", "المهام القادمة", "قائمة المهام", "شو المهام المبرمجة",
+        "المواعيد المجدولة", "list scheduled tasks", "show my tasks", "what tasks are scheduled",
+        "upcoming jobs", "my scheduled jobs", "task list",
+    )),
+    "create_task": ("task", (
+        "انشئ مهمة", "جدول مهمة يومية", "ذكرني كل يوم", "اضف مهمة مجدولة", "شغل هذا الامر كل ساعة",
+        "اعمل تذكير", "برمج مهمة اسبوعية", "create a task", "schedule a daily job",
+        "remind me every morning", "run this every hour", "add a scheduled task", "set a reminder",
+    )),
+    "delete_task": ("task", (
+        "احذف المهمة", "الغ المهمة المجدولة", "امسح التذكير", "اوقف المهمة", "ازل المهمة رقم",
+        "الغاء الجدولة", "delete the task", "cancel scheduled task", "remove the reminder",
+        "stop the daily job", "unschedule this task",
+    )),
+}
+
+
+def _prepare(message: str) -> str:
+    """تطبيع النص للتصنيف: تطبيع الذاكرة المؤقتة ثم توحيد الحروف وفواصل الكلمات"""
+    text = normalize_message(message).translate(_LETTERS)
+    return _NON_WORD.sub(" ", text)
+
+
+def char_ngrams(message: str) -> Dict[str, int]:
+    """تكرار مقاطع الأحرف داخل الكلمات (مع المسافات المحيطة كحدود)"""
+    counts: Dict[str, int] = {}
+    for word in _prepare(message).split():
+        padded = f" {word} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class IntentClassifier:
+    """TF-IDF (tf لوغاريتمي، idf منعّم، تطبيع L2) وأقرب مركز بتشابه جيب التمام
+
+    threshold: أقل تشابه مع مركز النية الأولى
+    margin: أقل فارق بين النية الأولى والثانية (عبارة تقع بين نيتين تُصعّد)
+    """
+
+    def __init__(
+        self,
+        examples: Dict[str, Tuple[str, Sequence[str]]] = EXAMPLES,
+        threshold: float = 0.25,
+        margin: float = 0.05
+    ):
+        self.threshold = threshold
+        self.margin = margin
+        self.actions: List[str] = list(examples)
+        self.command_types: List[str] = [examples[action][0] for action in self.actions]
+
+        documents = [(row, char_ngrams(text)) for row, action in enumerate(self.actions)
+                     for text in examples[action][1]]
+
+        # المفردات ووزن idf
+        document_frequency: Dict[str, int] = {}
+        for _, counts in documents:
+            for gram in counts:
+                document_frequency[gram] = document_frequency.get(gram, 0) + 1
+        self.vocabulary = {gram: index for index, gram in enumerate(sorted(document_frequency))}
+        total = len(documents)
+        self.idf = np.array(
+            [math.log((1 + total) / (1 + document_frequency[gram])) + 1 for gram in sorted(document_frequency)],
+            dtype=np.float32
+        )
+
+        # المراكز: متوسط متجهات أمثلة كل نية بعد تطبيعها، ثم تطبيع المتوسط
+        centroids = np.zeros((len(self.actions), len(self.vocabulary)), dtype=np.float32)
+        for row, counts in documents:
+            indices, values = self._vectorize(counts)
+            centroids[row, indices] += values
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.maximum(norms, 1e-12)
+        self.counters = {"classified": 0, "escalated": 0}
+
+    def _vectorize(self, counts: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """متجه متفرق (فهارس، قيم) بطول 1؛ المقاطع خارج المفردات تدخل في الطول فقط"""
+        known = [(self.vocabulary[gram], count) for gram, count in counts.items() if gram in self.vocabulary]
+        if not known:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        indices = np.fromiter((index for index, _ in known), dtype=np.intp, count=len(known))
+        tf = np.fromiter((count for _, count in known), dtype=np.float32, count=len(known))
+        values = (1 + np.log(tf)) * self.idf[indices]
+        # التطبيع على كل مقاطع الرسالة: الكلمات الغريبة تخفض التشابه بدلاً من أن تُهمل
+        unknown = sum(1 for gram in counts if gram not in self.vocabulary)
+        norm = math.sqrt(float(values @ values) + unknown * float(self.idf.max()) ** 2)
+        return indices, values / norm
+
+    def scores(self, message: str) -> np.ndarray:
+        """تشابه جيب التمام مع مركز كل نية"""
+        indices, values = self._vectorize(char_ngrams(message))
+        if not len(indices):
+            return np.zeros(len(self.actions), dtype=np.float32)
+        return self.centroids[:, indices] @ values
+
+    def classify(self, message: str) -> Optional[Tuple[str, str, float]]:
+        """(الإجراء، نوع الأمر، التشابه) إذا تجاوزت الثقة العتبة، وإلا None للتصعيد"""
+        scores = self.scores(message)
+        second, best = np.argpartition(scores, -2)[-2:]
+        if scores[second] > scores[best]:
+            second, best = best, second
+
+        confidence = float(scores[best])
+        if confidence < self.threshold or confidence - float(scores[second]) < self.margin:
+            self.counters["escalated"] += 1
+            return None
+
+        self.counters["classified"] += 1
+        return self.actions[best], self.command_types[best], confidence
+
+    def stats(self) -> Dict:
+        return {
+            "intents": len(self.actions),
+            "vocabulary": len(self.vocabulary),
+            "threshold": self.threshold,
+            **self.counters
+        }
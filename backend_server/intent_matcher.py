@@ -0,0 +1,146 @@
+"""
+مطابق النوايا للأوامر النصية
+يحوّل أنماط الأوامر المباشرة إلى كلمات مفتاحية تُبحث كلها في مرور واحد على الرسالة
+بتعبير منتظم واحد مجمع، ثم يختار النية حسب الأولوية ويستخرج المعلمات من نفس المرور
+بدلاً من تنفيذ re.search لكل نمط على حدة
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# النوايا بترتيب الأولوية: (الإجراء، نوع الأمر، كلمات الفعل، كلمات الموضوع)
+# النية تطابق إذا ظهرت كلمة فعل ثم كلمة موضوع بعدها، أو كلمة فعل فقط إذا لم يكن لها موضوع
+INTENTS: Tuple[Tuple[str, str, Tuple[str, ...], Tuple[str, ...]], ...] = (
+    # أوامر الملفات
+    ("list_files", "file", ("أعرض", "عرض", "list"), ("ملفات", "files")),
+    ("create_folder", "file", ("أنشئ", "إنشاء", "create"), ("مجلد", "folder")),
+    ("delete_file", "file", ("حذف", "delete"), ("ملف", "file")),
+    ("upload_file", "file", ("رفع", "upload"), ("ملف",)),
+    ("download_file", "file", ("تنزيل", "download"), ("ملف",)),
+    # أوامر النظام
+    ("device_status", "system", ("حالة", "status"), ("جهاز", "phone", "mobile")),
+    ("battery_info", "system", ("بطارية", "battery"), ()),
+    ("storage_info", "system", ("تخزين", "storage", "memory"), ()),
+    ("network_info", "system", ("شبكة", "network", "إنترنت"), ()),
+    ("system_info", "system", ("معلومات", "info"), ("النظام", "system")),
+    # أوامر المهام
+    ("list_scheduled_tasks", "task", ("مهام", "tasks"), ("مجدولة", "scheduled")),
+    ("create_task", "task", ("أنشئ", "إنشاء"), ("مهمة", "task")),
+    ("delete_task", "task", ("حذف", "delete"), ("مهمة", "task")),
+)
+
+# كلمات تسبق المعلمات: المسار ("في Download") والاسم ("اسم Backup")
+PATH_MARKERS = ("في", "to", "from", "/")
+NAME_MARKERS = ("اسم", "name")
+
+# القيمة التي تلي كلمة المعلمة
+PARAMETER_VALUES = {
+    "path": re.compile(r"\s*([/\w\s]+)"),
+    "name": re.compile(r"\s*[:\-]?\s*(\w+)"),
+}
+
+
+class IntentMatcher:
+    """مطابق مجمع مرة واحدة لقائمة نوايا بكلماتها المفتاحية
+
+    كل كلمة مفتاحية تحمل أقنعة بتات (bit i = النية i في الأولوية): النوايا التي هي
+    فعل لها، والتي هي موضوع لها، والتي تكفي وحدها. الكلمات تظهر في المسح بالترتيب
+    ولا تتداخل، فالموضوع يطابق نيته إذا سبقه فعلها، وأقل بت في النتيجة هو الأعلى أولوية
+
+    الفرق الوحيد عن الأنماط المنفصلة: كلمة تبدأ داخل كلمة مطابقة قبلها وتتجاوز نهايتها
+    لا تُحسب ("في" داخل "ملفي")
+    """
+
+    def __init__(
+        self,
+        intents: Sequence[Tuple[str, str, Tuple[str, ...], Tuple[str, ...]]] = INTENTS,
+        path_markers: Sequence[str] = PATH_MARKERS,
+        name_markers: Sequence[str] = NAME_MARKERS
+    ):
+        self.intents = tuple(intents)
+
+        masks: Dict[str, List[int]] = {}
+        for bit, (_, _, verbs, objects) in enumerate(self.intents):
+            for word in verbs:
+                masks.setdefault(word, [0, 0, 0])[0 if objects else 2] |= 1 << bit
+            for word in objects:
+                masks.setdefault(word, [0, 0, 0])[1] |= 1 << bit
+
+        markers = {word: "path" for word in path_markers}
+        markers.update((word, "name") for word in name_markers)
+
+        # الكلمة الأطول تُلتقط أولاً، فتُضاف إليها أقنعة ومواضع الكلمات الموجودة داخلها
+        # ("ملفات" تحوي "ملف"، و"storage" تحوي "to" كما كانت الأنماط المنفصلة ترى ذلك)
+        self._keywords: Dict[str, Tuple[int, int, int, Tuple[Tuple[str, int], ...]]] = {}
+        for word in set(masks) | set(markers):
+            verb_mask = object_mask = single_mask = 0
+            found_markers = []
+            for offset in range(len(word)):
+                for inner in masks:
+                    if word.startswith(inner, offset):
+                        verb_mask |= masks[inner][0]
+                        object_mask |= masks[inner][1]
+                        single_mask |= masks[inner][2]
+                for inner, key in markers.items():
+                    if word.startswith(inner, offset):
+                        found_markers.append((key, offset + len(inner)))
+            self._keywords[word] = (verb_mask, object_mask, single_mask, tuple(found_markers))
+
+        # سطر جديد يفصل الفعل عن موضوعه (النقطة في الأنماط السابقة لا تطابق \n)
+        alternation = "|".join(re.escape(word) for word in sorted(self._keywords, key=len, reverse=True))
+        self._scan = re.compile(f"{alternation}|\n")
+
+    def match(self, message: str) -> Optional[Dict]:
+        """النية الأعلى أولوية في الرسالة (بعد تحويلها لأحرف صغيرة) مع معلماتها، أو None"""
+        matched, markers = self._scan_message(message)
+        if not matched:
+            return None
+
+        action, command_type, _, _ = self.intents[(matched & -matched).bit_length() - 1]
+        return {
+            "action": action,
+            "command_type": command_type,
+            "parameters": self._parameters(message, markers),
+            "success": True
+        }
+
+    def parameters(self, message: str) -> Dict[str, str]:
+        """المعلمات فقط (للنوايا التي يحددها مصنف آخر)"""
+        _, markers = self._scan_message(message)
+        return self._parameters(message, markers)
+
+    def _scan_message(self, message: str) -> Tuple[int, List[Tuple[str, int]]]:
+        """مرور واحد: قناع النوايا المطابقة ومواضع كلمات المعلمات"""
+        keywords = self._keywords
+        verbs_seen = matched = 0
+        markers: List[Tuple[str, int]] = []
+
+        for found in self._scan.finditer(message):
+            word = found.group()
+            if word == "\n":
+                verbs_seen = 0
+                continue
+
+            verb_mask, object_mask, single_mask, word_markers = keywords[word]
+            matched |= single_mask | (object_mask & verbs_seen)
+            verbs_seen |= verb_mask
+            if word_markers:
+                start = found.start()
+                markers.extend((key, start + end) for key, end in word_markers)
+
+        return matched, markers
+
+    @staticmethod
+    def _parameters(message: str, markers: List[Tuple[str, int]]) -> Dict[str, str]:
+        """المعلمات بعد أول كلمة مسار وأول كلمة اسم تليها قيمة"""
+        params = {}
+
+        for key, end in markers:
+            if key in params:
+                continue
+            value = PARAMETER_VALUES[key].match(message, end)
+            if value:
+                params[key] = value.group(1).strip()
+
+        # ترتيب المفاتيح كما كان: المسار ثم الاسم
+        return {key: params[key] for key in PARAMETER_VALUES if key in params}
@@ -0,0 +1,226 @@
+"""
+ذاكرة مؤقتة لنتائج تحليل الأوامر بنموذج اللغة
+المستخدمون يكررون نفس الصياغات ("اعرض حالة البطارية")، فنتيجة التحليل الناجحة تُحفظ
+بمفتاح من النص بعد التطبيع واسم النموذج وبصمة التعليمات (system prompt):
+- طبقة محلية (LRU مع TTL) داخل العملية
+- طبقة SQLite دائمة تبقى بعد إعادة التشغيل وتشترك فيها العمليات على نفس الجهاز
+مع حد للحجم في الطبقتين، وعدادات إصابة وزمن ورموز (tokens) موفرة
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from config import settings
+
+# حذف المنتهي والأقدم من SQLite بعد كل هذا العدد من الإضافات
+PRUNE_EVERY = 100
+
+# التشكيل والتطويل لا يغيران معنى الأمر
+_DIACRITICS = re.compile(r"[\u064B-\u0652\u0670\u0640]")
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " .!?؟،,؛;:…"
+
+
+def normalize_message(message: str) -> str:
+    """النص بعد التطبيع: NFKC، أحرف صغيرة، بدون تشكيل، ومسافات وعلامات أطراف موحدة"""
+    text = unicodedata.normalize("NFKC", message).casefold()
+    text = _DIACRITICS.sub("", text)
+    text = _SPACES.sub(" ", text)
+    return text.strip(_EDGE_PUNCTUATION)
+
+
+def cache_key(model: str, prompt: str, message: str) -> str:
+    """مفتاح النتيجة: تغيير النموذج أو التعليمات يبطل النتائج السابقة تلقائياً"""
+    prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()[:16]
+    raw = f"{model}\0{prompt_hash}\0{normalize_message(message)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LLMCache:
+    """ذاكرة بطبقتين: محلية ثم SQLite ثم النموذج عند الإخفاق
+
+    القيم تُحفظ نصاً (JSON) وتُعاد نسخة جديدة في كل إصابة، فتعديل المستدعي للنتيجة
+    لا يغير المخزن. كل عمليات SQLite تتم في خيط واحد مخصص فلا تحجز حلقة الأحداث
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: str = "", db_ttl: float = 0, db_max_rows: int = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.db_ttl = db_ttl
+        self.db_max_rows = db_max_rows
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache") if path else None
+        self._puts = 0
+        self.counters = {
+            "local_hits": 0, "db_hits": 0, "misses": 0, "stores": 0,
+            "db_evictions": 0, "db_errors": 0, "saved_seconds": 0.0, "saved_tokens": 0
+        }
+
+    async def get(self, model: str, prompt: str, message: str) -> Optional[Dict]:
+        """النتيجة المحفوظة أو None"""
+        key = cache_key(model, prompt, message)
+
+        entry = self._get_local(key)
+        if entry is not None:
+            self.counters["local_hits"] += 1
+        elif self._executor is not None:
+            try:
+                entry = await self._in_thread(self._db_get, key)
+            except Exception:
+                self.counters["db_errors"] += 1
+            if entry is not None:
+                self.counters["db_hits"] += 1
+                raw, latency, tokens, expires_at = entry
+                entry = raw, latency, tokens
+                self._set_local(key, entry, min(self.ttl, expires_at - time.time()))
+
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+
+        raw, latency, tokens = entry
+        self.counters["saved_seconds"] += latency
+        self.counters["saved_tokens"] += tokens
+        return json.loads(raw)
+
+    async def put(self, model: str, prompt: str, message: str, result: Dict, latency: float, tokens: int):
+        """حفظ نتيجة تحليل ناجح مع زمنها ورموزها (لحساب ما توفره الإصابات)"""
+        key = cache_key(model, prompt, message)
+        raw = json.dumps(result, ensure_ascii=False)
+        self._set_local(key, (raw, latency, tokens), self.ttl)
+        self.counters["stores"] += 1
+
+        if self._executor is not None:
+            try:
+                await self._in_thread(self._db_put, key, model, normalize_message(message), raw, latency, tokens)
+            except Exception:
+                self.counters["db_errors"] += 1
+
+    def _get_local(self, key: str) -> Optional[tuple]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: tuple, ttl: float):
+        self._local[key] = (time.monotonic() + ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # ---------- طبقة SQLite (تُستدعى في خيط الذاكرة فقط) ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, message TEXT NOT NULL,"
+                " result TEXT NOT NULL, latency REAL NOT NULL, tokens INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL,"
+                " last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used)")
+            db.commit()
+            self._db = db
+            self._prune()
+        return self._db
+
+    def _db_get(self, key: str) -> Optional[tuple]:
+        db = self._connect()
+        now = time.time()
+        row = db.execute(
+            "SELECT result, latency, tokens, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+            (key, now)
+        ).fetchone()
+        if row is not None:
+            db.execute("UPDATE llm_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            db.commit()
+        return row
+
+    def _db_put(self, key: str, model: str, message: str, raw: str, latency: float, tokens: int):
+        db = self._connect()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO llm_cache"
+            " (key, model, message, result, latency, tokens, created_at, expires_at, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, model, message, raw, latency, tokens, now, now + self.db_ttl, now)
+        )
+        db.commit()
+
+        self._puts += 1
+        if self._puts % PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self):
+        """حذف المنتهي، ثم الأقل استخداماً فوق db_max_rows"""
+        db = self._db
+        removed = db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        if self.db_max_rows:
+            extra = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.db_max_rows
+            if extra > 0:
+                removed += db.execute(
+                    "DELETE FROM llm_cache WHERE key IN"
+                    " (SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                    (extra,)
+                ).rowcount
+        db.commit()
+        self.counters["db_evictions"] += removed
+
+    def _close_db(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # ----------------------------------------------------------------
+
+    def stats(self) -> Dict:
+        """عدادات الإصابة والإخفاق ونسبة الإصابة وما وفرته الإصابات"""
+        hits = self.counters["local_hits"] + self.counters["db_hits"]
+        total = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "saved_seconds": round(self.counters["saved_seconds"], 3),
+            "size": len(self._local),
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+    async def close(self):
+        """إغلاق ملف SQLite"""
+        if self._executor is not None:
+            await self._in_thread(self._close_db)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# إنشاء كائن الذاكرة المؤقتة
+llm_cache = LLMCache(
+    max_size=settings.LLM_CACHE_SIZE,
+    ttl=settings.LLM_CACHE_TTL,
+    path=settings.LLM_CACHE_PATH,
+    db_ttl=settings.LLM_CACHE_DB_TTL,
+    db_max_rows=settings.LLM_CACHE_DB_MAX_ROWS
+)
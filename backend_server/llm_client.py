@@ -0,0 +1,199 @@
+"""
+عميل نموذج اللغة
+يغلّف AsyncOpenAI بحد أقصى للطلبات المتزامنة (Semaphore)، ومهلة لكل محاولة،
+وإعادة محاولة بتأخير أُسّي عشوائي (jitter)، وقاطع دائرة (circuit breaker) يوقف
+الطلبات مؤقتاً عند تعطل المزود فيعود المحرك للتحليل المباشر بدلاً من الانتظار
+"""
+
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import openai
+from openai import AsyncOpenAI
+
+from config import settings
+
+
+class LLMUnavailable(Exception):
+    """المزود غير متاح: القاطع مفتوح أو فشلت كل المحاولات"""
+
+
+class CircuitBreaker:
+    """قاطع دائرة بثلاث حالات: closed ← open بعد عدد من الإخفاقات المتتالية،
+    ثم half_open بعد reset_timeout حيث يُسمح بطلب تجريبي واحد يقرر الإغلاق أو إعادة الفتح
+    (الطلب التجريبي الذي لم يُبلغ عن نتيجته خلال reset_timeout يُعتبر ضائعاً)
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+        self.counters = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """هل يُسمح بطلب الآن"""
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.reset_timeout):
+            self._probe_at = now
+            return True
+        self.counters["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_at is not None or (self.opened_at is None and self.failures >= self.threshold):
+            self.counters["opened"] += 1
+            self.opened_at = time.monotonic()
+        self._probe_at = None
+
+    def stats(self) -> Dict:
+        return {"state": self.state, "failures": self.failures, **self.counters}
+
+
+class LLMClient:
+    """طلبات chat.completions غير حاجزة لحلقة الأحداث"""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: str = "",
+        max_concurrency: int = 4,
+        timeout: float = 20.0,
+        max_retries: int = 2,
+        retry_base_delay: float = 0.5,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        # إعادة المحاولة هنا لا في مكتبة openai، حتى يحسبها القاطع ويُحرر الحد أثناء الانتظار
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            timeout=timeout,
+            max_retries=0
+        )
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.breaker = breaker or CircuitBreaker(settings.AI_BREAKER_THRESHOLD, settings.AI_BREAKER_RESET)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.counters = {"requests": 0, "succeeded": 0, "failed": 0, "retries": 0, "timeouts": 0, "tokens": 0}
+
+    async def complete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        """نص رد النموذج (انظر complete_with_usage)"""
+        text, _ = await self.complete_with_usage(messages, temperature, max_tokens)
+        return text
+
+    async def complete_with_usage(
+        self, messages: List[Dict], temperature: float, max_tokens: int
+    ) -> Tuple[str, int]:
+        """نص رد النموذج وعدد الرموز (tokens) المستهلكة
+
+        Raises:
+            LLMUnavailable: القاطع مفتوح أو استُنفدت المحاولات بأخطاء مؤقتة
+            openai.APIStatusError: خطأ دائم من المزود (مفتاح غير صالح، طلب غير صالح...)
+        """
+        if not self.breaker.allow():
+            raise LLMUnavailable("خدمة AI معطلة مؤقتاً")
+
+        self.counters["requests"] += 1
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    try:
+                        response = await asyncio.wait_for(
+                            self.client.chat.completions.create(
+                                model=self.model,
+                                messages=messages,
+                                temperature=temperature,
+                                max_tokens=max_tokens
+                            ),
+                            self.timeout
+                        )
+                    finally:
+                        self.in_flight -= 1
+            except Exception as e:
+                if not self._is_transient(e):
+                    # خطأ من جهة الطلب: المزود يعمل فلا يُحسب على القاطع
+                    self.breaker.record_success()
+                    self.counters["failed"] += 1
+                    raise
+
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["timeouts"] += 1
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    self.counters["failed"] += 1
+                    raise LLMUnavailable(f"تعذر الوصول لخدمة AI: {e}") from e
+
+                # full jitter: تأخير عشوائي حتى base * 2^attempt يوزع إعادة المحاولات
+                self.counters["retries"] += 1
+                await asyncio.sleep(random.uniform(0, self.retry_base_delay * 2 ** attempt))
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            self.counters["succeeded"] += 1
+            tokens = response.usage.total_tokens if response.usage else 0
+            self.counters["tokens"] += tokens
+            return response.choices[0].message.content or "", tokens
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """أخطاء تستحق إعادة المحاولة: المهلة والاتصال وتجاوز الحد وأخطاء الخادم 5xx"""
+        if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError,
+                              openai.RateLimitError, openai.InternalServerError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "breaker": self.breaker.stats(),
+            **self.counters
+        }
+
+    async def close(self):
+        await self.client.close()
+
+
+def create_llm_client() -> Optional[LLMClient]:
+    """العميل حسب الإعدادات، أو None إذا لم يُضبط مفتاح OpenAI"""
+    if not settings.OPENAI_API_KEY:
+        return None
+
+    return LLMClient(
+        api_key=settings.OPENAI_API_KEY,
+        model=settings.OPENAI_MODEL,
+        base_url=settings.OPENAI_BASE_URL,
+        max_concurrency=settings.AI_MAX_CONCURRENCY,
+        timeout=settings.AI_TIMEOUT,
+        max_retries=settings.AI_MAX_RETRIES,
+        retry_base_delay=settings.AI_RETRY_BASE_DELAY
+    )
@@ -0,0 +1,196 @@
+"""
+ذاكرة تخزين مؤقت لقراءات المستخدمين والأجهزة
+طبقة محلية (LRU مع TTL) داخل العملية وطبقة Redis اختيارية مشتركة بين العمليات،
+مع إبطال صريح عند التسجيل والربط وإلغاء الربط، وعدادات إصابة وإخفاق.
+مع Redis يُبث كل إبطال على قناة pub/sub فتحذف كل العمليات نسختها المحلية،
+والطبقة المحلية لا تُستخدم إلا والاشتراك قائم (وإلا قد تفوت العملية إبطالاً)
+"""
+
+import json
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from config import settings
+from redis_channel import RedisSubscriber
+
+# بادئة مفاتيح Redis
+REDIS_PREFIX = "lookup:"
+
+# قناة بث الإبطال بين العمليات (الرسالة هي المفتاح namespace:key)
+INVALIDATE_CHANNEL = "lookup:invalidate"
+
+# الحقول المخزنة لكل نوع (حقول الهوية فقط، لا حالة الاتصال المتغيرة)
+USER_FIELDS = ("id", "telegram_id", "username", "first_name", "last_name", "is_active", "is_admin")
+DEVICE_FIELDS = ("id", "device_id", "user_id", "device_name", "device_model", "android_version")
+
+_MISSING = object()
+
+
+def snapshot(row, fields) -> Optional[Dict]:
+    """نسخة قابلة للتسلسل من صف ORM (أو None)"""
+    if row is None:
+        return None
+    return {field: getattr(row, field) for field in fields}
+
+
+def as_record(data: Optional[Dict]) -> Optional[SimpleNamespace]:
+    """كائن للقراءة فقط بنفس أسماء حقول النموذج"""
+    return SimpleNamespace(**data) if data is not None else None
+
+
+class LookupCache:
+    """ذاكرة قراءة عبر (read-through) بطبقتين: محلية ثم Redis ثم قاعدة البيانات"""
+
+    def __init__(self, max_size: int, ttl: float, redis_ttl: int = 0, redis_client=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.redis = redis_client
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        # يزداد مع كل إبطال؛ القيمة المحملة لا تُخزن إذا حدث إبطال أثناء تحميلها
+        self._epoch = 0
+        self.counters = {"local_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+        self._subscriber = RedisSubscriber(
+            redis_client, INVALIDATE_CHANNEL, self._evict, on_subscribe=self._clear_local
+        ) if redis_client is not None else None
+
+    @property
+    def local_enabled(self) -> bool:
+        """الطبقة المحلية آمنة بلا Redis، أو مع اشتراك قائم في قناة الإبطال"""
+        return self._subscriber is None or self._subscriber.live
+
+    async def get(self, namespace: str, key, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """القيمة من الذاكرة، أو من loader عند الإخفاق (النتيجة None لا تُخزن)"""
+        cache_key = f"{namespace}:{key}"
+
+        value = self._get_local(cache_key) if self.local_enabled else _MISSING
+        if value is not _MISSING:
+            self.counters["local_hits"] += 1
+            return value
+
+        epoch = self._epoch
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(REDIS_PREFIX + cache_key)
+            except Exception:
+                self.counters["redis_errors"] += 1
+                raw = None
+
+            if raw is not None:
+                self.counters["redis_hits"] += 1
+                value = json.loads(raw)
+                if epoch == self._epoch and self.local_enabled:
+                    self._set_local(cache_key, value)
+                return value
+
+        self.counters["misses"] += 1
+        value = await loader()
+
+        if value is not None and epoch == self._epoch:
+            if self.local_enabled:
+                self._set_local(cache_key, value)
+            if self.redis is not None:
+                try:
+                    await self.redis.setex(
+                        REDIS_PREFIX + cache_key, self.redis_ttl,
+                        json.dumps(value, default=str)
+                    )
+                except Exception:
+                    self.counters["redis_errors"] += 1
+
+        return value
+
+    async def invalidate(self, namespace: str, key):
+        """حذف المفتاح من الطبقتين وبث الإبطال لبقية العمليات
+
+        يُستدعى بعد كل تعديل على البيانات المخزنة
+        """
+        cache_key = f"{namespace}:{key}"
+        self._evict(cache_key)
+
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(REDIS_PREFIX + cache_key)
+                    pipe.publish(INVALIDATE_CHANNEL, cache_key)
+                    await pipe.execute()
+            except Exception:
+                self.counters["redis_errors"] += 1
+
+    def _evict(self, cache_key: str):
+        """حذف المفتاح من الطبقة المحلية (إبطال محلي أو رسالة من عملية أخرى)"""
+        self._epoch += 1
+        self._local.pop(cache_key, None)
+
+    def _clear_local(self):
+        """تفريغ الطبقة المحلية عند (إعادة) الاشتراك: قد تكون فاتتها إبطالات"""
+        self._epoch += 1
+        self._local.clear()
+
+    def _get_local(self, cache_key: str) -> Any:
+        entry = self._local.get(cache_key)
+        if entry is None:
+            return _MISSING
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[cache_key]
+            return _MISSING
+
+        self._local.move_to_end(cache_key)
+        return value
+
+    def _set_local(self, cache_key: str, value: Any):
+        self._local[cache_key] = (time.monotonic() + self.ttl, value)
+        self._local.move_to_end(cache_key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """عدادات الإصابة والإخفاق ونسبة الإصابة"""
+        hits = self.counters["local_hits"] + self.counters["redis_hits"]
+        total = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self._local),
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+    def start(self):
+        """بدء الاشتراك في قناة الإبطال (مع Redis فقط)"""
+        if self._subscriber is not None:
+            self._subscriber.start()
+
+    async def close(self):
+        """إيقاف الاشتراك وإغلاق اتصال Redis"""
+        if self._subscriber is not None:
+            await self._subscriber.stop()
+        if self.redis is not None:
+            await self.redis.close()
+
+
+def _redis_client():
+    """عميل Redis للطبقة المشتركة إذا كانت مفعلة"""
+    if not settings.LOOKUP_CACHE_REDIS:
+        return None
+
+    import redis.asyncio as redis
+
+    return redis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        decode_responses=True
+    )
+
+
+# إنشاء كائن الذاكرة المؤقتة
+lookup_cache = LookupCache(
+    max_size=settings.LOOKUP_CACHE_SIZE,
+    ttl=settings.LOOKUP_CACHE_TTL,
+    redis_ttl=settings.LOOKUP_CACHE_REDIS_TTL,
+    redis_client=_redis_client()
+)
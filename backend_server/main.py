@@ -4,26 +4,55 @@
 """
 
 import os
+import uuid
+import base64
+import binascii
 import asyncio
 from contextlib import asynccontextmanager
-from typing import List, Optional
-from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from typing import Dict, List, Optional, Tuple, Union
+from datetime import datetime, timedelta
+from fastapi import (
+    FastAPI, Depends, HTTPException, status, UploadFile, File, Form,
+    Request, WebSocket, WebSocketDisconnect
+)
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
 
 from config import settings, AVAILABLE_COMMANDS
 from models import (
-    Base, engine, get_db, init_db,
-    User, Device, Command, ScheduledTask, OperationLog, DeviceStats
+    Base, engine, async_engine, get_async_db, init_db, AsyncSessionLocal, db_executor,
+    User, Device, Command, ScheduledTask, OperationLog, DeviceStats,
+    UploadSession, StoredFile, DeviceStatsRollup
 )
 from security import (
     AuthManager, verify_whitelist, generate_device_token,
     create_access_token, decode_token
 )
 from ai_engine import ai_engine
+from command_queue import command_queue
+from bot_service import bot_service
+from scheduler import scheduler
+from schedule_expr import next_run_after
+from connection_manager import connection_manager
+from stats_buffer import stats_buffer
+from presence import presence
+from metrics_store import metrics_store
+from retention import retention
+from upload_sweeper import upload_sweeper
+from lookup_cache import lookup_cache, snapshot, as_record, USER_FIELDS, DEVICE_FIELDS
+from stats_rollup import (
+    METRICS, RESOLUTIONS, bucket_start, pick_resolution, resolution_name,
+    rollup_point, to_naive_utc
+)
+from file_storage import (
+    FileTooLargeError, UploadBusyError, blob_store, safe_filename, save_upload,
+    append_stream, hash_file, etag_matches,
+    UploadSizeLimitMiddleware, MULTIPART_OVERHEAD
+)
 
 
 # إنشاء تطبيق FastAPI
@@ -36,20 +65,56 @@ async def lifespan(app: FastAPI):
     # إنشاء قاعدة البيانات
     init_db()
 
-    # إنشاء مجلد الرفع
+    # إنشاء مجلد الرفع ومخزن الكتل، وبدء حذف جلسات الرفع المهجورة
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    blob_store.setup()
+    upload_sweeper.start()
+
+    # تشغيل بوت التليجرام في عامل واحد فقط (القائد)، أو في عملية مستقلة حسب BOT_MODE
+    bot_service.start()
+
+    # بدء التفريغ الدوري لإحصائيات الأجهزة
+    stats_buffer.start()
 
-    # تشغيل بوت التليجرام في الخلفية
-    from bot_handler import TelegramBotHandler
-    bot = TelegramBotHandler(settings.TELEGRAM_BOT_TOKEN)
-    asyncio.create_task(bot.start())
-    print("🤖 بوت التليجرام قيد التشغيل...")
+    # تحميل الأجهزة المتصلة وبدء تتبع الحضور
+    presence.load()
+    presence.start()
+
+    # الاشتراك في بث إبطال الذاكرة المؤقتة بين العمليات (مع Redis)
+    lookup_cache.start()
+
+    # الاشتراك في بث وصول الأوامر بين العمليات (مع طابور redis)
+    command_queue.start()
+
+    # تحميل المهام المجدولة وبدء تنفيذها
+    if settings.SCHEDULER_ENABLED:
+        scheduler.load()
+        scheduler.start()
+
+    # بدء حذف البيانات القديمة دورياً
+    if settings.RETENTION_ENABLED:
+        retention.start()
 
     yield
 
     # إيقاف التشغيل
     print("🛑 جاري إيقاف الخادم...")
 
+    # كتابة ما تبقى من الإحصائيات والحضور قبل الإغلاق
+    await stats_buffer.stop()
+    await presence.stop()
+    await retention.stop()
+    await upload_sweeper.stop()
+    await scheduler.stop()
+    await bot_service.stop()
+    await lookup_cache.close()
+    await command_queue.close()
+    await ai_engine.close()
+
+    # إغلاق اتصالات قاعدة البيانات
+    await async_engine.dispose()
+    db_executor.shutdown(wait=False)
+
 
 app = FastAPI(
     title="TeleDroid AI Agent API",
@@ -67,6 +132,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# رفض طلبات الرفع الكبيرة (413) بعدّ بايتات الجسم أثناء استلامه، مع Content-Length أو بدونه
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path_prefix="/api/v1/files/",
+    max_body=settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD
+)
+
 
 # نماذج البيانات (Pydantic)
 class UserResponse(BaseModel):
@@ -130,6 +202,38 @@ class DeviceLinkResponse(BaseModel):
     device_token: Optional[str] = None
 
 
+class CommandResultItem(BaseModel):
+    """نموذج نتيجة أمر واحد ضمن دفعة"""
+    command_id: int
+    status: str
+    result: Optional[dict] = None
+    error_message: Optional[str] = None
+
+
+class DeviceStatsSample(BaseModel):
+    """نموذج عينة إحصائيات الجهاز"""
+    device_id: str
+    battery_level: Optional[int] = None
+    battery_status: Optional[str] = None
+    storage_total: Optional[float] = None
+    storage_used: Optional[float] = None
+    network_type: Optional[str] = None
+    network_speed: Optional[float] = None
+    memory_used: Optional[float] = None
+    memory_total: Optional[float] = None
+    cpu_usage: Optional[float] = None
+    created_at: Optional[datetime] = None
+
+
+class UploadInitRequest(BaseModel):
+    """نموذج بدء رفع مجزأ"""
+    device_id: str
+    filename: str
+    size: int
+    sha256: Optional[str] = Field(default=None, pattern=r"^[0-9a-f]{64}$")
+    path: Optional[str] = None
+
+
 class AICommandRequest(BaseModel):
     """نموذج طلب الأمر الذكي"""
     message: str
@@ -153,7 +257,13 @@ async def health_check():
     """فحص صحة الخادم"""
     return {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow().isoformat(),
+        "lookup_cache": lookup_cache.stats(),
+        "command_queue": command_queue.stats(),
+        "stats_buffer": stats_buffer.stats(),
+        "bot": bot_service.stats(),
+        "scheduler": scheduler.stats(),
+        "ai": ai_engine.stats()
     }
 
 
@@ -164,7 +274,7 @@ async def register_user(
     telegram_id: int = Form(...),
     username: Optional[str] = Form(None),
     first_name: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """تسجيل مستخدم جديد"""
     # التحقق من القائمة البيضاء
@@ -174,8 +284,13 @@ async def register_user(
             detail="غير مصرح لك بالوصول"
         )
 
-    auth_manager = AuthManager(db)
-    user = auth_manager.get_or_create_user(telegram_id, username, first_name)
+    # AuthManager متزامن ومشترك مع البوت، لذا يُنفذ عبر run_sync
+    user = await db.run_sync(
+        lambda session: AuthManager(session).get_or_create_user(
+            telegram_id, username, first_name
+        )
+    )
+    await lookup_cache.invalidate("user", telegram_id)
 
     return user
 
@@ -183,11 +298,10 @@ async def register_user(
 @app.get("/api/v1/users/me", response_model=UserResponse)
 async def get_current_user(
     telegram_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """الحصول على معلومات المستخدم الحالي"""
-    auth_manager = AuthManager(db)
-    user = auth_manager.get_user_by_telegram_id(telegram_id)
+    user = await _get_user(db, telegram_id)
 
     if not user:
         raise HTTPException(
@@ -204,12 +318,11 @@ async def get_current_user(
 async def link_device(
     request: DeviceLinkRequest,
     telegram_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """ربط جهاز جديد"""
     # التحقق من المستخدم
-    auth_manager = AuthManager(db)
-    user = auth_manager.get_user_by_telegram_id(telegram_id)
+    user = await _get_user(db, telegram_id)
 
     if not user:
         raise HTTPException(
@@ -217,8 +330,8 @@ async def link_device(
             detail="المستخدم غير موجود"
         )
 
-    # التحقق من وجود الجهاز
-    device = db.query(Device).filter(Device.device_id == request.device_id).first()
+    # التحقق من وجود الجهاز (الصف نفسه لأنه سيُعدل)
+    device = await _get_device_row(db, request.device_id)
 
     if device:
         # تحديث معلومات الجهاز
@@ -241,10 +354,16 @@ async def link_device(
         )
         db.add(device)
 
-    db.commit()
+    await db.commit()
+    await lookup_cache.invalidate("device", request.device_id)
+    await lookup_cache.invalidate("user_devices", telegram_id)
+    presence.touch(request.device_id)
 
     # إنشاء رمز المصادقة
-    device_token = auth_manager.create_auth_token(user.id, request.device_id)
+    user_pk = user.id
+    device_token = await db.run_sync(
+        lambda session: AuthManager(session).create_auth_token(user_pk, request.device_id)
+    )
 
     return DeviceLinkResponse(
         success=True,
@@ -257,23 +376,24 @@ async def link_device(
 async def unlink_device(
     device_id: str,
     telegram_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """إلغاء ربط جهاز"""
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    user = await _get_user(db, telegram_id)
     if not user:
         raise HTTPException(status_code=404, detail="المستخدم غير موجود")
 
-    device = db.query(Device).filter(
-        Device.device_id == device_id,
-        Device.user_id == user.id
-    ).first()
+    device = await _get_device_row(db, device_id, user.id)
 
     if not device:
         raise HTTPException(status_code=404, detail="الجهاز غير موجود")
 
-    db.delete(device)
-    db.commit()
+    await db.delete(device)
+    await db.commit()
+    await lookup_cache.invalidate("device", device_id)
+    await lookup_cache.invalidate("user_devices", telegram_id)
+    presence.forget(device_id)
+    metrics_store.forget(device_id)
 
     return {"success": True, "message": "تم إلغاء ربط الجهاز"}
 
@@ -281,31 +401,43 @@ async def unlink_device(
 @app.get("/api/v1/devices", response_model=List[DeviceResponse])
 async def get_user_devices(
     telegram_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """الحصول على أجهزة المستخدم"""
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    user = await _get_user(db, telegram_id)
     if not user:
         return []
 
-    devices = db.query(Device).filter(Device.user_id == user.id).all()
-    return devices
+    devices = (await db.scalars(
+        select(Device).where(Device.user_id == user.id)
+    )).all()
+
+    # حالة الاتصال تُقرأ من متتبع الحضور في الذاكرة
+    return [
+        DeviceResponse.model_validate(device).model_copy(update={
+            "is_online": presence.is_online(device.device_id),
+            "last_seen": presence.last_seen(device.device_id) or device.last_seen
+        })
+        for device in devices
+    ]
 
 
 @app.post("/api/v1/devices/heartbeat")
 async def device_heartbeat(
     device_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """إشارة حياة من الجهاز"""
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    """إشارة حياة من الجهاز
 
-    if not device:
-        raise HTTPException(status_code=404, detail="الجهاز غير موجود")
+    تُسجل في الذاكرة وتُكتب إلى قاعدة البيانات دفعة واحدة بواسطة متتبع الحضور
+    """
+    if not presence.knows(device_id):
+        device = await db.scalar(select(Device.id).where(Device.device_id == device_id))
+
+        if not device:
+            raise HTTPException(status_code=404, detail="الجهاز غير موجود")
 
-    device.is_online = True
-    device.last_seen = datetime.utcnow()
-    db.commit()
+    presence.touch(device_id)
 
     return {"success": True}
 
@@ -317,18 +449,15 @@ async def execute_command(
     request: CommandRequest,
     telegram_id: int,
     device_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """تنفيذ أمر على الجهاز"""
     # التحقق من المستخدم والجهاز
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    user = await _get_user(db, telegram_id)
     if not user:
         raise HTTPException(status_code=404, detail="المستخدم غير موجود")
 
-    device = db.query(Device).filter(
-        Device.device_id == device_id,
-        Device.user_id == user.id
-    ).first()
+    device = await _get_device(db, device_id, user.id)
 
     if not device:
         raise HTTPException(status_code=404, detail="الجهاز غير موجود")
@@ -343,15 +472,27 @@ async def execute_command(
         status="pending"
     )
     db.add(command)
-    db.commit()
-    db.refresh(command)
+    await db.commit()
+    await db.refresh(command)
+
+    # دفع الأمر عبر WebSocket إن كان الجهاز متصلاً، وإلا يستلمه عبر الاستطلاع.
+    # الحجز الذري يسبق الدفع حتى لا يستلمه طلب REST في نفس اللحظة فيُسلم مرتين
+    pushed = False
+    if connection_manager.is_connected(device_id):
+        claimed = await _claim_commands(
+            db, device.id, 1, timedelta(seconds=settings.COMMAND_LEASE_SECONDS),
+            command_ids=[command.id]
+        )
+        pushed = await _push_claimed(db, device_id, claimed) > 0
 
-    # إرسال الأمر للجهاز (سيتم تنفيذه بواسطة التطبيق)
-    # في الإنتاج، يمكن استخدام WebSocket أو Push Notification
+    # وضع الأمر في طابور الجهاز وإيقاظ المنتظرين (في أي عملية عند استخدام Redis)
+    if not pushed:
+        await command_queue.publish(device_id, command.id)
 
     return {
         "success": True,
         "command_id": command.id,
+        "channel": "websocket" if pushed else "polling",
         "message": "تم إرسال الأمر للجهاز"
     }
 
@@ -359,26 +500,65 @@ async def execute_command(
 @app.get("/api/v1/commands/pending")
 async def get_pending_commands(
     device_id: str,
-    db: Session = Depends(get_db)
+    wait: int = 0,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """الحصول على الأوامر المعلقة للجهاز"""
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    """الحصول على الأوامر المعلقة للجهاز
+
+    عند تمرير wait > 0 يبقى الطلب مفتوحاً حتى يصل أمر جديد للجهاز
+    أو تنتهي المهلة (بحد أقصى LONG_POLL_MAX_WAIT ثانية)
+    """
+    device = await _get_device(db, device_id)
 
     if not device:
         raise HTTPException(status_code=404, detail="الجهاز غير موجود")
 
-    commands = db.query(Command).filter(
-        Command.device_id == device.id,
-        Command.status == "pending"
-    ).all()
+    device_pk = device.id
+
+    async def fetch_pending():
+        return (await db.scalars(
+            select(Command).where(
+                Command.device_id == device_pk,
+                Command.status == "pending"
+            )
+        )).all()
+
+    commands = await _long_poll(db, device_id, wait, lambda command_ids: fetch_pending())
+
+    return [_command_payload(cmd) for cmd in commands]
+
+
+@app.post("/api/v1/commands/claim")
+async def claim_commands(
+    device_id: str,
+    limit: int = 10,
+    lease_seconds: Optional[int] = None,
+    wait: int = 0,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """حجز الأوامر المعلقة للجهاز بشكل ذري
+
+    تنتقل حتى limit أوامر من pending إلى processing في عملية UPDATE واحدة
+    مع مهلة حجز، والأوامر التي انتهت مهلة حجزها تعود إلى الطابور.
+    يدعم wait بنفس سلوك الاستطلاع الطويل في /commands/pending
+    """
+    device = await _get_device(db, device_id)
+
+    if not device:
+        raise HTTPException(status_code=404, detail="الجهاز غير موجود")
+
+    device_pk = device.id
+    limit = max(1, min(limit, settings.COMMAND_CLAIM_MAX))
+    lease = timedelta(seconds=lease_seconds or settings.COMMAND_LEASE_SECONDS)
+
+    commands = await _long_poll(
+        db, device_id, wait,
+        lambda command_ids: _claim_queued(db, device_id, device_pk, limit, lease, command_ids),
+        take=limit
+    )
 
     return [
-        {
-            "id": cmd.id,
-            "command_type": cmd.command_type,
-            "action": cmd.action,
-            "parameters": cmd.parameters
-        }
+        {**_command_payload(cmd), "lease_expires_at": cmd.lease_expires_at}
         for cmd in commands
     ]
 
@@ -389,24 +569,366 @@ async def submit_command_result(
     status: str,
     result: Optional[dict] = None,
     error_message: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """تقديم نتيجة الأمر"""
-    command = db.query(Command).filter(Command.id == command_id).first()
+    row = (await db.execute(
+        select(Command, Device.device_id)
+        .join(Device, Device.id == Command.device_id)
+        .where(Command.id == command_id)
+    )).first()
 
-    if not command:
+    if not row:
         raise HTTPException(status_code=404, detail="الأمر غير موجود")
 
+    command, command_device_id = row
+    _apply_command_result(command, status, result, error_message)
+    await db.commit()
+
+    if command.status in ("completed", "failed"):
+        await command_queue.ack(command_device_id, [command.id])
+
+    return {"success": True}
+
+
+@app.post("/api/v1/commands/results")
+async def submit_command_results(
+    results: List[CommandResultItem],
+    device_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """تقديم نتائج عدة أوامر دفعة واحدة في معاملة واحدة"""
+    ids = [item.command_id for item in results]
+    query = (
+        select(Command, Device.device_id)
+        .join(Device, Device.id == Command.device_id)
+        .where(Command.id.in_(ids))
+    )
+
+    if device_id:
+        device = await _get_device(db, device_id)
+        if not device:
+            raise HTTPException(status_code=404, detail="الجهاز غير موجود")
+        query = query.where(Command.device_id == device.id)
+
+    rows = (await db.execute(query)).all()
+    commands = {cmd.id: cmd for cmd, _ in rows}
+
+    for item in results:
+        command = commands.get(item.command_id)
+        if command:
+            _apply_command_result(command, item.status, item.result, item.error_message)
+
+    await db.commit()
+
+    # إزالة الأوامر المنتهية من طابور كل جهاز
+    finished: Dict[str, List[int]] = {}
+    for command, command_device_id in rows:
+        if command.status in ("completed", "failed"):
+            finished.setdefault(command_device_id, []).append(command.id)
+    for command_device_id, command_ids in finished.items():
+        await command_queue.ack(command_device_id, command_ids)
+
+    return {
+        "success": True,
+        "updated": len(commands),
+        "missing": [cid for cid in ids if cid not in commands]
+    }
+
+
+@app.websocket("/api/v1/devices/{device_id}/ws")
+async def device_websocket(websocket: WebSocket, device_id: str):
+    """قناة WebSocket دائمة للجهاز
+
+    الخادم يدفع الأوامر الجديدة: {"type": "command", "command": {...}}
+    والجهاز يرسل على نفس الاتصال:
+    - {"type": "result", "command_id": 1, "status": "completed", "result": {...}, "error_message": null}
+    - {"type": "heartbeat"}
+
+    نقاط نهاية REST تبقى متاحة كبديل عند انقطاع الاتصال أو امتلاء طابور الإرسال
+    """
+    async with AsyncSessionLocal() as db:
+        device = await _get_device(db, device_id)
+
+        if not device:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+        await websocket.accept()
+        presence.touch(device_id)
+        connection = connection_manager.register(
+            device_id, websocket, settings.WS_SEND_QUEUE_SIZE
+        )
+        writer = asyncio.create_task(connection.writer())
+        # أول دورة للمرحّل تحجز وترسل الأوامر التي تراكمت قبل الاتصال
+        relay = asyncio.create_task(_relay_commands(device_id, device.id))
+
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                except ValueError:
+                    connection.offer({"type": "error", "error": "رسالة JSON غير صالحة"})
+                    continue
+
+                reply = await _handle_device_message(db, device, message)
+                await db.commit()
+
+                if reply:
+                    connection.offer(reply)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            writer.cancel()
+            relay.cancel()
+            connection_manager.unregister(connection)
+
+
+async def _relay_commands(device_id: str, device_pk: int):
+    """حجز الأوامر التي يسلمها الطابور ودفعها لاتصال WebSocket
+
+    عند تعدد العمليات قد يصل الأمر لعملية غير التي يتصل بها الجهاز،
+    فتصل هنا عبر الطابور المشترك بدلاً من انتظار إعادة الاتصال.
+    الحجز يجري في كل دورة حتى عند انتهاء مهلة الانتظار (بفحص قاعدة البيانات)،
+    فتعود الأوامر التي انتهت مهلة حجزها (أو فات إشعارها) للجهاز خلال
+    LONG_POLL_MAX_WAIT على الأكثر
+    """
+    lease = timedelta(seconds=settings.COMMAND_LEASE_SECONDS)
+    limit = settings.WS_SEND_QUEUE_SIZE
+    # None: فحص قاعدة البيانات، أو معرفات سحبها take من الطابور
+    command_ids = None
+
+    while True:
+        # رقم الإشعارات قبل الحجز: أمر يصل أثناءه يوقظ الانتظار التالي فوراً
+        seen = command_queue.version(device_id)
+
+        try:
+            async with AsyncSessionLocal() as db:
+                commands = await _claim_queued(db, device_id, device_pk, limit, lease, command_ids)
+                await _push_claimed(db, device_id, commands)
+        except Exception as e:
+            print(f"⚠️ فشل حجز أوامر الجهاز {device_id}: {e}")
+
+        command_ids = await command_queue.take(
+            device_id, limit, settings.LONG_POLL_MAX_WAIT, since=seen
+        )
+
+
+def _command_payload(command: Command) -> dict:
+    """تمثيل الأمر كما يُرسل للجهاز"""
+    return {
+        "id": command.id,
+        "command_type": command.command_type,
+        "action": command.action,
+        "parameters": command.parameters
+    }
+
+
+async def _get_user(db: AsyncSession, telegram_id: int):
+    """الحصول على المستخدم بواسطة معرف Telegram (نسخة للقراءة فقط من الذاكرة المؤقتة)"""
+    async def load():
+        user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
+        return snapshot(user, USER_FIELDS)
+
+    return as_record(await lookup_cache.get("user", telegram_id, load))
+
+
+async def _get_device(db: AsyncSession, device_id: str, user_id: Optional[int] = None):
+    """الحصول على الجهاز بواسطة device_id، مع التقييد بالمستخدم إن مُرر
+
+    يعيد نسخة للقراءة فقط من الذاكرة المؤقتة؛ مسارات التعديل تستخدم _get_device_row
+    """
+    async def load():
+        device = await db.scalar(select(Device).where(Device.device_id == device_id))
+        return snapshot(device, DEVICE_FIELDS)
+
+    device = as_record(await lookup_cache.get("device", device_id, load))
+    if device is not None and user_id is not None and device.user_id != user_id:
+        return None
+    return device
+
+
+async def _get_device_row(
+    db: AsyncSession,
+    device_id: str,
+    user_id: Optional[int] = None
+) -> Optional[Device]:
+    """صف الجهاز من الجلسة مباشرة (للتعديل أو الحذف)"""
+    query = select(Device).where(Device.device_id == device_id)
+    if user_id is not None:
+        query = query.where(Device.user_id == user_id)
+    return await db.scalar(query)
+
+
+async def _long_poll(
+    db: AsyncSession,
+    device_id: str,
+    wait: int,
+    fetch,
+    take: Optional[int] = None
+):
+    """تنفيذ fetch وإعادة المحاولة عند وصول أمر جديد حتى تنتهي مهلة wait
+
+    fetch(command_ids) تستقبل None لفحص قاعدة البيانات أو المعرفات المسحوبة من
+    الطابور. take هو أقصى عدد معرفات تُسحب (لطلبات الحجز فقط)، وبدونه ينتظر
+    الطلب الإشعار دون أن يأخذ الأوامر من مستهلك آخر
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(0, min(wait, settings.LONG_POLL_MAX_WAIT))
+    command_ids = None
+
+    while True:
+        # رقم الإشعارات قبل fetch: أمر يُنشأ أثناء fetch أو قبل بدء الانتظار يوقظه فوراً
+        seen = command_queue.version(device_id)
+        commands = await fetch(command_ids)
+
+        remaining = deadline - loop.time()
+        if commands or remaining <= 0:
+            return commands
+
+        # تحرير اتصال قاعدة البيانات أثناء الانتظار حتى لا يُستنزف الـ pool
+        await db.close()
+        if take:
+            command_ids = await command_queue.take(device_id, take, remaining, since=seen)
+        else:
+            await command_queue.wait(device_id, remaining, since=seen)
+
+
+async def _claim_commands(
+    db: AsyncSession,
+    device_pk: int,
+    limit: int,
+    lease: timedelta,
+    command_ids: Optional[List[int]] = None
+) -> list:
+    """إعادة الأوامر منتهية الحجز للطابور ثم حجز حتى limit أوامر معلقة
+
+    command_ids يقصر الحجز على أوامر محددة (مثل الأمر الجديد قبل دفعه عبر WebSocket)
+    """
+    now = datetime.utcnow()
+
+    await db.execute(
+        update(Command)
+        .where(
+            Command.device_id == device_pk,
+            Command.status == "processing",
+            Command.lease_expires_at < now
+        )
+        .values(status="pending", lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+    pending_ids = (
+        select(Command.id)
+        .where(Command.device_id == device_pk, Command.status == "pending")
+        .order_by(Command.id)
+        .limit(limit)
+    )
+    if command_ids is not None:
+        pending_ids = pending_ids.where(Command.id.in_(command_ids))
+    claimed = (await db.execute(
+        update(Command)
+        .where(Command.id.in_(pending_ids), Command.status == "pending")
+        .values(status="processing", lease_expires_at=now + lease)
+        .returning(
+            Command.id, Command.command_type, Command.action,
+            Command.parameters, Command.lease_expires_at
+        )
+        .execution_options(synchronize_session=False)
+    )).all()
+    await db.commit()
+
+    return sorted(claimed, key=lambda row: row.id)
+
+
+async def _claim_queued(
+    db: AsyncSession,
+    device_id: str,
+    device_pk: int,
+    limit: int,
+    lease: timedelta,
+    command_ids: Optional[List[int]]
+) -> list:
+    """حجز المعرفات المسحوبة من الطابور، أو فحص قاعدة البيانات إذا كانت None
+
+    المعرف الذي لم يعد معلقاً (حُجز من طريق آخر أو انتهى) يُحذف من الطابور
+    """
+    commands = await _claim_commands(db, device_pk, limit, lease, command_ids)
+
+    if command_ids:
+        claimed = {cmd.id for cmd in commands}
+        await command_queue.ack(device_id, [cid for cid in command_ids if cid not in claimed])
+
+    return commands
+
+
+async def _push_claimed(db: AsyncSession, device_id: str, commands: list) -> int:
+    """دفع أوامر محجوزة عبر WebSocket وإعادة ما تعذر دفعه للطابور فوراً
+
+    بدون الإعادة يبقى الأمر محجوزاً حتى تنتهي مهلة حجزه رغم أنه لم يُرسل
+    """
+    failed = [
+        cmd.id for cmd in commands
+        if not connection_manager.push_command(device_id, _command_payload(cmd), cmd.lease_expires_at)
+    ]
+
+    if failed:
+        await db.execute(
+            update(Command)
+            .where(Command.id.in_(failed), Command.status == "processing")
+            .values(status="pending", lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    return len(commands) - len(failed)
+
+
+def _apply_command_result(
+    command: Command,
+    status: str,
+    result: Optional[dict],
+    error_message: Optional[str]
+):
+    """تطبيق نتيجة تنفيذ الأمر على السجل"""
     command.status = status
     command.result = result
     command.error_message = error_message
 
     if status in ["completed", "failed"]:
         command.completed_at = datetime.utcnow()
+        command.lease_expires_at = None
 
-    db.commit()
 
-    return {"success": True}
+async def _handle_device_message(db: AsyncSession, device: Device, message: dict) -> Optional[dict]:
+    """معالجة رسالة واردة من الجهاز عبر WebSocket وإرجاع الرد إن وجد"""
+    message_type = message.get("type") if isinstance(message, dict) else None
+
+    if message_type == "heartbeat":
+        presence.touch(device.device_id)
+        return None
+
+    if message_type == "result":
+        command = await db.scalar(select(Command).where(
+            Command.id == message.get("command_id"),
+            Command.device_id == device.id
+        ))
+
+        if not command:
+            return {"type": "error", "command_id": message.get("command_id"), "error": "الأمر غير موجود"}
+
+        _apply_command_result(
+            command,
+            message.get("status", "completed"),
+            message.get("result"),
+            message.get("error_message")
+        )
+        if command.status in ("completed", "failed"):
+            connection_manager.acknowledge(device.device_id, command.id)
+            await command_queue.ack(device.device_id, [command.id])
+        return {"type": "ack", "command_id": command.id}
+
+    return {"type": "error", "error": f"نوع رسالة غير معروف: {message_type}"}
 
 
 # ==================== نقاط نهاية الذكاء الاصطناعي ====================
@@ -422,14 +944,14 @@ async def analyze_with_ai(request: AICommandRequest):
 async def chat_with_ai(
     message: str,
     telegram_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """المحادثة مع AI"""
     # الحصول على سياق المستخدم
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    user = await _get_user(db, telegram_id)
 
     # تحليل الأمر
-    result = ai_engine.analyze_command(message)
+    result = await ai_engine.analyze_command(message)
 
     if result.get("success"):
         # إنشاء رد مناسب
@@ -454,44 +976,365 @@ async def upload_file(
     file: UploadFile = File(...),
     device_id: str = Form(...),
     path: str = Form("/"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """رفع ملف إلى الجهاز"""
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = await _get_device(db, device_id)
 
     if not device:
         raise HTTPException(status_code=404, detail="الجهاز غير موجود")
 
-    # حفظ الملف
-    file_path = os.path.join(settings.UPLOAD_DIR, f"{device_id}_{file.filename}")
+    # حفظ الملف على دفعات مع فرض الحد الأقصى للحجم
+    temp_path = blob_store.incoming_path(uuid.uuid4().hex)
 
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    try:
+        file_size, sha256 = await save_upload(file, temp_path, settings.MAX_FILE_SIZE)
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
+
+    # تخزين المحتوى مرة واحدة حسب بصمته وربطه بالجهاز
+    stored, deduplicated = await _store_file(
+        db, device_id, temp_path, sha256, file_size, safe_filename(file.filename), path
+    )
 
     return {
         "success": True,
-        "file_path": file_path,
-        "file_size": len(content)
+        "file_id": stored.id,
+        "file_path": blob_store.path_for(sha256),
+        "file_size": file_size,
+        "sha256": sha256,
+        "deduplicated": deduplicated
     }
 
 
+@app.post("/api/v1/files/uploads")
+async def init_upload(
+    request: UploadInitRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """بدء رفع مجزأ قابل للاستئناف
+
+    إذا أُرسلت البصمة وكان المحتوى مخزناً مسبقاً لأحد أجهزة نفس المستخدم يكتمل الرفع
+    فوراً دون نقل أي بايت. البصمة وحدها لا تثبت امتلاك المحتوى، لذا لا تُربط كتلة
+    رفعها مستخدم آخر، بل يُرفع الملف كاملاً ويُلغى تكراره على القرص عند الإنهاء
+    """
+    device = await _get_device(db, request.device_id)
+
+    if not device:
+        raise HTTPException(status_code=404, detail="الجهاز غير موجود")
+
+    if request.size < 0 or request.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="حجم الملف يتجاوز الحد المسموح")
+
+    filename = safe_filename(request.filename)
+    sha256 = request.sha256
+
+    if sha256 and blob_store.exists(sha256) and await _user_has_content(db, device.user_id, sha256):
+        stored = StoredFile(
+            device_id=request.device_id,
+            filename=filename,
+            path=request.path,
+            sha256=sha256,
+            size=os.path.getsize(blob_store.path_for(sha256))
+        )
+        db.add(stored)
+        await db.commit()
+
+        return {
+            "success": True,
+            "complete": True,
+            "deduplicated": True,
+            "file_id": stored.id,
+            "sha256": sha256
+        }
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        device_id=request.device_id,
+        filename=filename,
+        path=request.path,
+        total_size=request.size,
+        received=0,
+        sha256=sha256,
+        expires_at=_upload_expiry()
+    )
+    db.add(upload)
+    await db.commit()
+
+    # الملف الجزئي يوجد منذ البداية (ملف بحجم 0 يكتمل دون أي دفعة)
+    await blob_store.create_incoming(upload.id)
+
+    return {
+        "success": True,
+        "complete": False,
+        "upload_id": upload.id,
+        "offset": 0,
+        "chunk_size": settings.UPLOAD_CHUNK_SIZE
+    }
+
+
+@app.get("/api/v1/files/uploads/{upload_id}")
+async def get_upload_status(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """حالة الرفع المجزأ (الإزاحة التي يجب الاستئناف منها)"""
+    upload = await _get_upload(db, upload_id)
+
+    return {
+        "upload_id": upload.id,
+        "offset": _received_bytes(upload.id),
+        "total_size": upload.total_size
+    }
+
+
+@app.put("/api/v1/files/uploads/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """إرسال دفعة من الملف عند الإزاحة offset (جسم الطلب هو البايتات الخام)"""
+    upload = await _get_upload(db, upload_id)
+
+    async with _upload_lock(upload_id):
+        received = _received_bytes(upload_id)
+        if offset != received:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "إزاحة غير متطابقة", "offset": received}
+            )
+
+        try:
+            received = await append_stream(
+                blob_store.incoming_path(upload_id), request.stream(), upload.total_size
+            )
+        except FileTooLargeError:
+            raise HTTPException(status_code=413, detail="البيانات تتجاوز الحجم المعلن للملف")
+        finally:
+            upload.received = _received_bytes(upload_id)
+            upload.expires_at = _upload_expiry()
+            await db.commit()
+
+    return {
+        "upload_id": upload_id,
+        "offset": received,
+        "complete": received == upload.total_size
+    }
+
+
+@app.post("/api/v1/files/uploads/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """إنهاء الرفع المجزأ: التحقق من البصمة ونقل المحتوى إلى مخزن الكتل"""
+    upload = await _get_upload(db, upload_id)
+
+    async with _upload_lock(upload_id):
+        part_path = blob_store.incoming_path(upload_id)
+        received = _received_bytes(upload_id)
+
+        if received != upload.total_size:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "الملف لم يكتمل بعد", "offset": received}
+            )
+
+        size, sha256 = await hash_file(part_path)
+
+        if upload.sha256 and upload.sha256 != sha256:
+            # المحتوى تالف: يُفرغ الملف الجزئي (مع بقائه لقفل الجلسة) ويبدأ الجهاز من جديد
+            os.truncate(part_path, 0)
+            upload.received = 0
+            await db.commit()
+            raise HTTPException(status_code=422, detail="بصمة الملف غير متطابقة")
+
+        stored, deduplicated = await _store_file(
+            db, upload.device_id, part_path, sha256, size, upload.filename, upload.path,
+            commit=False
+        )
+        await db.delete(upload)
+        await db.commit()
+
+    return {
+        "success": True,
+        "file_id": stored.id,
+        "file_size": size,
+        "sha256": sha256,
+        "deduplicated": deduplicated
+    }
+
+
+@app.api_route("/api/v1/files/{file_id}/download", methods=["GET", "HEAD"])
+async def download_file(
+    file_id: int,
+    device_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """تنزيل ملف مخزن للجهاز مع دعم Range (لاستئناف التنزيل) و ETag
+
+    المحتوى معنون ببصمته فلا يتغير أبداً، لذا ETag هو SHA-256 نفسه.
+    Range و If-Range يتولاهما FileResponse في Starlette (يقرأ الملف على دفعات).
+    الملف يُبحث عنه ضمن ملفات الجهاز الطالب فقط، ولا يُقدم مسار يخرج عن مخزن الكتل
+    """
+    stored = await db.scalar(select(StoredFile).where(
+        StoredFile.id == file_id,
+        StoredFile.device_id == device_id
+    ))
+
+    if not stored:
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+
+    blob_path = blob_store.resolve(stored.sha256)
+
+    if blob_path is None:
+        raise HTTPException(status_code=404, detail="محتوى الملف غير موجود في المخزن")
+
+    headers = {
+        "etag": f'"{stored.sha256}"',
+        "cache-control": "private, max-age=31536000, immutable"
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(blob_path, filename=stored.filename, headers=headers)
+
+
+@app.post("/api/v1/files/{file_id}/send-to-telegram", status_code=status.HTTP_202_ACCEPTED)
+async def send_file_to_telegram(
+    file_id: int,
+    telegram_id: int,
+    caption: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """إرسال ملف مخزن لمحادثة المستخدم في Telegram عبر البوت القائد"""
+    user = await _get_user(db, telegram_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="المستخدم غير موجود")
+
+    stored = await db.get(StoredFile, file_id)
+    if not stored or not await _get_device(db, stored.device_id, user.id):
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+
+    queued = await bot_service.send(
+        "send_stored_file", chat_id=telegram_id, file_id=file_id, caption=caption
+    )
+    if not queued:
+        raise HTTPException(status_code=503, detail="بوت التليجرام غير متاح حالياً")
+
+    return {"success": True, "message": "تمت إضافة الملف لطابور الإرسال"}
+
+
+@asynccontextmanager
+async def _upload_lock(upload_id: str):
+    """قفل جلسة الرفع بين كل العمليات (flock على الملف الجزئي)
+
+    دفعة ثانية أثناء استلام أخرى لنفس الجلسة تُرفض بـ 409 مع الإزاحة الحالية
+    بدلاً من انتظار القفل
+    """
+    try:
+        fd = blob_store.lock_incoming(upload_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="جلسة الرفع غير موجودة")
+    except UploadBusyError:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "دفعة أخرى قيد الاستلام لهذه الجلسة", "offset": _received_bytes(upload_id)}
+        )
+
+    try:
+        yield
+    finally:
+        blob_store.unlock_incoming(fd)
+
+
+def _upload_expiry() -> datetime:
+    """موعد انتهاء جلسة رفع لم تستلم دفعات بعد الآن"""
+    return datetime.utcnow() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+async def _get_upload(db: AsyncSession, upload_id: str) -> UploadSession:
+    """جلسة الرفع، أو 404 إذا لم تكن موجودة أو انتهت (ينظفها upload_sweeper لاحقاً)"""
+    upload = await db.get(UploadSession, upload_id)
+
+    if not upload or (upload.expires_at and upload.expires_at < datetime.utcnow()):
+        raise HTTPException(status_code=404, detail="جلسة الرفع غير موجودة")
+
+    return upload
+
+
+async def _user_has_content(db: AsyncSession, user_pk: int, sha256: str) -> bool:
+    """هل سبق أن رفع أحد أجهزة المستخدم محتوى بهذه البصمة (إثبات امتلاكه)"""
+    owned = await db.scalar(
+        select(StoredFile.id)
+        .join(Device, Device.device_id == StoredFile.device_id)
+        .where(Device.user_id == user_pk, StoredFile.sha256 == sha256)
+        .limit(1)
+    )
+    return owned is not None
+
+
+def _received_bytes(upload_id: str) -> int:
+    """عدد البايتات المستلمة فعلياً على القرص لجلسة الرفع"""
+    try:
+        return os.path.getsize(blob_store.incoming_path(upload_id))
+    except FileNotFoundError:
+        return 0
+
+
+async def _store_file(
+    db: AsyncSession,
+    device_id: str,
+    temp_path: str,
+    sha256: str,
+    size: int,
+    filename: str,
+    path: Optional[str],
+    commit: bool = True
+) -> Tuple[StoredFile, bool]:
+    """نقل الملف إلى مخزن الكتل وتسجيله للجهاز، وإرجاع (السجل، هل كان مكرراً)"""
+    created = await blob_store.put(temp_path, sha256)
+
+    stored = StoredFile(
+        device_id=device_id,
+        filename=filename,
+        path=path,
+        sha256=sha256,
+        size=size
+    )
+    db.add(stored)
+
+    if commit:
+        await db.commit()
+    else:
+        await db.flush()
+
+    return stored, not created
+
+
 # ==================== نقاط نهاية المهام المجدولة ====================
 
 @app.get("/api/v1/scheduled-tasks")
 async def get_scheduled_tasks(
     device_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """الحصول على المهام المجدولة"""
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = await _get_device(db, device_id)
 
     if not device:
         return []
 
-    tasks = db.query(ScheduledTask).filter(
-        ScheduledTask.device_id == device.id
-    ).all()
+    tasks = (await db.scalars(
+        select(ScheduledTask).where(ScheduledTask.device_id == device.id)
+    )).all()
 
     return [
         {
@@ -500,7 +1343,9 @@ async def get_scheduled_tasks(
             "command_type": task.command_type,
             "action": task.action,
             "schedule_type": task.schedule_type,
+            "schedule_value": task.schedule_value,
             "is_active": task.is_active,
+            "last_run": task.last_run,
             "next_run": task.next_run
         }
         for task in tasks
@@ -516,14 +1361,22 @@ async def create_scheduled_task(
     schedule_type: str = Form(...),
     schedule_value: str = Form(...),
     parameters: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """إنشاء مهمة مجدولة"""
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = await _get_device(db, device_id)
 
     if not device:
         raise HTTPException(status_code=404, detail="الجهاز غير موجود")
 
+    try:
+        next_run = next_run_after(schedule_type, schedule_value, datetime.utcnow())
+    except ValueError:
+        raise HTTPException(status_code=422, detail="قيمة الجدولة غير صالحة")
+
+    if next_run is None:
+        raise HTTPException(status_code=422, detail="موعد المهمة في الماضي")
+
     task = ScheduledTask(
         device_id=device.id,
         name=name,
@@ -531,60 +1384,338 @@ async def create_scheduled_task(
         action=action,
         schedule_type=schedule_type,
         schedule_value=schedule_value,
-        parameters=json.loads(parameters) if parameters else None
+        parameters=json.loads(parameters) if parameters else None,
+        next_run=next_run
     )
 
     db.add(task)
-    db.commit()
+    await db.commit()
+
+    scheduler.schedule(task.id, next_run)
 
-    return {"success": True, "task_id": task.id}
+    return {"success": True, "task_id": task.id, "next_run": next_run}
+
+
+@app.delete("/api/v1/scheduled-tasks/{task_id}")
+async def delete_scheduled_task(
+    task_id: int,
+    device_id: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """حذف مهمة مجدولة"""
+    device = await _get_device(db, device_id)
+
+    if not device:
+        raise HTTPException(status_code=404, detail="الجهاز غير موجود")
+
+    task = await db.get(ScheduledTask, task_id)
+
+    if not task or task.device_id != device.id:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+
+    await db.delete(task)
+    await db.commit()
+
+    scheduler.cancel(task_id)
+
+    return {"success": True}
 
 
 # ==================== نقاط نهاية السجلات ====================
 
+# الحد الأقصى لحجم صفحة السجلات، وحجم الدفعة عند التصدير بصيغة NDJSON
+LOGS_MAX_PAGE_SIZE = 500
+LOGS_EXPORT_BATCH_SIZE = 1000
+
+
 @app.get("/api/v1/logs")
 async def get_operation_logs(
     telegram_id: int,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    operation_type: Optional[str] = None,
+    device_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = "json",
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """الحصول على سجلات العمليات"""
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    """الحصول على سجلات العمليات (الأحدث أولاً)
 
-    if not user:
+    الترقيم بمؤشر على (created_at, id): تُعاد الصفحة التالية في ترويس X-Next-Cursor
+    ويُمرر كما هو في cursor. مع format=ndjson يُصدّر كامل السجل سطراً لكل عملية
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="الصيغة يجب أن تكون json أو ndjson")
+
+    after = _decode_log_cursor(cursor) if cursor else None
+    user = await _get_user(db, telegram_id)
+
+    device_pk = None
+    if user and device_id:
+        device = await _get_device(db, device_id, user.id)
+        device_pk = device.id if device else None
+
+    # مستخدم أو جهاز غير موجود: لا توجد سجلات
+    missing = not user or (device_id and device_pk is None)
+
+    if format == "ndjson":
+        lines = _export_logs(
+            None if missing else user.id, operation_type, device_pk, since, until, after
+        )
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    if missing:
         return []
 
-    logs = db.query(OperationLog).filter(
-        OperationLog.user_id == user.id
-    ).order_by(OperationLog.created_at.desc()).limit(limit).all()
+    limit = max(1, min(limit, LOGS_MAX_PAGE_SIZE))
+    logs = (await db.scalars(
+        _logs_query(user.id, operation_type, device_pk, since, until, after, limit + 1)
+    )).all()
 
-    return [
-        {
-            "id": log.id,
-            "operation_type": log.operation_type,
-            "description": log.description,
-            "created_at": log.created_at
-        }
-        for log in logs
-    ]
+    headers = {}
+    if len(logs) > limit:
+        logs = logs[:limit]
+        headers["X-Next-Cursor"] = _encode_log_cursor(logs[-1])
+
+    return JSONResponse(
+        content=[_log_entry(log) for log in logs],
+        headers=headers
+    )
+
+
+def _logs_query(
+    user_id: int,
+    operation_type: Optional[str],
+    device_pk: Optional[int],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    after: Optional[Tuple[datetime, int]],
+    limit: int
+):
+    """استعلام صفحة من السجلات بعد المؤشر after مرتبة حسب (created_at, id) تنازلياً"""
+    query = select(OperationLog).where(OperationLog.user_id == user_id)
+
+    if operation_type:
+        query = query.where(OperationLog.operation_type == operation_type)
+    if device_pk is not None:
+        query = query.where(OperationLog.device_id == device_pk)
+    if since:
+        query = query.where(OperationLog.created_at >= since)
+    if until:
+        query = query.where(OperationLog.created_at < until)
+
+    if after:
+        created_at, log_id = after
+        created_at = _created_at_bound(created_at)
+        query = query.where(or_(
+            OperationLog.created_at < created_at,
+            and_(OperationLog.created_at == created_at, OperationLog.id < log_id)
+        ))
+
+    return query.order_by(
+        OperationLog.created_at.desc(), OperationLog.id.desc()
+    ).limit(limit)
+
+
+def _created_at_bound(value: datetime):
+    """قيمة المؤشر بنفس صيغة التخزين
+
+    CURRENT_TIMESTAMP في SQLite يُخزن دون أجزاء الثانية بينما يضيفها SQLAlchemy
+    للقيم المربوطة، فتختلف المقارنة النصية عند التساوي
+    """
+    if async_engine.dialect.name == "sqlite" and not value.microsecond:
+        return literal(value.strftime("%Y-%m-%d %H:%M:%S"))
+    return value
+
+
+def _encode_log_cursor(log: OperationLog) -> str:
+    """مؤشر الصفحة التالية من آخر سجل في الصفحة"""
+    raw = f"{log.created_at.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_log_cursor(cursor: str) -> Tuple[datetime, int]:
+    """فك مؤشر الصفحة"""
+    try:
+        created_at, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(log_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="مؤشر الصفحة غير صالح")
+
+
+def _log_entry(log: OperationLog) -> dict:
+    """تمثيل سجل عملية"""
+    return {
+        "id": log.id,
+        "operation_type": log.operation_type,
+        "description": log.description,
+        "device_id": log.device_id,
+        "command_id": log.command_id,
+        "created_at": log.created_at.isoformat() if log.created_at else None
+    }
+
+
+async def _export_logs(
+    user_id: Optional[int],
+    operation_type: Optional[str],
+    device_pk: Optional[int],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    after: Optional[Tuple[datetime, int]]
+):
+    """تصدير السجلات بصيغة NDJSON على دفعات بالمؤشر (ذاكرة ثابتة مهما كان حجم السجل)
+
+    كل دفعة بجلسة مستقلة حتى لا يبقى اتصال قاعدة البيانات محجوزاً طوال التصدير
+    """
+    if user_id is None:
+        return
+
+    while True:
+        async with AsyncSessionLocal() as session:
+            logs = (await session.scalars(_logs_query(
+                user_id, operation_type, device_pk, since, until, after,
+                LOGS_EXPORT_BATCH_SIZE
+            ))).all()
+
+        if not logs:
+            return
+
+        yield "".join(
+            json.dumps(_log_entry(log), ensure_ascii=False) + "\n" for log in logs
+        )
+
+        if len(logs) < LOGS_EXPORT_BATCH_SIZE:
+            return
+        after = (logs[-1].created_at, logs[-1].id)
 
 
 # ==================== نقطة نهاية الإحصائيات ====================
 
+@app.post("/api/v1/device/stats", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_device_stats(
+    samples: Union[DeviceStatsSample, List[DeviceStatsSample]],
+    db: AsyncSession = Depends(get_async_db)
+):
+    """استقبال عينة أو مجموعة عينات من إحصائيات الجهاز
+
+    تُخزن العينات في الذاكرة وتُكتب إلى قاعدة البيانات على دفعات
+    """
+    if isinstance(samples, DeviceStatsSample):
+        samples = [samples]
+
+    if not samples:
+        return {"success": True, "accepted": 0}
+
+    device_ids = {sample.device_id for sample in samples}
+    known = set((await db.scalars(
+        select(Device.device_id).where(Device.device_id.in_(device_ids))
+    )).all())
+    if known != device_ids:
+        raise HTTPException(status_code=404, detail="الجهاز غير موجود")
+
+    now = datetime.utcnow()
+    rows = []
+    for sample in samples:
+        row = sample.model_dump()
+        row["created_at"] = to_naive_utc(row["created_at"]) if row["created_at"] else now
+        rows.append(row)
+
+    stats_buffer.add(rows)
+    metrics_store.add(rows)
+
+    return {"success": True, "accepted": len(rows)}
+
+
+@app.get("/api/v1/stats/{device_id}/range")
+async def get_device_stats_range(
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: Optional[str] = None,
+    metrics: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """إحصائيات الجهاز خلال فترة من جداول التجميع (الافتراضي آخر 24 ساعة)
+
+    إذا لم تُحدد الدقة (1m/1h/1d) تُختار أدق دقة لا يتجاوز فيها عدد النقاط
+    STATS_RANGE_MAX_POINTS لكل مقياس
+    """
+    device = await _get_device(db, device_id)
+
+    if not device:
+        raise HTTPException(status_code=404, detail="الجهاز غير موجود")
+
+    end = to_naive_utc(end) if end else datetime.utcnow()
+    start = to_naive_utc(start) if start else end - timedelta(days=1)
+
+    if start >= end:
+        raise HTTPException(status_code=400, detail="بداية الفترة يجب أن تسبق نهايتها")
+
+    if resolution is None:
+        seconds = pick_resolution(start, end, settings.STATS_RANGE_MAX_POINTS)
+    elif resolution in RESOLUTIONS:
+        seconds = RESOLUTIONS[resolution]
+    else:
+        raise HTTPException(status_code=400, detail="الدقة يجب أن تكون 1m أو 1h أو 1d")
+
+    names = metrics.split(",") if metrics else list(METRICS)
+    if any(name not in METRICS for name in names):
+        raise HTTPException(status_code=400, detail=f"المقاييس المتاحة: {', '.join(METRICS)}")
+
+    rollups = (await db.scalars(
+        select(DeviceStatsRollup)
+        .where(
+            DeviceStatsRollup.device_id == device_id,
+            DeviceStatsRollup.resolution == seconds,
+            DeviceStatsRollup.metric.in_(names),
+            DeviceStatsRollup.bucket_start >= bucket_start(start, seconds),
+            DeviceStatsRollup.bucket_start < end
+        )
+        .order_by(DeviceStatsRollup.metric, DeviceStatsRollup.bucket_start)
+    )).all()
+
+    series = {name: [] for name in names}
+    for rollup in rollups:
+        series[rollup.metric].append(rollup_point(rollup))
+
+    return {
+        "device_id": device_id,
+        "resolution": resolution_name(seconds),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": series
+    }
+
+
 @app.get("/api/v1/stats/{device_id}")
 async def get_device_stats(
     device_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """الحصول على إحصائيات الجهاز"""
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    """الحصول على إحصائيات الجهاز
+
+    تُقدم آخر عينة من مخزن المقاييس في الذاكرة دون سؤال قاعدة البيانات إذا كانت أحدث
+    من METRICS_FRESH_SECONDS. وإلا (لا عينات لهذا العامل أو عينة قديمة قد تكون أحدث
+    منها وصلت لعامل آخر) يُقرأ آخر صف ويُقدم الأحدث منهما
+    """
+    device = await _get_device(db, device_id)
 
     if not device:
         raise HTTPException(status_code=404, detail="الجهاز غير موجود")
 
-    stats = db.query(DeviceStats).filter(
-        DeviceStats.device_id == device_id
-    ).order_by(DeviceStats.created_at.desc()).first()
+    stats = metrics_store.latest_if_fresh(device_id, settings.METRICS_FRESH_SECONDS)
+
+    if stats is None:
+        row = await db.scalar(
+            select(DeviceStats)
+            .where(DeviceStats.device_id == device_id)
+            .order_by(DeviceStats.created_at.desc())
+            .limit(1)
+        )
+        stats = metrics_store.latest_unless_newer(device_id, row.created_at if row else None)
+        if stats is None and row:
+            stats = vars(row)
 
     if not stats:
         return {
@@ -593,20 +1724,20 @@ async def get_device_stats(
 
     return {
         "battery": {
-            "level": stats.battery_level,
-            "status": stats.battery_status
+            "level": stats["battery_level"],
+            "status": stats["battery_status"]
         },
         "storage": {
-            "total": stats.storage_total,
-            "used": stats.storage_used
+            "total": stats["storage_total"],
+            "used": stats["storage_used"]
         },
         "network": {
-            "type": stats.network_type,
-            "speed": stats.network_speed
+            "type": stats["network_type"],
+            "speed": stats["network_speed"]
         },
         "memory": {
-            "total": stats.memory_total,
-            "used": stats.memory_used
+            "total": stats["memory_total"],
+            "used": stats["memory_used"]
         }
     }
 
@@ -0,0 +1,171 @@
+"""
+مخزن المقاييس الحديثة للأجهزة في الذاكرة
+لكل جهاز حلقة ثابتة الحجم من العينات في مصفوفات مضغوطة (array) بدلاً من كائنات ORM،
+فقراءة آخر قيمة O(1) والذاكرة محدودة لكل جهاز مهما طال التشغيل
+"""
+
+import math
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+
+# المقاييس الرقمية المخزنة في الحلقة
+FIELDS = (
+    "battery_level", "storage_total", "storage_used", "network_speed",
+    "memory_used", "memory_total", "cpu_usage"
+)
+
+# مقاييس عددية صحيحة في قاعدة البيانات (تُعاد كـ int)
+INT_FIELDS = ("battery_level",)
+
+# المقاييس النصية (تُحفظ آخر قيمة فقط)
+TEXT_FIELDS = ("battery_status", "network_type")
+
+EPOCH = datetime(1970, 1, 1)
+NAN = float("nan")
+
+
+class DeviceRing:
+    """حلقة عينات جهاز واحد: مصفوفة للأوقات ومصفوفة لكل مقياس"""
+
+    __slots__ = ("capacity", "head", "count", "times", "values", "last", "text")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.head = 0  # موضع الكتابة التالي
+        self.count = 0
+        self.times = array("d", bytes(8 * capacity))
+        self.values = {field: array("d", bytes(8 * capacity)) for field in FIELDS}
+        # آخر قيمة غير مفقودة لكل مقياس (الأجهزة قد ترسل عينات جزئية)
+        self.last: Dict[str, Optional[float]] = {field: None for field in FIELDS}
+        self.text: Dict[str, Optional[str]] = {field: None for field in TEXT_FIELDS}
+
+    def last_time(self) -> Optional[float]:
+        """وقت آخر عينة (ثوانٍ منذ 1970)"""
+        if not self.count:
+            return None
+        return self.times[(self.head - 1) % self.capacity]
+
+    def append(self, timestamp: float, sample: Dict):
+        """إضافة عينة بالكتابة فوق الأقدم عند امتلاء الحلقة"""
+        i = self.head
+        self.times[i] = timestamp
+        for field in FIELDS:
+            value = sample.get(field)
+            if value is None:
+                self.values[field][i] = NAN
+            else:
+                self.values[field][i] = self.last[field] = float(value)
+        for field in TEXT_FIELDS:
+            if sample.get(field) is not None:
+                self.text[field] = sample[field]
+
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def latest(self) -> Optional[Dict]:
+        """آخر عينة، والقيم المفقودة فيها من آخر عينة تحتويها (O(1))"""
+        if not self.count:
+            return None
+
+        result = {"created_at": datetime.utcfromtimestamp(self.last_time())}
+        for field in FIELDS:
+            value = self.last[field]
+            result[field] = int(value) if value is not None and field in INT_FIELDS else value
+        result.update(self.text)
+        return result
+
+    def window(self, field: str, since: float) -> List[Tuple[float, float]]:
+        """العينات منذ الوقت since من الأقدم إلى الأحدث (بدون القيم المفقودة)"""
+        points = []
+        values = self.values[field]
+        for back in range(1, self.count + 1):
+            i = (self.head - back) % self.capacity
+            if self.times[i] < since:
+                break
+            if not math.isnan(values[i]):
+                points.append((self.times[i], values[i]))
+        points.reverse()
+        return points
+
+
+class MetricsStore:
+    """حلقات المقاييس الحديثة لكل الأجهزة"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._rings: Dict[str, DeviceRing] = {}
+
+    @staticmethod
+    def _timestamp(value: datetime) -> float:
+        return (value - EPOCH).total_seconds()
+
+    def add(self, rows: Iterable[Dict]):
+        """إضافة عينات من مسار استقبال الإحصائيات
+
+        العينات الأقدم من آخر عينة في الحلقة تُتجاهل هنا (تبقى في قاعدة البيانات)
+        حتى تبقى الحلقة مرتبة زمنياً
+        """
+        for row in rows:
+            ring = self._rings.get(row["device_id"])
+            if ring is None:
+                ring = self._rings[row["device_id"]] = DeviceRing(self.capacity)
+
+            timestamp = self._timestamp(row["created_at"])
+            last = ring.last_time()
+            if last is not None and timestamp < last:
+                continue
+
+            ring.append(timestamp, row)
+
+    def latest(self, device_id: str) -> Optional[Dict]:
+        """آخر إحصائيات الجهاز أو None إذا لم تصل عينات منذ بدء التشغيل"""
+        ring = self._rings.get(device_id)
+        return ring.latest() if ring else None
+
+    def latest_if_fresh(self, device_id: str, max_age: float) -> Optional[Dict]:
+        """آخر عينة في الحلقة إذا وصلت خلال آخر max_age ثانية، وإلا None"""
+        ring = self._rings.get(device_id)
+        if ring is None or not ring.count:
+            return None
+        if ring.last_time() < self._timestamp(datetime.utcnow()) - max_age:
+            return None
+        return ring.latest()
+
+    def latest_unless_newer(self, device_id: str, newest_stored: Optional[datetime]) -> Optional[Dict]:
+        """آخر عينة في الحلقة، أو None إذا كانت قاعدة البيانات تحمل عينة أحدث
+
+        مع عدة عمال قد تصل عينات الجهاز لعامل آخر فتبقى حلقة هذا العامل قديمة؛
+        newest_stored هو أحدث created_at للجهاز في قاعدة البيانات
+        """
+        ring = self._rings.get(device_id)
+        if ring is None or not ring.count:
+            return None
+        if newest_stored is not None and ring.last_time() < self._timestamp(newest_stored):
+            return None
+        return ring.latest()
+
+    def window(self, device_id: str, field: str, seconds: float) -> List[Tuple[datetime, float]]:
+        """عينات مقياس خلال آخر seconds ثانية"""
+        ring = self._rings.get(device_id)
+        if ring is None:
+            return []
+
+        since = self._timestamp(datetime.utcnow()) - seconds
+        return [
+            (datetime.utcfromtimestamp(timestamp), value)
+            for timestamp, value in ring.window(field, since)
+        ]
+
+    def forget(self, device_id: str):
+        """حذف حلقة الجهاز (عند إلغاء الربط)"""
+        self._rings.pop(device_id, None)
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+
+# إنشاء كائن المخزن
+metrics_store = MetricsStore(settings.METRICS_RING_SIZE)
@@ -3,10 +3,16 @@
 يحتوي على جميع نماذج البيانات المستخدمة في المشروع
 """
 
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List
 from sqlalchemy import (
     create_engine,
+    event,
+    inspect,
+    text,
     Column,
     Integer,
     String,
@@ -14,9 +20,12 @@ from sqlalchemy import (
     DateTime,
     Text,
     ForeignKey,
+    Index,
     JSON,
-    Float
+    Float,
+    UniqueConstraint
 )
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.sql import func
@@ -77,6 +86,15 @@ class Device(Base):
 class Command(Base):
     """نموذج الأمر"""
     __tablename__ = "commands"
+    __table_args__ = (
+        Index("ix_commands_device_status", "device_id", "status"),
+        # فهرس جزئي صغير للأوامر المعلقة فقط (الاستطلاع والحجز)
+        Index(
+            "ix_commands_pending", "device_id",
+            sqlite_where=text("status = 'pending'"),
+            postgresql_where=text("status = 'pending'")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -87,6 +105,7 @@ class Command(Base):
     status = Column(String, default="pending")  # pending, processing, completed, failed
     result = Column(JSON, nullable=True)
     error_message = Column(Text, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)  # انتهاء حجز الأمر من قبل الجهاز
     created_at = Column(DateTime, default=func.now())
     completed_at = Column(DateTime, nullable=True)
 
@@ -126,6 +145,10 @@ class ScheduledTask(Base):
 class OperationLog(Base):
     """نموذج سجل العمليات"""
     __tablename__ = "operation_logs"
+    __table_args__ = (
+        Index("ix_operation_logs_user_created", "user_id", "created_at"),
+        Index("ix_operation_logs_user_type_created", "user_id", "operation_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -147,6 +170,9 @@ class OperationLog(Base):
 class AuthToken(Base):
     """نموذج رمز المصادقة"""
     __tablename__ = "auth_tokens"
+    __table_args__ = (
+        Index("ix_auth_tokens_user_device_used", "user_id", "device_id", "is_used"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -165,6 +191,9 @@ class AuthToken(Base):
 class DeviceStats(Base):
     """نموذج إحصائيات الجهاز"""
     __tablename__ = "device_stats"
+    __table_args__ = (
+        Index("ix_device_stats_device_created", "device_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String, ForeignKey("devices.device_id"), nullable=False)
@@ -183,17 +212,179 @@ class DeviceStats(Base):
         return f"<DeviceStats {self.id}>"
 
 
+class DeviceStatsRollup(Base):
+    """نموذج تجميع إحصائيات الجهاز لمقياس واحد خلال فترة (دقيقة، ساعة، يوم)"""
+    __tablename__ = "device_stats_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "device_id", "resolution", "metric", "bucket_start",
+            name="uq_device_stats_rollups_bucket"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, ForeignKey("devices.device_id"), nullable=False)
+    resolution = Column(Integer, nullable=False)  # طول الفترة بالثواني
+    metric = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    sum_value = Column(Float, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<DeviceStatsRollup {self.device_id} {self.metric} {self.bucket_start}>"
+
+
+class UploadSession(Base):
+    """نموذج جلسة رفع مجزأ قابلة للاستئناف"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)  # معرف عشوائي يُعطى للجهاز
+    device_id = Column(String, ForeignKey("devices.device_id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    path = Column(String, nullable=True)  # المسار على الجهاز
+    total_size = Column(Integer, nullable=False)
+    received = Column(Integer, default=0)
+    sha256 = Column(String, nullable=True)  # البصمة المتوقعة (اختياري)
+    expires_at = Column(DateTime, nullable=True, index=True)  # يُمدد مع كل دفعة مستلمة
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<UploadSession {self.id}>"
+
+
+class StoredFile(Base):
+    """نموذج ملف مخزن لجهاز، يشير إلى محتوى في مخزن الكتل حسب SHA-256"""
+    __tablename__ = "stored_files"
+    __table_args__ = (
+        Index("ix_stored_files_device_created", "device_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, ForeignKey("devices.device_id"), nullable=False)
+    filename = Column(String, nullable=False)
+    path = Column(String, nullable=True)  # المسار على الجهاز
+    sha256 = Column(String, nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"<StoredFile {self.id} - {self.filename}>"
+
+
+def _sqlite_pragmas() -> dict:
+    """إعدادات PRAGMA لملف التخزين الإنتاجي لـ SQLite"""
+    return {
+        # يسري على قواعد البيانات الجديدة فقط (القائمة تحتاج VACUUM كامل مرة واحدة)
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+        "temp_store": "MEMORY",
+    }
+
+
+def _apply_sqlite_pragmas(sync_engine):
+    """تطبيق إعدادات PRAGMA على كل اتصال جديد"""
+    pragmas = _sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _engine_options(url: str, profile: str) -> dict:
+    """خيارات المحرك حسب نوع قاعدة البيانات وملف التخزين"""
+    options = {"echo": settings.DEBUG}
+    in_memory = url.rstrip("/").endswith(":memory:") or url.rstrip("/").endswith("sqlite:")
+
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+
+    if profile == "production" and not in_memory:
+        # عدة قراء متزامنين؛ الكتابة في SQLite تُسلسل عبر busy_timeout
+        options["pool_size"] = settings.DB_POOL_SIZE
+        options["max_overflow"] = settings.DB_MAX_OVERFLOW
+
+    return options
+
+
+def create_db_engine(url: str, profile: Optional[str] = None):
+    """إنشاء محرك قاعدة البيانات المتزامن حسب ملف التخزين (default أو production)"""
+    profile = profile or settings.DATABASE_PROFILE
+    db_engine = create_engine(url, **_engine_options(url, profile))
+
+    if profile == "production" and db_engine.dialect.name == "sqlite":
+        _apply_sqlite_pragmas(db_engine)
+
+    return db_engine
+
+
+def create_async_db_engine(url: str, profile: Optional[str] = None):
+    """إنشاء محرك قاعدة البيانات غير المتزامن حسب ملف التخزين"""
+    profile = profile or settings.DATABASE_PROFILE
+    options = _engine_options(url, profile)
+    options.pop("connect_args", None)
+    db_engine = create_async_engine(url, **options)
+
+    if profile == "production" and db_engine.dialect.name == "sqlite":
+        _apply_sqlite_pragmas(db_engine.sync_engine)
+
+    return db_engine
+
+
 # إنشاء محرك قاعدة البيانات
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
-    echo=settings.DEBUG
-)
+engine = create_db_engine(settings.DATABASE_URL)
 
 # إنشاء Session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _async_database_url(url: str) -> str:
+    """تحويل عنوان قاعدة البيانات إلى المشغل غير المتزامن المقابل"""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+
+    drivers = {
+        "sqlite://": "sqlite+aiosqlite://",
+        "postgresql://": "postgresql+asyncpg://",
+        "mysql://": "mysql+aiomysql://",
+    }
+    for prefix, async_prefix in drivers.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+
+    return url
+
+
+# محرك وجلسات قاعدة البيانات غير المتزامنة (لمعالجات FastAPI)
+async_engine = create_async_db_engine(_async_database_url(settings.DATABASE_URL))
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# مجمع خيوط محدود للعمليات المتزامنة على قاعدة البيانات خارج حلقة الأحداث
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_THREAD_POOL_SIZE,
+    thread_name_prefix="db"
+)
+
+
 def get_db():
     """الحصول على جلسة قاعدة البيانات"""
     db = SessionLocal()
@@ -203,6 +394,54 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """الحصول على جلسة قاعدة البيانات غير المتزامنة"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_in_db_thread(func, *args, **kwargs):
+    """تشغيل دالة متزامنة تستخدم قاعدة البيانات في مجمع الخيوط المحدود"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        db_executor, functools.partial(func, *args, **kwargs)
+    )
+
+
 def init_db():
     """إنشاء جميع الجداول"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _create_missing_indexes()
+
+
+def _add_missing_columns():
+    """إضافة الأعمدة الجديدة القابلة للإفراغ إلى الجداول الموجودة مسبقاً
+
+    create_all لا يعدل الجداول الموجودة، لذا تُضاف الأعمدة الجديدة هنا
+    حتى تعمل قواعد البيانات القديمة دون ترحيل يدوي
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                ))
+
+
+def _create_missing_indexes():
+    """إنشاء الفهارس المعرفة على النماذج إذا لم تكن موجودة في قاعدة بيانات قائمة"""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
@@ -0,0 +1,214 @@
+"""
+متتبع حضور الأجهزة
+يسجل إشارات الحياة في الذاكرة ويكتبها إلى جدول devices دفعة واحدة بشكل دوري،
+ويعلّم الأجهزة التي انقطعت إشاراتها كغير متصلة.
+مع عدة عمليات (PRESENCE_REDIS) تُنشر إشارات كل عملية في مجموعة مرتبة في Redis
+عند كل تفريغ وتُقرأ منها إشارات البقية، فيرى كل عامل الجهاز المتصل بعامل آخر
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import case, update
+
+from config import settings
+from models import Device, SessionLocal, run_in_db_thread
+
+# عدد الأجهزة في عبارة UPDATE الواحدة
+UPDATE_CHUNK_SIZE = 500
+
+# مجموعة Redis المرتبة: device_id -> آخر ظهور (ثوانٍ منذ 1970)
+REDIS_KEY = "presence"
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class PresenceTracker:
+    """خريطة device_id -> last_seen في الذاكرة مع تفريغ دوري لقاعدة البيانات"""
+
+    def __init__(self, flush_interval: float, offline_after: float, redis_client=None):
+        self.flush_interval = flush_interval
+        self.offline_after = timedelta(seconds=offline_after)
+        self.redis = redis_client
+        self._last_seen: Dict[str, datetime] = {}
+        self._dirty: Set[str] = set()
+        self._forgotten: Set[str] = set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, device_id: str, when: Optional[datetime] = None):
+        """تسجيل إشارة حياة للجهاز"""
+        self._last_seen[device_id] = when or datetime.utcnow()
+        self._dirty.add(device_id)
+
+    def forget(self, device_id: str):
+        """إزالة الجهاز من المتتبع (عند إلغاء الربط)"""
+        self._last_seen.pop(device_id, None)
+        self._dirty.discard(device_id)
+        if self.redis is not None:
+            self._forgotten.add(device_id)
+
+    def knows(self, device_id: str) -> bool:
+        """هل الجهاز مسجل حالياً في الذاكرة"""
+        return device_id in self._last_seen
+
+    def last_seen(self, device_id: str) -> Optional[datetime]:
+        """آخر ظهور للجهاز حسب الذاكرة"""
+        return self._last_seen.get(device_id)
+
+    def is_online(self, device_id: str) -> bool:
+        """هل الجهاز متصل (أرسل إشارة حياة خلال مهلة الانقطاع)
+
+        مع Redis تصل إشارات العمليات الأخرى بتأخير لا يتجاوز flush_interval
+        """
+        seen = self._last_seen.get(device_id)
+        return seen is not None and datetime.utcnow() - seen < self.offline_after
+
+    def load(self):
+        """تحميل الأجهزة المتصلة من قاعدة البيانات عند بدء التشغيل"""
+        cutoff = datetime.utcnow() - self.offline_after
+        db = SessionLocal()
+        try:
+            rows = db.query(Device.device_id, Device.last_seen).filter(
+                Device.is_online == True,
+                Device.last_seen >= cutoff
+            ).all()
+        finally:
+            db.close()
+
+        for device_id, last_seen in rows:
+            self._last_seen.setdefault(device_id, last_seen)
+
+    async def flush(self) -> int:
+        """كتابة إشارات الحياة المتراكمة وتعليم الأجهزة المنقطعة كغير متصلة"""
+        async with self._lock:
+            cutoff = datetime.utcnow() - self.offline_after
+            dirty = [(device_id, self._last_seen[device_id])
+                     for device_id in self._dirty if device_id in self._last_seen]
+            self._dirty = set()
+
+            if self.redis is not None:
+                await self._sync_redis(dirty, cutoff)
+
+            try:
+                await run_in_db_thread(self._write, dirty, cutoff)
+            except Exception as e:
+                self._dirty.update(device_id for device_id, _ in dirty)
+                print(f"⚠️ فشل تفريغ حضور الأجهزة: {e}")
+                return 0
+
+            # الأجهزة المنقطعة لم تعد بحاجة للبقاء في الذاكرة
+            for device_id, seen in list(self._last_seen.items()):
+                if seen < cutoff and device_id not in self._dirty:
+                    del self._last_seen[device_id]
+
+            return len(dirty)
+
+    async def _sync_redis(self, dirty: List[Tuple[str, datetime]], cutoff: datetime):
+        """نشر إشارات هذه العملية في Redis ودمج إشارات العمليات الأخرى في الذاكرة"""
+        forgotten, self._forgotten = self._forgotten, set()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if dirty:
+                    # GT: لا تُستبدل إشارة أحدث سجلتها عملية أخرى
+                    pipe.zadd(
+                        REDIS_KEY, {device_id: _timestamp(seen) for device_id, seen in dirty}, gt=True
+                    )
+                if forgotten:
+                    pipe.zrem(REDIS_KEY, *forgotten)
+                pipe.zremrangebyscore(REDIS_KEY, "-inf", _timestamp(cutoff))
+                pipe.zrangebyscore(REDIS_KEY, _timestamp(cutoff), "+inf", withscores=True)
+                online = (await pipe.execute())[-1]
+        except Exception as e:
+            self._forgotten |= forgotten
+            print(f"⚠️ فشل مزامنة الحضور مع Redis: {e}")
+            return
+
+        for device_id, score in online:
+            seen = EPOCH + timedelta(seconds=score)
+            if device_id not in self._last_seen or self._last_seen[device_id] < seen:
+                self._last_seen[device_id] = seen
+
+    @staticmethod
+    def _write(dirty: List[Tuple[str, datetime]], cutoff: datetime):
+        """UPDATE مجمّع لآخر ظهور، ثم تعليم الأجهزة المنقطعة كغير متصلة"""
+        db = SessionLocal()
+        try:
+            for start in range(0, len(dirty), UPDATE_CHUNK_SIZE):
+                chunk = dict(dirty[start:start + UPDATE_CHUNK_SIZE])
+                db.execute(
+                    update(Device)
+                    .where(Device.device_id.in_(chunk.keys()))
+                    .values(
+                        last_seen=case(chunk, value=Device.device_id),
+                        is_online=True
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+
+            db.execute(
+                update(Device)
+                .where(Device.is_online == True, Device.last_seen < cutoff)
+                .values(is_online=False)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def start(self):
+        """بدء مهمة التفريغ الدوري في الخلفية"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف مهمة التفريغ وكتابة ما تبقى"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+        if self.redis is not None:
+            await self.redis.close()
+
+    async def _run(self):
+        """حلقة التفريغ الدوري"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def _timestamp(value: datetime) -> float:
+    return (value - EPOCH).total_seconds()
+
+
+def _redis_client():
+    """عميل Redis لمشاركة الحضور بين العمليات إذا كان مفعلاً"""
+    if not settings.PRESENCE_REDIS:
+        return None
+
+    import redis.asyncio as redis
+
+    return redis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        decode_responses=True
+    )
+
+
+# إنشاء كائن المتتبع
+presence = PresenceTracker(
+    settings.PRESENCE_FLUSH_INTERVAL,
+    settings.PRESENCE_OFFLINE_AFTER,
+    redis_client=_redis_client()
+)
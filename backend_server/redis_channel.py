@@ -0,0 +1,75 @@
+"""
+اشتراك دائم في قناة Redis (pub/sub) لكل عملية
+يُستخدم لبث الأحداث بين العمال: كل رسالة منشورة تصل لكل عملية مشتركة،
+بخلاف القوائم (BLPOP) التي يأخذ عنصرها منتظر واحد فقط.
+عند انقطاع الاتصال يُعاد الاشتراك تلقائياً، وتبلغ on_subscribe بكل اشتراك جديد
+حتى يعيد المستخدم ضبط أي حالة ربما فاتته رسائلها أثناء الانقطاع
+"""
+
+import asyncio
+from typing import Callable, Optional
+
+# مهلة إعادة المحاولة بعد فشل الاشتراك أو انقطاعه
+RETRY_DELAY = 1.0
+
+
+class RedisSubscriber:
+    """مهمة خلفية تستدعي on_message(data) لكل رسالة على القناة"""
+
+    def __init__(
+        self,
+        client,
+        channel: str,
+        on_message: Callable[[str], None],
+        on_subscribe: Optional[Callable[[], None]] = None,
+        retry_delay: float = RETRY_DELAY
+    ):
+        self.redis = client
+        self.channel = channel
+        self.on_message = on_message
+        self.on_subscribe = on_subscribe
+        self.retry_delay = retry_delay
+        # True فقط بعد تأكيد Redis للاشتراك وحتى انقطاعه
+        self.live = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """بدء الاشتراك في الخلفية"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إلغاء الاشتراك"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """حلقة الاشتراك مع إعادة الاتصال"""
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        self.live = True
+                        if self.on_subscribe is not None:
+                            self.on_subscribe()
+                    elif message["type"] == "message":
+                        self.on_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ انقطع الاشتراك في قناة Redis {self.channel}: {e}")
+            finally:
+                self.live = False
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+            await asyncio.sleep(self.retry_delay)
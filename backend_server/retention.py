@@ -0,0 +1,312 @@
+"""
+محرك الاحتفاظ بالبيانات
+يحذف الصفوف القديمة من commands و operation_logs و device_stats و auth_tokens
+حسب سياسة لكل جدول (العمر، والحد الأقصى للصفوف لكل جهاز) على دفعات صغيرة
+بمعاملة مستقلة لكل دفعة، مع أرشفة اختيارية بملفات NDJSON مضغوطة و VACUUM تدريجي.
+معطل افتراضياً (RETENTION_ENABLED)، ومع عدة عمال ينفذه فقط العامل الذي يحمل قفل
+RETENTION_LOCK_FILE
+"""
+
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from bot_service import LeaderLock
+from config import settings
+from models import (
+    AuthToken, Command, DeviceStats, DeviceStatsRollup, OperationLog,
+    SessionLocal, engine, run_in_db_thread
+)
+
+# مهلة بين الدفعات لإتاحة قفل الكتابة لبقية العمليات
+BATCH_PAUSE = 0.05
+
+
+class RetentionPolicy:
+    """سياسة احتفاظ لجدول: شرط انتهاء الصلاحية، وحد أقصى للصفوف لكل جهاز"""
+
+    def __init__(
+        self,
+        name: str,
+        model,
+        expired: Optional[Callable[[datetime], object]] = None,
+        max_per_device: int = 0,
+        device_column=None,
+        deletable=None,
+        before_delete: Optional[Callable[[Session, List[int]], None]] = None
+    ):
+        self.name = name
+        self.model = model
+        self.expired = expired  # دالة (الآن) -> شرط SQL للصفوف المنتهية
+        self.max_per_device = max_per_device
+        self.device_column = device_column
+        self.deletable = deletable  # شرط الصفوف القابلة للحذف عند تطبيق الحد الأقصى
+        self.before_delete = before_delete
+
+
+def _detach_command_logs(db: Session, ids: List[int]):
+    """فك ارتباط السجلات بالأوامر المحذوفة (السجلات تُحفظ مدة أطول)"""
+    db.execute(
+        update(OperationLog)
+        .where(OperationLog.command_id.in_(ids))
+        .values(command_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _days(days: int) -> Optional[Callable[[datetime], datetime]]:
+    """حد العمر بالأيام (None إذا كانت القيمة 0 أي بلا حد)"""
+    if not days:
+        return None
+    return lambda now: now - timedelta(days=days)
+
+
+def default_policies() -> List[RetentionPolicy]:
+    """سياسات الاحتفاظ من الإعدادات (القيمة 0 تعطل الحد)"""
+    finished = Command.status.in_(("completed", "failed"))
+    commands_age = _days(settings.RETENTION_COMMANDS_DAYS)
+    logs_age = _days(settings.RETENTION_LOGS_DAYS)
+    stats_age = _days(settings.RETENTION_STATS_DAYS)
+    minute_age = _days(settings.RETENTION_ROLLUP_MINUTE_DAYS)
+    hour_age = _days(settings.RETENTION_ROLLUP_HOUR_DAYS)
+    token_hours = settings.RETENTION_AUTH_TOKENS_HOURS
+
+    return [
+        RetentionPolicy(
+            "commands", Command,
+            expired=commands_age and (
+                lambda now: and_(finished, Command.created_at < commands_age(now))
+            ),
+            max_per_device=settings.RETENTION_COMMANDS_MAX_PER_DEVICE,
+            device_column=Command.device_id,
+            deletable=finished,
+            before_delete=_detach_command_logs
+        ),
+        RetentionPolicy(
+            "operation_logs", OperationLog,
+            expired=logs_age and (lambda now: OperationLog.created_at < logs_age(now))
+        ),
+        RetentionPolicy(
+            "device_stats", DeviceStats,
+            expired=stats_age and (lambda now: DeviceStats.created_at < stats_age(now)),
+            max_per_device=settings.RETENTION_STATS_MAX_PER_DEVICE,
+            device_column=DeviceStats.device_id
+        ),
+        RetentionPolicy(
+            "device_stats_rollups", DeviceStatsRollup,
+            expired=(minute_age or hour_age) and (lambda now: or_(
+                and_(DeviceStatsRollup.resolution == 60,
+                     DeviceStatsRollup.bucket_start < minute_age(now)) if minute_age else False,
+                and_(DeviceStatsRollup.resolution == 3600,
+                     DeviceStatsRollup.bucket_start < hour_age(now)) if hour_age else False
+            ))
+        ),
+        RetentionPolicy(
+            # رموز OTP المنتهية والرموز المستخدمة بعد مهلة
+            "auth_tokens", AuthToken,
+            expired=token_hours and (lambda now: and_(
+                AuthToken.created_at < now - timedelta(hours=token_hours),
+                or_(
+                    AuthToken.is_used == True,
+                    AuthToken.otp_expires_at < now,
+                    AuthToken.expires_at < now
+                )
+            ))
+        ),
+    ]
+
+
+class RetentionEngine:
+    """تنفيذ سياسات الاحتفاظ دورياً في الخلفية"""
+
+    def __init__(
+        self,
+        policies: List[RetentionPolicy],
+        interval: float,
+        batch_size: int,
+        archive_dir: str = "",
+        vacuum_pages: int = 0,
+        lock_path: str = ""
+    ):
+        self.policies = policies
+        self.interval = interval
+        self.batch_size = batch_size
+        self.archive_dir = archive_dir
+        self.vacuum_pages = vacuum_pages
+        # قفل ملف بين العمليات: عامل واحد فقط ينفذ الحذف الدوري
+        self.leader = LeaderLock(lock_path) if lock_path else None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> Dict[str, int]:
+        """تنفيذ كل السياسات مرة واحدة وإرجاع عدد الصفوف المحذوفة لكل جدول"""
+        async with self._lock:
+            now = datetime.utcnow()
+            report: Dict[str, int] = {}
+
+            for policy in self.policies:
+                deleted = 0
+
+                if policy.expired is not None:
+                    deleted += await self._purge(policy, policy.expired(now))
+
+                if policy.max_per_device:
+                    table = policy.model.__table__
+                    for device_id, cutoff_id in await run_in_db_thread(self._over_limit, policy):
+                        condition = and_(
+                            policy.device_column == device_id,
+                            table.c.id <= cutoff_id
+                        )
+                        if policy.deletable is not None:
+                            condition = and_(condition, policy.deletable)
+                        deleted += await self._purge(policy, condition)
+
+                report[policy.name] = deleted
+
+            if any(report.values()):
+                await run_in_db_thread(self._vacuum)
+
+            return report
+
+    async def _purge(self, policy: RetentionPolicy, condition) -> int:
+        """حذف الصفوف المطابقة على دفعات حتى تنتهي"""
+        total = 0
+        while True:
+            deleted = await run_in_db_thread(self._delete_batch, policy, condition)
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+            await asyncio.sleep(BATCH_PAUSE)
+
+    def _delete_batch(self, policy: RetentionPolicy, condition) -> int:
+        """حذف دفعة واحدة (مع أرشفتها إن لزم) في معاملة قصيرة"""
+        table = policy.model.__table__
+        db = SessionLocal()
+        try:
+            query = select(table).where(condition).order_by(table.c.id).limit(self.batch_size)
+
+            if self.archive_dir:
+                rows = db.execute(query).mappings().all()
+                ids = [row["id"] for row in rows]
+                if rows:
+                    self._archive(policy.name, rows)
+            else:
+                ids = db.scalars(query.with_only_columns(table.c.id)).all()
+
+            if not ids:
+                return 0
+
+            if policy.before_delete:
+                policy.before_delete(db, ids)
+
+            db.execute(delete(table).where(table.c.id.in_(ids)))
+            db.commit()
+            return len(ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _archive(self, name: str, rows):
+        """إلحاق الصفوف بملف NDJSON مضغوط لكل جدول ويوم"""
+        directory = os.path.join(self.archive_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{datetime.utcnow():%Y-%m-%d}.ndjson.gz")
+
+        with gzip.open(path, "at", encoding="utf-8") as out:
+            for row in rows:
+                out.write(json.dumps(dict(row), ensure_ascii=False, default=str) + "\n")
+
+    @staticmethod
+    def _over_limit(policy: RetentionPolicy) -> List[Tuple[str, int]]:
+        """الأجهزة التي تجاوزت الحد الأقصى، مع أكبر معرف يجب حذفه لكل منها"""
+        table = policy.model.__table__
+        db = SessionLocal()
+        try:
+            devices = db.execute(
+                select(policy.device_column)
+                .group_by(policy.device_column)
+                .having(func.count() > policy.max_per_device)
+            ).scalars().all()
+
+            result = []
+            for device_id in devices:
+                cutoff_id = db.scalar(
+                    select(table.c.id)
+                    .where(policy.device_column == device_id)
+                    .order_by(table.c.id.desc())
+                    .offset(policy.max_per_device)
+                    .limit(1)
+                )
+                if cutoff_id is not None:
+                    result.append((device_id, cutoff_id))
+            return result
+        finally:
+            db.close()
+
+    def _vacuum(self):
+        """إعادة الصفحات الفارغة لنظام الملفات تدريجياً (SQLite بوضع auto_vacuum=INCREMENTAL)"""
+        if engine.dialect.name != "sqlite" or not self.vacuum_pages:
+            return
+
+        with engine.connect() as conn:
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            if mode != 2:
+                # قاعدة بيانات أُنشئت قبل تفعيل الوضع التدريجي تحتاج VACUUM كامل مرة واحدة
+                return
+
+            # sqlite3 في Python ينفذ خطوة واحدة من incremental_vacuum(N) (صفحة واحدة)،
+            # لذا تُكرر العبارة بعدد الصفحات المطلوب تحريرها
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            for _ in range(min(free, self.vacuum_pages)):
+                conn.exec_driver_sql("PRAGMA incremental_vacuum(1)")
+            conn.commit()
+
+    def start(self):
+        """بدء مهمة الاحتفاظ الدورية في الخلفية"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف مهمة الاحتفاظ"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.leader is not None:
+            self.leader.release()
+
+    async def _run(self):
+        """حلقة التنفيذ الدوري (يتولاها عامل آخر إذا توقف العامل القائد)"""
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.leader is not None and not self.leader.acquire():
+                continue
+            try:
+                report = await self.run_once()
+                if any(report.values()):
+                    print(f"🧹 الاحتفاظ بالبيانات: {report}")
+            except Exception as e:
+                print(f"⚠️ فشل تنفيذ سياسات الاحتفاظ: {e}")
+
+
+# إنشاء كائن المحرك
+retention = RetentionEngine(
+    default_policies(),
+    interval=settings.RETENTION_INTERVAL,
+    batch_size=settings.RETENTION_BATCH_SIZE,
+    archive_dir=settings.RETENTION_ARCHIVE_DIR,
+    vacuum_pages=settings.RETENTION_VACUUM_PAGES,
+    lock_path=settings.RETENTION_LOCK_FILE
+)
@@ -0,0 +1,337 @@
+"""
+تعابير جدولة المهام (cron والفترات)
+تُترجم schedule_type/schedule_value مرة واحدة إلى جدول مُجمّع (حقول cron كأقنعة بتات)
+ويُحفظ في ذاكرة مؤقتة حسب نص التعبير، ثم يُحسب الموعد التالي بقفزات على البتات
+(شهر ثم يوم ثم ساعة ثم دقيقة) بدلاً من فحص الدقائق واحدة تلو الأخرى.
+المواعيد تُحسب بالتوقيت المحلي للمنطقة الزمنية (مع التوقيت الصيفي) وتُعاد بتوقيت UTC
+"""
+
+import calendar
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import settings
+
+# عدد التعابير المجمعة المحفوظة
+CACHE_SIZE = 4096
+
+# أقصى عدد سنوات للبحث عن موعد (تعبير مثل 30 فبراير لا يتحقق أبداً)
+MAX_YEARS = 8
+
+EPOCH = datetime(1970, 1, 1)
+
+# قناع حقل الساعات عندما يشمل كل الساعات
+ALL_HOURS = (1 << 24) - 1
+
+MONTH_NAMES = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+# أيام الأسبوع في cron تبدأ بالأحد = 0
+CRON_DAY_NAMES = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+# أيام الجدولة الأسبوعية تبدأ بالاثنين = 0 (كما في datetime.weekday)
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+
+def _next_bit(mask: int, start: int) -> int:
+    """أصغر بت مضبوط >= start في القناع، أو -1"""
+    rest = mask >> start
+    if not rest:
+        return -1
+    return start + (rest & -rest).bit_length() - 1
+
+
+def _parse_field(text: str, low: int, high: int, names: Tuple[str, ...] = ()) -> Tuple[int, bool]:
+    """تحويل حقل cron إلى قناع بتات، مع بيان ما إذا كان الحقل '*'"""
+    mask = 0
+    for part in text.lower().split(","):
+        range_part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step <= 0:
+            raise ValueError(part)
+
+        if range_part == "*":
+            start, end = low, high
+        else:
+            start_text, _, end_text = range_part.partition("-")
+            start = _field_value(start_text, names, low)
+            end = _field_value(end_text, names, low) if end_text else (high if step > 1 else start)
+
+        if not (low <= start <= high and low <= end <= high and start <= end):
+            raise ValueError(part)
+
+        for value in range(start, end + 1, step):
+            mask |= 1 << value
+
+    return mask, text == "*"
+
+
+def _field_value(text: str, names: Tuple[str, ...], low: int) -> int:
+    if text in names:
+        return names.index(text) + low
+    return int(text)
+
+
+class CronSchedule:
+    """تعبير cron مجمع: دقيقة ساعة يوم-الشهر شهر يوم-الأسبوع"""
+
+    __slots__ = (
+        "minutes", "hours", "days", "months", "weekdays", "day_rule", "tz", "utc", "_week_masks"
+    )
+
+    def __init__(self, expression: str, tz: ZoneInfo):
+        fields = MACROS.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"تعبير cron يجب أن يحتوي 5 حقول: {expression}")
+
+        self.minutes, _ = _parse_field(fields[0], 0, 59)
+        self.hours, _ = _parse_field(fields[1], 0, 23)
+        self.days, days_any = _parse_field(fields[2], 1, 31)
+        self.months, _ = _parse_field(fields[3], 1, 12, MONTH_NAMES)
+        weekdays, weekdays_any = _parse_field(fields[4], 0, 7, CRON_DAY_NAMES)
+        # 7 تعني الأحد أيضاً
+        self.weekdays = (weekdays | (weekdays >> 7)) & 0x7F
+        self.tz = tz
+        # بدون تحويلات بين المناطق الزمنية
+        self.utc = tz.key == "UTC"
+
+        # كما في cron: إذا قُيّد الحقلان يكفي تطابق أحدهما
+        if days_any and weekdays_any:
+            self.day_rule = "any"
+        elif weekdays_any:
+            self.day_rule = "days"
+        elif days_any:
+            self.day_rule = "weekdays"
+        else:
+            self.day_rule = "either"
+
+        # قناع أيام الشهر المطابقة ليوم الأسبوع، لكل يوم أسبوع ممكن لأول الشهر:
+        # تدوير بتات الأسبوع السبعة ثم تكرارها خمس مرات (35 يوماً تغطي أي شهر)
+        self._week_masks: List[int] = []
+        for first in range(7):
+            week = ((self.weekdays >> first) | (self.weekdays << (7 - first))) & 0x7F
+            self._week_masks.append(sum(week << (1 + 7 * i) for i in range(5)))
+
+    def _day_mask(self, year: int, month: int) -> int:
+        """أيام الشهر المطابقة (البت n = اليوم n)"""
+        first, length = calendar.monthrange(year, month)
+        valid = (1 << (length + 1)) - 2
+        week = self._week_masks[(first + 1) % 7]  # monthrange يبدأ بالاثنين = 0
+
+        if self.day_rule == "any":
+            return valid
+        if self.day_rule == "days":
+            return self.days & valid
+        if self.day_rule == "weekdays":
+            return week & valid
+        return (self.days | week) & valid
+
+    def _next_local(self, start: datetime) -> Optional[datetime]:
+        """أول وقت محلي (بدقة الدقيقة) >= start يطابق التعبير"""
+        year, month, day = start.year, start.month, start.day
+        hour, minute = start.hour, start.minute
+
+        while year <= start.year + MAX_YEARS:
+            found = _next_bit(self.months, month)
+            if found < 0:
+                year, month, day, hour, minute = year + 1, 1, 1, 0, 0
+                continue
+            if found != month:
+                month, day, hour, minute = found, 1, 0, 0
+
+            found = _next_bit(self._day_mask(year, month), day)
+            if found < 0:
+                month, day, hour, minute = month + 1, 1, 0, 0
+                continue
+            if found != day:
+                day, hour, minute = found, 0, 0
+
+            found = _next_bit(self.hours, hour)
+            if found < 0:
+                day, hour, minute = day + 1, 0, 0
+                continue
+            if found != hour:
+                hour, minute = found, 0
+
+            found = _next_bit(self.minutes, minute)
+            if found < 0:
+                hour, minute = hour + 1, 0
+                continue
+
+            return datetime(year, month, day, hour, found)
+
+        return None
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        """أول موعد بعد after (كلاهما UTC بدون منطقة زمنية)
+
+        كما في cron: الوقت المحلي غير الموجود (تقديم الساعة) يُنفذ بعد القفزة بنفس الفارق،
+        والوقت المكرر (تأخير الساعة) يُنفذ مرة واحدة إلا للتعابير التي تعمل كل ساعة
+        فتستمر خلال الساعة المكررة أيضاً
+        """
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        if self.utc:
+            return self._next_local(start)
+
+        local = after.replace(tzinfo=timezone.utc).astimezone(self.tz)
+        start = local.replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        run_at = self._first_after(after, start)
+
+        if run_at is None or self.hours != ALL_HOURS:
+            return run_at
+
+        # تأخرت الساعة بين after والموعد: مواعيد الساعة المكررة تسبقه بالتوقيت الحقيقي
+        offset = run_at.replace(tzinfo=timezone.utc).astimezone(self.tz).utcoffset()
+        if offset < local.utcoffset():
+            wall = self._next_local(
+                (after + offset).replace(second=0, microsecond=0) + timedelta(minutes=1)
+            )
+            if wall is not None:
+                repeated = wall - offset
+                if after < repeated < run_at and _to_local(repeated, self.tz) == wall:
+                    return repeated
+
+        return run_at
+
+    def _first_after(self, after: datetime, start: datetime) -> Optional[datetime]:
+        """أول وقت محلي مطابق >= start يقع بعد after، محولاً إلى UTC"""
+        for _ in range(3):
+            wall = self._next_local(start)
+            if wall is None:
+                return None
+
+            # fold=0: أول حدوث للوقت المكرر، وللوقت غير الموجود يُستخدم الفارق قبل القفزة
+            for fold in (0, 1):
+                run_at = _to_utc(wall.replace(tzinfo=self.tz, fold=fold))
+                if run_at > after:
+                    return run_at
+
+            start = wall + timedelta(minutes=1)
+
+        return None
+
+
+class IntervalSchedule:
+    """كل عدد ثوانٍ ثابت؛ المواعيد مضاعفات الفترة منذ 1970 فلا تنزاح"""
+
+    __slots__ = ("seconds",)
+
+    def __init__(self, seconds: int):
+        if seconds <= 0:
+            raise ValueError(seconds)
+        self.seconds = seconds
+
+    def next_after(self, after: datetime) -> datetime:
+        elapsed = int((after - EPOCH).total_seconds())
+        return EPOCH + timedelta(seconds=elapsed - elapsed % self.seconds + self.seconds)
+
+
+class OnceSchedule:
+    """موعد واحد"""
+
+    __slots__ = ("run_at",)
+
+    def __init__(self, run_at: datetime):
+        self.run_at = run_at
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        return self.run_at if self.run_at > after else None
+
+
+def _to_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _to_local(value: datetime, tz: ZoneInfo) -> datetime:
+    """الوقت المحلي (بدون منطقة زمنية) لوقت UTC"""
+    return value.replace(tzinfo=timezone.utc).astimezone(tz).replace(tzinfo=None)
+
+
+def _clock(value: str) -> Tuple[int, int]:
+    """تحليل الوقت HH:MM"""
+    hour, minute = (int(part) for part in value.split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(value)
+    return hour, minute
+
+
+def _zone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"منطقة زمنية غير معروفة: {name}")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_schedule(schedule_type: str, schedule_value: Optional[str]):
+    """ترجمة نوع الجدولة وقيمتها إلى جدول مجمع (محفوظ حسب النص)
+
+    - once: تاريخ ووقت ISO (بدون منطقة زمنية = المنطقة الافتراضية)
+    - interval: عدد الثواني
+    - hourly: الدقيقة من الساعة (MM)
+    - daily: HH:MM
+    - weekly: اليوم ثم الوقت، مثل "mon 09:30" أو "0 09:30" (الاثنين = 0)
+    - cron: تعبير cron من 5 حقول أو @daily وأمثاله
+
+    يمكن أن تبدأ القيمة بـ "TZ=Asia/Riyadh " لتحديد المنطقة الزمنية،
+    وإلا تُستخدم SCHEDULER_TIMEZONE
+
+    Raises:
+        ValueError: نوع أو قيمة جدولة غير صالحة
+    """
+    value = (schedule_value or "").strip()
+    zone_name = settings.SCHEDULER_TIMEZONE
+    if value.upper().startswith("TZ="):
+        zone_name, _, value = value[3:].partition(" ")
+        value = value.strip()
+    tz = _zone(zone_name)
+
+    if schedule_type == "once":
+        run_at = datetime.fromisoformat(value)
+        if run_at.tzinfo is None:
+            run_at = run_at.replace(tzinfo=tz)
+        return OnceSchedule(_to_utc(run_at))
+
+    if schedule_type == "interval":
+        return IntervalSchedule(int(value))
+
+    if schedule_type == "hourly":
+        minute = int(value or 0)
+        if not 0 <= minute < 60:
+            raise ValueError(value)
+        return CronSchedule(f"{minute} * * * *", tz)
+
+    if schedule_type == "daily":
+        hour, minute = _clock(value)
+        return CronSchedule(f"{minute} {hour} * * *", tz)
+
+    if schedule_type == "weekly":
+        day, clock = value.split()
+        day = int(day) if day.isdigit() else WEEKDAYS.index(day.lower()[:3])
+        if not 0 <= day < 7:
+            raise ValueError(value)
+        hour, minute = _clock(clock)
+        return CronSchedule(f"{minute} {hour} * * {(day + 1) % 7}", tz)
+
+    if schedule_type == "cron":
+        return CronSchedule(value, tz)
+
+    raise ValueError(f"نوع جدولة غير مدعوم: {schedule_type}")
+
+
+def next_run_after(schedule_type: str, schedule_value: Optional[str], after: datetime) -> Optional[datetime]:
+    """أول موعد بعد after (UTC بدون منطقة زمنية)، أو None إذا لم يعد للمهمة مواعيد
+
+    Raises:
+        ValueError: نوع أو قيمة جدولة غير صالحة
+    """
+    return compile_schedule(schedule_type, schedule_value).next_after(after)
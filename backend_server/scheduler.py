@@ -0,0 +1,248 @@
+"""
+منفذ المهام المجدولة
+يحمّل المهام النشطة في كومة صغرى (min-heap) مرتبة حسب next_run، وينام حتى أقرب موعد،
+ثم يحوّل كل مهمة مستحقة إلى أمر Command ويعيد جدولتها. الإنشاء والحذف يحدّثان
+الكومة مباشرة دون إعادة قراءة الجدول، فآلاف المهام لا تكلف شيئاً أثناء الانتظار
+"""
+
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from config import settings
+from command_queue import command_queue
+from models import Command, Device, ScheduledTask, SessionLocal, run_in_db_thread
+from schedule_expr import compile_schedule, next_run_after
+
+# أقصى عدد مهام تُنفذ في معاملة واحدة
+FIRE_BATCH_SIZE = 500
+
+
+class TaskScheduler:
+    """كومة صغرى من (next_run، معرف المهمة) مع حذف كسول للعناصر القديمة
+
+    _scheduled يحفظ الموعد الحالي لكل مهمة؛ العنصر في الكومة الذي لا يطابقه
+    (بعد إعادة جدولة أو إلغاء) يُتجاهل عند وصوله للقمة
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._scheduled: Dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"fired": 0, "skipped": 0}
+
+    def load(self):
+        """تحميل المهام النشطة عند بدء التشغيل (وحساب next_run للمهام التي ليس لها موعد)"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            tasks = db.scalars(
+                select(ScheduledTask).where(ScheduledTask.is_active == True)
+            ).all()
+
+            for task in tasks:
+                if task.next_run is None:
+                    try:
+                        task.next_run = next_run_after(task.schedule_type, task.schedule_value, now)
+                    except ValueError:
+                        task.next_run = None
+                    if task.next_run is None:
+                        task.is_active = False
+                        continue
+
+                self._scheduled[task.id] = task.next_run
+
+            db.commit()
+        finally:
+            db.close()
+
+        # المواعيد التي فاتت أثناء توقف الخادم تُنفذ مرة واحدة فور البدء
+        self._heap = [(run_at, task_id) for task_id, run_at in self._scheduled.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def schedule(self, task_id: int, run_at: Optional[datetime]):
+        """إضافة مهمة أو تغيير موعدها (None يلغيها)"""
+        if run_at is None:
+            self.cancel(task_id)
+            return
+
+        self._scheduled[task_id] = run_at
+        heapq.heappush(self._heap, (run_at, task_id))
+
+        # إيقاظ الحلقة فقط إذا أصبح هذا أقرب موعد
+        if self._heap[0] == (run_at, task_id):
+            self._wakeup.set()
+
+    def cancel(self, task_id: int):
+        """إلغاء جدولة مهمة (يُحذف عنصرها من الكومة عند وصوله للقمة)"""
+        self._scheduled.pop(task_id, None)
+
+    def _peek(self) -> Optional[Tuple[datetime, int]]:
+        """أقرب عنصر صالح في الكومة بعد حذف العناصر القديمة"""
+        while self._heap:
+            run_at, task_id = self._heap[0]
+            if self._scheduled.get(task_id) == run_at:
+                return run_at, task_id
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: datetime) -> Dict[int, datetime]:
+        """إخراج المهام المستحقة حتى now"""
+        due: Dict[int, datetime] = {}
+        while len(due) < FIRE_BATCH_SIZE:
+            top = self._peek()
+            if top is None or top[0] > now:
+                break
+            heapq.heappop(self._heap)
+            run_at, task_id = top
+            due[task_id] = self._scheduled.pop(task_id)
+        return due
+
+    def start(self):
+        """بدء حلقة التنفيذ في الخلفية"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف حلقة التنفيذ"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """النوم حتى أقرب موعد (أو حتى تُضاف مهمة أقرب) ثم تنفيذ المستحق"""
+        while True:
+            self._wakeup.clear()
+            top = self._peek()
+
+            if top is None:
+                await self._wakeup.wait()
+                continue
+
+            delay = (top[0] - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = self._pop_due(datetime.utcnow())
+            try:
+                results, skipped = await run_in_db_thread(self._fire, due)
+            except Exception as e:
+                print(f"⚠️ فشل تنفيذ المهام المجدولة: {e}")
+                # إعادة المحاولة لاحقاً بدلاً من فقدان المهام
+                retry_at = datetime.utcnow() + timedelta(seconds=settings.SCHEDULER_RETRY_DELAY)
+                for task_id in due:
+                    self.schedule(task_id, retry_at)
+                continue
+
+            # العدادات تُحدّث هنا في حلقة الأحداث لا في خيط قاعدة البيانات
+            self.counters["skipped"] += skipped
+            for task_id, run_at, device_id, command_id in results:
+                self.schedule(task_id, run_at)
+                if command_id is not None:
+                    self.counters["fired"] += 1
+                    await command_queue.publish(device_id, command_id)
+
+    @staticmethod
+    def _fire(
+        due: Dict[int, datetime]
+    ) -> Tuple[List[Tuple[int, Optional[datetime], Optional[str], Optional[int]]], int]:
+        """إنشاء أوامر المهام المستحقة وتحديث مواعيدها في معاملة واحدة (في خيط قاعدة البيانات)
+
+        التحديث مشروط بأن next_run لم يتغير منذ الجدولة، فلا تُنفذ المهمة مرتين
+        إذا شغلت عدة عمليات المنفذ نفسه أو عدّل طلب آخر المهمة
+
+        Returns:
+            قائمة (معرف المهمة، الموعد التالي أو None، device_id، معرف الأمر أو None)،
+            وعدد المهام المتخطاة
+        """
+        now = datetime.utcnow()
+        results = []
+        skipped = 0
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(ScheduledTask, Device.user_id, Device.device_id)
+                .join(Device, Device.id == ScheduledTask.device_id)
+                .where(ScheduledTask.id.in_(list(due)))
+            ).all()
+
+            created = []
+            for task, user_id, device_id in rows:
+                if not task.is_active or task.next_run != due[task.id]:
+                    # تغيرت المهمة خارج هذه العملية: مزامنة الموعد فقط
+                    skipped += 1
+                    results.append((task.id, task.next_run if task.is_active else None, None, None))
+                    continue
+
+                try:
+                    run_at = next_run_after(task.schedule_type, task.schedule_value, now)
+                except ValueError:
+                    run_at = None
+
+                claimed = db.execute(
+                    update(ScheduledTask)
+                    .where(
+                        ScheduledTask.id == task.id,
+                        ScheduledTask.next_run == due[task.id],
+                        ScheduledTask.is_active == True
+                    )
+                    .values(last_run=now, next_run=run_at, is_active=run_at is not None)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not claimed:
+                    skipped += 1
+                    continue
+
+                command = Command(
+                    user_id=user_id,
+                    device_id=task.device_id,
+                    command_type=task.command_type,
+                    action=task.action,
+                    parameters=task.parameters,
+                    status="pending"
+                )
+                db.add(command)
+                created.append((task.id, run_at, device_id, command))
+
+            db.flush()
+            created = [
+                (task_id, run_at, device_id, command.id)
+                for task_id, run_at, device_id, command in created
+            ]
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        # المهام المحذوفة لا تظهر في النتائج فتبقى خارج الكومة
+        return results + created, skipped
+
+    def stats(self) -> Dict:
+        top = self._peek()
+        cache = compile_schedule.cache_info()
+        return {
+            "scheduled": len(self._scheduled),
+            "next_run": top[0].isoformat() if top else None,
+            "compiled": cache.currsize,
+            "compile_cache_hits": cache.hits,
+            **self.counters
+        }
+
+
+# إنشاء كائن المنفذ
+scheduler = TaskScheduler()
@@ -0,0 +1,52 @@
+"""
+دمج الطلبات المتطابقة أثناء تنفيذها (single-flight)
+عندما يرسل عدد كبير من المستخدمين نفس النص في نفس اللحظة (زر مشترك أو رسالة جماعية)
+ينفذ أول طلب العمل الفعلي وينتظر الباقون نفس النتيجة بدلاً من طلب مستقل لكل رسالة
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """مهمة واحدة لكل مفتاح قيد التنفيذ، يشترك في نتيجتها كل من يطلب نفس المفتاح
+
+    - العمل يُنفذ في مهمة مستقلة وكل منتظر ينتظرها عبر shield، فإلغاء أي منتظر
+      (حتى أول من طلب) لا يلغي العمل على الباقين؛ ويكتمل العمل حتى لو أُلغي الجميع
+      فتُحفظ نتيجته في الذاكرة المؤقتة
+    - الاستثناء يصل لكل المنتظرين، ويبقى المفتاح محجوزاً بالفشل failure_ttl ثانية،
+      فموجة الطلبات التالية مباشرة تأخذ نفس الخطأ بدلاً من إعادة المحاولة جماعياً
+    """
+
+    def __init__(self, failure_ttl: float = 0.0):
+        self.failure_ttl = failure_ttl
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.counters = {"executed": 0, "shared": 0, "failed": 0}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """نتيجة func() للمفتاح، مشتركة مع الطلبات المتزامنة لنفس المفتاح"""
+        task = self._calls.get(key)
+        if task is not None:
+            self.counters["shared"] += 1
+        else:
+            self.counters["executed"] += 1
+            task = asyncio.get_running_loop().create_task(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["failed"] += 1
+            if self.failure_ttl > 0:
+                asyncio.get_running_loop().call_later(self.failure_ttl, self._forget, key, task)
+                return
+        self._forget(key, task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict:
+        return {"in_flight": sum(not task.done() for task in self._calls.values()), **self.counters}
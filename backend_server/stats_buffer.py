@@ -0,0 +1,128 @@
+"""
+مخزن مؤقت لإحصائيات الأجهزة
+يجمع العينات الواردة في الذاكرة ويكتبها إلى جدول device_stats
+بعمليات إدراج متعددة الصفوف بشكل دوري بدلاً من commit لكل عينة،
+ويحدّث جداول التجميع في نفس المعاملة.
+عند تعطل الكتابة تبقى العينات في المخزن حتى hard_limit فقط، وما زاد يُحذف من الأقدم
+ويُعد في dropped، فلا تنمو الذاكرة ولا حجم INSERT بلا حد
+"""
+
+import asyncio
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from config import settings
+from models import DeviceStats, SessionLocal, run_in_db_thread
+from stats_rollup import write_rollups
+
+# عدد الصفوف في عبارة INSERT الواحدة (للبقاء تحت حد متغيرات SQLite)
+INSERT_CHUNK_SIZE = 500
+
+
+class StatsBuffer:
+    """مخزن مؤقت لعينات DeviceStats مع تفريغ دوري أو عند الامتلاء"""
+
+    def __init__(self, max_size: int, flush_interval: float, hard_limit: int):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.hard_limit = max(hard_limit, max_size)
+        self.dropped = 0
+        self._rows: List[Dict] = []
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, rows: List[Dict]):
+        """إضافة عينات إلى المخزن وإيقاظ مهمة التفريغ عند الامتلاء"""
+        self._rows.extend(rows)
+        self._trim()
+        if len(self._rows) >= self.max_size:
+            self._wakeup.set()
+
+    def _trim(self) -> int:
+        """حذف أقدم العينات التي تتجاوز hard_limit وإرجاع عددها"""
+        excess = len(self._rows) - self.hard_limit
+        if excess <= 0:
+            return 0
+
+        del self._rows[:excess]
+        self.dropped += excess
+        return excess
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def stats(self) -> Dict:
+        return {"buffered": len(self._rows), "dropped": self.dropped}
+
+    async def flush(self) -> int:
+        """كتابة جميع العينات المخزنة إلى قاعدة البيانات وإرجاع عددها"""
+        async with self._lock:
+            if not self._rows:
+                return 0
+
+            rows, self._rows = self._rows, []
+
+            try:
+                await run_in_db_thread(self._write, rows)
+            except Exception as e:
+                # إعادة العينات للمخزن لمحاولة الكتابة في الدورة التالية (ضمن الحد الأقصى)
+                self._rows[:0] = rows
+                dropped = self._trim()
+                print(f"⚠️ فشل تفريغ إحصائيات الأجهزة: {e}"
+                      + (f" (حذف {dropped} عينة قديمة)" if dropped else ""))
+                return 0
+
+            return len(rows)
+
+    @staticmethod
+    def _write(rows: List[Dict]):
+        """إدراج الصفوف على دفعات متعددة الصفوف وتحديث التجميعات في معاملة واحدة"""
+        db = SessionLocal()
+        try:
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                db.execute(insert(DeviceStats).values(rows[start:start + INSERT_CHUNK_SIZE]))
+            write_rollups(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def start(self):
+        """بدء مهمة التفريغ الدوري في الخلفية"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف مهمة التفريغ وكتابة ما تبقى في المخزن"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+    async def _run(self):
+        """حلقة التفريغ: كل flush_interval ثانية أو فور امتلاء المخزن"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self.flush()
+
+
+# إنشاء كائن المخزن
+stats_buffer = StatsBuffer(
+    settings.STATS_BUFFER_MAX_SIZE,
+    settings.STATS_FLUSH_INTERVAL,
+    settings.STATS_BUFFER_HARD_LIMIT
+)
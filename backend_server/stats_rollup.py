@@ -0,0 +1,173 @@
+"""
+تجميع إحصائيات الأجهزة على فترات زمنية
+يحدّث جدول device_stats_rollups تدريجياً (min/max/avg/last لكل مقياس) بدقة
+دقيقة وساعة ويوم مع كل دفعة عينات، ويختار الدقة المناسبة لاستعلامات النطاق
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import Session
+
+from models import DeviceStatsRollup
+
+# دقات التجميع بالثواني من الأدق إلى الأخشن
+RESOLUTIONS: Dict[str, int] = {
+    "1m": 60,
+    "1h": 3600,
+    "1d": 86400,
+}
+
+# المقاييس الرقمية التي تُجمّع من عينات DeviceStats
+METRICS = ("battery_level", "storage_used", "memory_used", "cpu_usage", "network_speed")
+
+# عدد الصفوف في عبارة INSERT الواحدة
+UPSERT_CHUNK_SIZE = 500
+
+EPOCH = datetime(1970, 1, 1)
+
+RollupKey = Tuple[str, int, str, datetime]
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """تحويل الوقت إلى UTC بدون منطقة زمنية (كما يُخزن في قاعدة البيانات)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value: datetime, resolution: int) -> datetime:
+    """بداية الفترة التي يقع فيها الوقت"""
+    seconds = int((value - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def pick_resolution(start: datetime, end: datetime, max_points: int) -> int:
+    """أدق دقة لا يتجاوز فيها عدد الفترات max_points (وإلا الأخشن)"""
+    span = (end - start).total_seconds()
+    for resolution in RESOLUTIONS.values():
+        if span / resolution <= max_points:
+            return resolution
+    return max(RESOLUTIONS.values())
+
+
+def aggregate(rows: Iterable[Dict]) -> Dict[RollupKey, Dict]:
+    """تجميع دفعة عينات في الذاكرة حسب (الجهاز، الدقة، المقياس، بداية الفترة)"""
+    buckets: Dict[RollupKey, Dict] = {}
+
+    for row in rows:
+        created_at = to_naive_utc(row["created_at"])
+
+        for metric in METRICS:
+            value = row.get(metric)
+            if value is None:
+                continue
+            value = float(value)
+
+            for resolution in RESOLUTIONS.values():
+                key = (row["device_id"], resolution, metric, bucket_start(created_at, resolution))
+                agg = buckets.get(key)
+
+                if agg is None:
+                    buckets[key] = {
+                        "count": 1, "min_value": value, "max_value": value,
+                        "sum_value": value, "last_value": value, "last_at": created_at
+                    }
+                    continue
+
+                agg["count"] += 1
+                agg["min_value"] = min(agg["min_value"], value)
+                agg["max_value"] = max(agg["max_value"], value)
+                agg["sum_value"] += value
+                if created_at >= agg["last_at"]:
+                    agg["last_value"], agg["last_at"] = value, created_at
+
+    return buckets
+
+
+def write_rollups(db: Session, rows: List[Dict]):
+    """دمج دفعة عينات في جداول التجميع ضمن معاملة الجلسة الحالية (دون commit)"""
+    buckets = aggregate(rows)
+    if not buckets:
+        return
+
+    values = [
+        {
+            "device_id": device_id, "resolution": resolution,
+            "metric": metric, "bucket_start": start, **agg
+        }
+        for (device_id, resolution, metric, start), agg in buckets.items()
+    ]
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        least, greatest = func.min, func.max
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        least, greatest = func.least, func.greatest
+    else:
+        _merge(db, values)
+        return
+
+    table = DeviceStatsRollup.__table__
+    for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+        stmt = insert(table).values(values[start:start + UPSERT_CHUNK_SIZE])
+        new = stmt.excluded
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["device_id", "resolution", "metric", "bucket_start"],
+            set_={
+                "count": table.c.count + new.count,
+                "min_value": least(table.c.min_value, new.min_value),
+                "max_value": greatest(table.c.max_value, new.max_value),
+                "sum_value": table.c.sum_value + new.sum_value,
+                "last_value": case(
+                    (new.last_at >= table.c.last_at, new.last_value),
+                    else_=table.c.last_value
+                ),
+                "last_at": greatest(table.c.last_at, new.last_at),
+            }
+        ))
+
+
+def _merge(db: Session, values: List[Dict]):
+    """دمج بالقراءة ثم الكتابة لقواعد البيانات التي لا تدعم ON CONFLICT"""
+    for value in values:
+        rollup = db.query(DeviceStatsRollup).filter(and_(
+            DeviceStatsRollup.device_id == value["device_id"],
+            DeviceStatsRollup.resolution == value["resolution"],
+            DeviceStatsRollup.metric == value["metric"],
+            DeviceStatsRollup.bucket_start == value["bucket_start"]
+        )).with_for_update().first()
+
+        if rollup is None:
+            db.add(DeviceStatsRollup(**value))
+            continue
+
+        rollup.count += value["count"]
+        rollup.min_value = min(rollup.min_value, value["min_value"])
+        rollup.max_value = max(rollup.max_value, value["max_value"])
+        rollup.sum_value += value["sum_value"]
+        if value["last_at"] >= rollup.last_at:
+            rollup.last_value, rollup.last_at = value["last_value"], value["last_at"]
+
+
+def rollup_point(rollup: DeviceStatsRollup) -> Dict:
+    """تمثيل فترة تجميع واحدة في استجابة API"""
+    return {
+        "t": rollup.bucket_start.isoformat(),
+        "min": rollup.min_value,
+        "max": rollup.max_value,
+        "avg": rollup.sum_value / rollup.count,
+        "last": rollup.last_value,
+        "count": rollup.count
+    }
+
+
+def resolution_name(resolution: int) -> Optional[str]:
+    """اسم الدقة (1m/1h/1d) من عدد الثواني"""
+    for name, seconds in RESOLUTIONS.items():
+        if seconds == resolution:
+            return name
+    return None
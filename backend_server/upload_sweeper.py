@@ -0,0 +1,124 @@
+"""
+تنظيف جلسات الرفع المجزأ المهجورة
+الجهاز الذي يبدأ رفعاً ولا يكمله يترك صفاً في upload_sessions وملفاً جزئياً في
+مجلد incoming؛ هذه المهمة الدورية تحذف الجلسات المنتهية وملفاتها، وأي ملف جزئي
+يتيم (مثل بقايا رفع انقطع بتوقف الخادم) لم يُكتب فيه منذ UPLOAD_SESSION_TTL
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, delete, or_, select
+
+from config import settings
+from file_storage import blob_store
+from models import SessionLocal, UploadSession, run_in_db_thread
+
+# عدد الجلسات المحذوفة في كل معاملة
+BATCH_SIZE = 500
+
+
+def upload_expired(now: datetime, ttl: timedelta):
+    """شرط SQL للجلسات المنتهية (الجلسات القديمة بلا expires_at تُقاس بآخر تعديل)"""
+    return or_(
+        UploadSession.expires_at < now,
+        and_(UploadSession.expires_at.is_(None), UploadSession.updated_at < now - ttl)
+    )
+
+
+class UploadSweeper:
+    """حذف دوري لجلسات الرفع المنتهية وملفاتها الجزئية"""
+
+    def __init__(self, interval: float, ttl: float):
+        self.interval = interval
+        self.ttl = timedelta(seconds=ttl)
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep_once(self) -> int:
+        """حذف الجلسات المنتهية والملفات اليتيمة، وإرجاع عدد الملفات المحذوفة"""
+        removed = 0
+        while True:
+            expired = await run_in_db_thread(self._delete_batch)
+            for upload_id in expired:
+                removed += _remove(blob_store.incoming_path(upload_id))
+            if len(expired) < BATCH_SIZE:
+                break
+
+        return removed + await asyncio.to_thread(self._remove_stale_files)
+
+    def _delete_batch(self) -> List[str]:
+        """حذف دفعة من الجلسات المنتهية وإرجاع معرفاتها"""
+        db = SessionLocal()
+        try:
+            ids = db.scalars(
+                select(UploadSession.id)
+                .where(upload_expired(datetime.utcnow(), self.ttl))
+                .limit(BATCH_SIZE)
+            ).all()
+            if ids:
+                db.execute(delete(UploadSession).where(UploadSession.id.in_(ids)))
+                db.commit()
+            return list(ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _remove_stale_files(self) -> int:
+        """حذف الملفات الجزئية التي لم تُعدل منذ ttl (كل دفعة مستلمة تحدّث وقت التعديل)"""
+        cutoff = time.time() - self.ttl.total_seconds()
+        removed = 0
+        try:
+            entries = list(os.scandir(blob_store.incoming_dir))
+        except FileNotFoundError:
+            return 0
+
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    removed += _remove(entry.path)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def start(self):
+        """بدء مهمة التنظيف الدورية في الخلفية"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف مهمة التنظيف"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """حلقة التنظيف الدوري"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed = await self.sweep_once()
+                if removed:
+                    print(f"🧹 حذف {removed} ملف رفع غير مكتمل")
+            except Exception as e:
+                print(f"⚠️ فشل تنظيف جلسات الرفع: {e}")
+
+
+def _remove(path: str) -> int:
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
+
+
+# إنشاء كائن المنظف
+upload_sweeper = UploadSweeper(settings.UPLOAD_SWEEP_INTERVAL, settings.UPLOAD_SESSION_TTL)